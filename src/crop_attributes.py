@@ -0,0 +1,137 @@
+import json
+import os
+import re
+import threading
+
+import pandas as pd
+
+# ----------------- Agronomic Attributes -----------------
+# Typed columns pulled out of the description sections (Duration, Water/Sunlight/
+# Soil Requirements) once per description change, so crops can be filtered by
+# them without parsing text at query time. The table is saved as JSON next to
+# the data and reused while the descriptions are unchanged.
+
+ATTRIBUTE_COLUMNS = ["Crop Name", "Min Days", "Max Days", "Perennial", "Water Need", "Min Water (mm)",
+                     "Max Water (mm)", "Min Sun Hours", "Max Sun Hours", "Shade Tolerant", "Soil Types"]
+
+ATTRIBUTE_DTYPES = {"Min Days": "Int64", "Max Days": "Int64", "Perennial": "boolean",
+                    "Min Water (mm)": "Int64", "Max Water (mm)": "Int64",
+                    "Min Sun Hours": "Int64", "Max Sun Hours": "Int64", "Shade Tolerant": "boolean"}
+
+# Bump when the extraction rules change, so saved tables are rebuilt.
+EXTRACTION_VERSION = 1
+
+WATER_LEVELS = ["Low", "Medium", "High"]
+
+# Water need by the middle of the stated range (mm per season); above the last is High.
+WATER_LEVEL_LIMITS = ((500, "Low"), (1000, "Medium"))
+
+# Soil type -> pattern looked for in the first sentence of Soil Requirements
+# (later sentences tend to list soils to avoid).
+SOIL_TYPES = {
+    "Loam": re.compile(r"\bloam", re.IGNORECASE),
+    "Sandy": re.compile(r"\bsand", re.IGNORECASE),
+    "Clay": re.compile(r"\bclay", re.IGNORECASE),
+    "Black": re.compile(r"\bblack\b", re.IGNORECASE),
+    "Alluvial": re.compile(r"\balluvi", re.IGNORECASE),
+    "Red": re.compile(r"\bred\b", re.IGNORECASE),
+}
+
+DAYS_PER_UNIT = {"day": 1, "month": 30}
+
+# plural units only, so "15-20 day intervals" isn't read as a duration
+_DURATION = re.compile(r"(\d+)(?:\s*-\s*(\d+))?\s*(day|month)s\b", re.IGNORECASE)
+_WATER = re.compile(r"(\d+)(?:\s*-\s*(\d+))?\s*mm", re.IGNORECASE)
+_SUN_HOURS = re.compile(r"(\d+)(?:\s*-\s*(\d+))?\s*(?:hours|hrs)\b", re.IGNORECASE)
+_SHADE = re.compile(r"\bpartial\b|shade[- ]tolerant|filtered sun", re.IGNORECASE)
+_SENTENCE_END = re.compile(r"\.(?:\s|$)")
+
+
+def _ranges(pattern, text: str) -> list:
+    """[(low, high, match), ...] for every "N" or "N-M" the pattern finds."""
+    return [(int(m.group(1)), int(m.group(2) or m.group(1)), m) for m in pattern.finditer(text or "")]
+
+
+def _span(ranges: list) -> tuple:
+    if not ranges:
+        return None, None
+    return min(low for low, _, _ in ranges), max(high for _, high, _ in ranges)
+
+
+def water_level(min_mm, max_mm, text: str = "") -> str | None:
+    if min_mm is None:
+        lowered = (text or "").lower()
+        if "minimal" in lowered:
+            return "Low"
+        if any(word in lowered for word in ("frequent", "continuous", "weekly")):
+            return "Medium"
+        return None
+    middle = (min_mm + max_mm) / 2
+    for limit, level in WATER_LEVEL_LIMITS:
+        if middle <= limit:
+            return level
+    return "High"
+
+
+def extract_attributes(name: str, sections: dict) -> dict:
+    """One attribute row from a crop's parsed description sections."""
+    duration = sections.get("Duration", "")
+    days = [(low * DAYS_PER_UNIT[m.group(3).lower()], high * DAYS_PER_UNIT[m.group(3).lower()], m)
+            for low, high, m in _ranges(_DURATION, duration)]
+    min_days, max_days = _span(days)
+
+    water = sections.get("Water Requirements", "")
+    min_water, max_water = _span(_ranges(_WATER, water))
+
+    sunlight = sections.get("Sunlight Requirements", "")
+    min_sun, max_sun = _span(_ranges(_SUN_HOURS, sunlight))
+
+    soil = _SENTENCE_END.split(sections.get("Soil Requirements", ""), maxsplit=1)[0]
+
+    return {
+        "Crop Name": name,
+        "Min Days": min_days,
+        "Max Days": max_days,
+        "Perennial": not days and bool(re.search(r"perennial|years", duration, re.IGNORECASE)),
+        "Water Need": water_level(min_water, max_water, water),
+        "Min Water (mm)": min_water,
+        "Max Water (mm)": max_water,
+        "Min Sun Hours": min_sun,
+        "Max Sun Hours": max_sun,
+        "Shade Tolerant": bool(_SHADE.search(sunlight)),
+        "Soil Types": ", ".join(soil_type for soil_type, pattern in SOIL_TYPES.items() if pattern.search(soil)),
+    }
+
+
+def to_frame(rows: list) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=ATTRIBUTE_COLUMNS)
+    for col, dtype in ATTRIBUTE_DTYPES.items():
+        df[col] = df[col].astype(dtype)
+    df["Water Need"] = pd.Categorical(df["Water Need"], categories=WATER_LEVELS, ordered=True)
+    return df
+
+
+def build_attributes(documents) -> list:
+    """Attribute rows for `documents`, an iterable of (name, text, {section title: text})."""
+    return [extract_attributes(name, sections) for name, _, sections in documents]
+
+
+def load_or_build(path: str, fingerprint: str, documents) -> pd.DataFrame:
+    """The attribute table saved at `path` if it has `fingerprint`, else extracted from documents() and saved."""
+    fingerprint = f"{fingerprint}:{EXTRACTION_VERSION}"
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("fingerprint") == fingerprint:
+            return to_frame(saved["rows"])
+    except (OSError, ValueError, KeyError):
+        pass
+    rows = build_attributes(documents())
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "rows": rows}, f)
+        os.replace(tmp_path, path)
+    except OSError:  # read-only data dir: still usable, just rebuilt next start
+        pass
+    return to_frame(rows)
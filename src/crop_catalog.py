@@ -0,0 +1,343 @@
+import bisect
+import csv
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import crop_attributes
+from description_store import DESCRIPTION_CACHE_SIZE, DescriptionStore
+from name_index import RESOLVE_MIN_SCORE, NameIndex
+from search_index import SearchIndex
+from storage import DATA_DIR, load_crop_aliases, load_crop_profit, table_version
+
+# ----------------- Crop Catalog -----------------
+# crop_profit_data.csv, crop_details.csv and crop_aliases.csv loaded into an
+# immutable snapshot with lookup indexes, shared by main.py and frontend.py.
+# Descriptions themselves are read on demand through a DescriptionStore.
+# get_catalog() stats the tables on every call and swaps in a fresh snapshot
+# when any has changed, so edits made by any process reach every session
+# without a restart.
+
+CATALOG_TABLES = ("crop_profit", "crop_details", "crop_aliases")
+
+# The description search index is saved here and reused while the descriptions are unchanged.
+SEARCH_INDEX_JSON = os.path.join(DATA_DIR, "crop_search_index.json")
+
+# Attributes extracted from the descriptions, saved and reused the same way.
+ATTRIBUTES_JSON = os.path.join(DATA_DIR, "crop_attributes.json")
+
+logger = logging.getLogger(__name__)
+
+# What a reload of half-written or hand-edited tables can raise.
+RELOAD_ERRORS = (OSError, ValueError, KeyError, csv.Error, sqlite3.Error)
+
+# Distinct query() results remembered per catalog snapshot.
+QUERY_CACHE_SIZE = 256
+
+# Headings that split a crop description into sections.
+SECTION_KEYWORDS = (
+    "GROWING PROCESS:",
+    "WATER REQUIREMENTS:",
+    "SUNLIGHT REQUIREMENTS:",
+    "SOIL REQUIREMENTS:",
+    "DURATION:",
+    "FERTILIZER NEEDS:",
+)
+_SECTION_PATTERN = re.compile("|".join(re.escape(k) for k in SECTION_KEYWORDS))
+
+def parse_description(description) -> tuple:
+    """Split a description into (intro, {section title: text}) in a single pass.
+
+    Only the first occurrence of each heading starts a section; each section runs
+    to the next heading in the text.
+    """
+    if not description:
+        return "No description available.", {}
+    headings, seen = [], set()
+    for match in _SECTION_PATTERN.finditer(description):
+        if match.group() not in seen:
+            seen.add(match.group())
+            headings.append(match)
+    intro_end = headings[0].start() if headings else len(description)
+    sections = {}
+    for i, match in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(description)
+        sections[match.group().replace(":", "").title()] = description[match.end():end].strip()
+    return description[:intro_end].strip(), sections
+
+class CropCatalog:
+    """Crop profits, seasons and descriptions with O(1) name lookups and O(log n) profit ranges.
+
+    A snapshot is never modified after it is built; `version` identifies the table
+    versions it was built from and `generation` counts reloads in this process.
+    """
+
+    def __init__(self, profit: pd.DataFrame, descriptions: DescriptionStore, version=None, generation: int = 0,
+                 search_index_path: str | None = None, aliases: pd.DataFrame | None = None,
+                 attributes_path: str | None = None):
+        self.version = version
+        self.generation = generation
+        self.profit_data = profit.reset_index(drop=True)
+        self.records = tuple(self.profit_data.to_dict("records"))
+        self.names = tuple(str(r["Crop Name"]) for r in self.records)
+
+        # lower-cased name -> position in profit_data (first one wins, like a scan)
+        self._positions = {}
+        for pos, name in enumerate(self.names):
+            self._positions.setdefault(name.lower(), pos)
+
+        # typo-tolerant lookups over the names plus their local aliases
+        alias_map = {}
+        if aliases is not None:
+            for alias, name in zip(aliases["Alias"].tolist(), aliases["Crop Name"].tolist()):
+                if not pd.isna(alias) and not pd.isna(name):
+                    alias_map.setdefault(str(alias), str(name))
+        self.name_index = NameIndex(self.names, alias_map)
+
+        # descriptions stay on disk; the search index is only rebuilt (one pass over them) when they change
+        self.descriptions = descriptions
+        def documents():
+            return ((name, text, parse_description(text)[1]) for name, text in descriptions.items())
+        if search_index_path is None:
+            self.search_index = SearchIndex.from_documents(documents(), descriptions.fingerprint)
+        else:
+            self.search_index = SearchIndex.load_or_build(search_index_path, descriptions.fingerprint, documents)
+
+        # agronomic attributes, one row per profit row (same index), as arrays for vectorized filters
+        if attributes_path is None:
+            extracted = crop_attributes.to_frame(crop_attributes.build_attributes(documents()))
+        else:
+            extracted = crop_attributes.load_or_build(attributes_path, descriptions.fingerprint, documents)
+        extracted.index = extracted["Crop Name"].str.lower()
+        extracted = extracted[~extracted.index.duplicated()].drop(columns="Crop Name")
+        self.attributes = extracted.reindex([name.lower() for name in self.names]).reset_index(drop=True)
+        self.attributes.insert(0, "Crop Name", list(self.names))
+        self._max_days = self.attributes["Max Days"].to_numpy(dtype=float, na_value=np.nan)
+        self._min_sun = self.attributes["Min Sun Hours"].to_numpy(dtype=float, na_value=np.nan)
+        self._shade = self.attributes["Shade Tolerant"].to_numpy(dtype=bool, na_value=False)
+        self._water = self.attributes["Water Need"].astype(object).to_numpy()
+        self._soils = {soil: self.attributes["Soil Types"].fillna("").str.contains(soil, regex=False).to_numpy()
+                       for soil in crop_attributes.SOIL_TYPES}
+
+        # season -> positions, in file order, and the same as a mask
+        self._seasons = {}
+        for pos, record in enumerate(self.records):
+            if not pd.isna(record["Season"]):
+                self._seasons.setdefault(str(record["Season"]), []).append(pos)
+        self._season_masks = {season: self._mask_of(positions) for season, positions in self._seasons.items()}
+
+        # profits ascending, with the position each one came from, for bisect range queries
+        pairs = sorted((float(r["Profit Per Acre"]), pos) for pos, r in enumerate(self.records)
+                       if not pd.isna(r["Profit Per Acre"]))
+        self._profits = [profit for profit, _ in pairs]
+        self._profit_positions = np.array([pos for _, pos in pairs], dtype=np.intp)
+
+        # lower-cased names for substring matches
+        self._lower_names = np.array([name.lower() for name in self.names], dtype=str)
+
+        # lower-cased name -> parsed (intro, sections), most recently used last; bounded like the description cache
+        self._sections = OrderedDict()
+        self._sections_lock = threading.Lock()
+
+        # query spec -> positions, most recently used last
+        self._query_cache = OrderedDict()
+        self._query_lock = threading.Lock()
+        self.query_stats = {"hits": 0, "misses": 0}
+
+    @classmethod
+    def empty(cls) -> "CropCatalog":
+        return cls(pd.DataFrame(columns=["Crop Name", "Profit Per Acre", "Season"]),
+                   DescriptionStore.from_frame(pd.DataFrame(columns=["Crop Name", "Description"])))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __contains__(self, name) -> bool:
+        return str(name).lower() in self._positions
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.records
+
+    @property
+    def seasons(self) -> list:
+        return list(self._seasons)
+
+    def get(self, name) -> dict | None:
+        """The profit row for `name` (any case) as a dict, or None."""
+        pos = self._positions.get(str(name).lower())
+        return None if pos is None else dict(self.records[pos])
+
+    def resolve(self, text, min_score: float = RESOLVE_MIN_SCORE) -> str | None:
+        """The catalog name `text` means, allowing typos, spacing and local aliases; None if unsure."""
+        return self.name_index.resolve(text, min_score)
+
+    def suggest(self, text, limit: int = 5) -> list:
+        """Closest crop names to `text` as [{"Crop Name", "score", "matched"}], best first."""
+        return self.name_index.suggest(text, limit)
+
+    def description(self, name) -> str | None:
+        return self.descriptions.get(name)
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Crops whose name or description best match `query` (BM25), as [{"Crop Name", "score", "section"}]."""
+        return self.search_index.search(query, limit)
+
+    def sections(self, name) -> tuple | None:
+        """(intro, {section title: text}) for `name`'s description, or None if it has none.
+
+        Parsed once per snapshot; the last DESCRIPTION_CACHE_SIZE results are kept.
+        """
+        key = str(name).lower()
+        with self._sections_lock:
+            if key in self._sections:
+                self._sections.move_to_end(key)
+                return self._sections[key]
+        text = self.descriptions.get(name)
+        if text is None:
+            return None
+        parsed = parse_description(text)
+        if DESCRIPTION_CACHE_SIZE:
+            with self._sections_lock:
+                self._sections[key] = parsed
+                while len(self._sections) > DESCRIPTION_CACHE_SIZE:
+                    self._sections.popitem(last=False)
+        return parsed
+
+    def query(self, season: str | None = None, min_profit: float | None = None, max_profit: float | None = None,
+              name: str | None = None, max_days: int | None = None, water_need=None, soil: str | None = None,
+              sun_hours: float | None = None) -> tuple:
+        """Positions in profit_data of the crops matching every given condition, in catalog order.
+
+        name matches anywhere in the crop name (any case). max_days keeps crops that
+        finish within that many days, water_need is a level or list of levels
+        (Low/Medium/High), soil is one of crop_attributes.SOIL_TYPES and sun_hours keeps
+        crops that need no more sun than that (or tolerate shade). Results are cached
+        per snapshot, so repeating a query (e.g. a Streamlit rerun) is a dict lookup.
+        """
+        name = (name or "").strip().lower() or None
+        if isinstance(water_need, str):
+            water_need = (water_need,)
+        water_need = tuple(sorted(water_need)) if water_need else None
+        key = (season, min_profit, max_profit, name, max_days, water_need, soil or None, sun_hours)
+        with self._query_lock:
+            if key in self._query_cache:
+                self._query_cache.move_to_end(key)
+                self.query_stats["hits"] += 1
+                return self._query_cache[key]
+            self.query_stats["misses"] += 1
+
+        positions = tuple(np.flatnonzero(self._match(*key)).tolist())
+        with self._query_lock:
+            self._query_cache[key] = positions
+            while len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return positions
+
+    def rows(self, positions) -> pd.DataFrame:
+        """The profit rows at `positions` (as returned by query()), keeping their positions as the index."""
+        return self.profit_data.iloc[list(positions)]
+
+    def filter(self, season: str | None = None, min_profit: float | None = None,
+               max_profit: float | None = None, **conditions) -> pd.DataFrame:
+        """Profit rows matching every given condition, in catalog order; takes the same conditions as query()."""
+        return self.rows(self.query(season, min_profit, max_profit, **conditions))
+
+    def _mask_of(self, positions) -> np.ndarray:
+        mask = np.zeros(len(self.records), dtype=bool)
+        mask[list(positions)] = True
+        return mask
+
+    def _match(self, season, min_profit, max_profit, name, max_days, water_need, soil, sun_hours) -> np.ndarray:
+        mask = np.ones(len(self.records), dtype=bool)
+        if season is not None:
+            mask &= self._season_masks.get(season, False)
+        if min_profit is not None or max_profit is not None:
+            lo = 0 if min_profit is None else bisect.bisect_left(self._profits, min_profit)
+            hi = len(self._profits) if max_profit is None else bisect.bisect_right(self._profits, max_profit)
+            mask &= self._mask_of(self._profit_positions[lo:hi])
+        if name is not None:
+            mask &= np.char.find(self._lower_names, name) >= 0
+        if max_days is not None:
+            mask &= self._max_days <= max_days  # NaN (unknown or perennial) never matches
+        if water_need:
+            mask &= np.isin(self._water, list(water_need))
+        if soil is not None:
+            mask &= self._soils.get(soil, False)
+        if sun_hours is not None:
+            mask &= (self._min_sun <= sun_hours) | self._shade
+        return mask
+
+
+# The current snapshot. Readers just take this reference; a reload builds the next
+# snapshot on the side and replaces the reference in one assignment.
+_catalog = None
+_reload_lock = threading.Lock()
+_failed_version = None  # the tables' version when a reload last failed; retried once it changes
+
+def catalog_version() -> tuple | None:
+    try:
+        return tuple(table_version(table) for table in CATALOG_TABLES)
+    except OSError:  # a file is missing or being replaced; let the next load sort it out
+        return None
+
+def load_catalog() -> CropCatalog:
+    version = catalog_version()  # taken first, so a change during the load triggers another reload
+    generation = _catalog.generation + 1 if _catalog is not None else 0
+    return CropCatalog(load_crop_profit(), DescriptionStore.open(), version, generation, SEARCH_INDEX_JSON,
+                       load_crop_aliases(), ATTRIBUTES_JSON)
+
+def get_catalog() -> CropCatalog:
+    """The shared catalog, reloaded first if any of its tables changed since it was built.
+
+    Only one thread reloads at a time; the others keep using the current snapshot
+    instead of waiting. Only the very first load blocks. If a reload fails (say, a
+    file is half-edited by hand) it is logged and the current snapshot keeps being
+    served until the tables change again.
+    """
+    global _failed_version
+    catalog = _catalog
+    version = catalog_version()
+    if catalog is not None and catalog.version is not None and version == catalog.version:
+        return catalog
+    if catalog is not None and version is not None and version == _failed_version:
+        return catalog
+    if catalog is None:
+        with _reload_lock:
+            return _catalog if _catalog is not None else _reload()
+    if not _reload_lock.acquire(blocking=False):
+        return catalog
+    try:
+        return _reload()
+    except RELOAD_ERRORS:
+        logger.exception("Reloading the crop catalog failed; keeping the current snapshot")
+        _failed_version = version
+        return catalog
+    finally:
+        _reload_lock.release()
+
+def set_catalog(catalog: CropCatalog):
+    global _catalog
+    _catalog = catalog
+
+def _reload() -> CropCatalog:
+    catalog = load_catalog()
+    set_catalog(catalog)
+    return catalog
+
+def reload_catalog() -> CropCatalog:
+    """Re-read the tables and swap the new snapshot in for every caller.
+
+    Waits for a reload already under way, then skips its own if that one is current.
+    """
+    with _reload_lock:
+        catalog = _catalog
+        if catalog is not None and catalog.version is not None and catalog.version == catalog_version():
+            return catalog
+        return _reload()
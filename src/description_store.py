@@ -0,0 +1,199 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import storage
+
+# ----------------- Lazy Crop Descriptions -----------------
+# Crop descriptions are the bulk of the catalog's data but only a few are viewed
+# per session, so they stay on disk. With the CSV backend a sidecar index
+# (crop_details.csv.offsets) records where each crop's row starts and ends; a
+# description is then one seek and one small read. Other backends fetch a single
+# row with a filtered load. Recently read descriptions are kept in a small LRU.
+
+DESCRIPTION_CACHE_SIZE = int(os.environ.get("CROP_PORTAL_DESCRIPTION_CACHE", "64"))
+
+
+def _offsets_path(path: str) -> str:
+    return path + ".offsets"
+
+
+def _records(f):
+    """Yield (start, end, raw bytes) for each CSV record in a binary file, header included.
+
+    A record ends at a newline outside quotes; doubled quotes inside a field keep
+    the count even, so counting quote characters is enough.
+    """
+    start, chunk, quotes = f.tell(), [], 0
+    for line in iter(f.readline, b""):
+        chunk.append(line)
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            end = start + sum(len(part) for part in chunk)
+            yield start, end, b"".join(chunk)
+            start, chunk, quotes = end, [], 0
+
+
+def _parse_record(raw: bytes) -> list:
+    return next(csv.reader(io.StringIO(raw.decode("utf-8-sig"))), [])
+
+
+def build_offset_index(path: str) -> list:
+    """Scan a crop_details CSV once: [[crop name, start byte, end byte], ...], first row per name."""
+    entries, seen = [], set()
+    with open(path, "rb") as f:
+        records = _records(f)
+        next(records, None)  # header
+        for start, end, raw in records:
+            fields = _parse_record(raw)
+            name = fields[0].strip() if fields else ""
+            if name and name.lower() not in seen:
+                seen.add(name.lower())
+                entries.append([name, start, end])
+    return entries
+
+
+def load_offset_index(path: str) -> tuple:
+    """(signature, entries) for `path`, from its sidecar when it is current, else rebuilt and saved."""
+    signature = list(storage.file_signature(path))
+    sidecar = _offsets_path(path)
+    try:
+        with open(sidecar, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("signature") == signature:
+            return signature, saved["entries"]
+    except (OSError, ValueError, KeyError):
+        pass
+    entries = build_offset_index(path)
+    tmp_path = f"{sidecar}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"signature": signature, "entries": entries}, f)
+        os.replace(tmp_path, sidecar)
+    except OSError:  # read-only data dir: still usable, just rebuilt next start
+        pass
+    return signature, entries
+
+
+class DescriptionStore:
+    """Crop name -> description, read on demand. Names are known up front; text is fetched lazily."""
+
+    def __init__(self, names: list, fetch, items, fingerprint: str, cache_size: int = DESCRIPTION_CACHE_SIZE):
+        """`fetch(name)` returns one description (or None); `items()` yields every (name, description)."""
+        self.names = tuple(names)
+        self.fingerprint = fingerprint
+        self._canonical = {name.lower(): name for name in reversed(self.names)}
+        self._fetch = fetch
+        self._items = items
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls) -> "DescriptionStore":
+        """A store over the crop_details table of the configured backend."""
+        if storage.use_sqlite() or storage.use_parquet():
+            return cls._from_table()
+        storage.ensure_data_files()
+        return cls._from_csv(storage.TABLES["crop_details"][0])
+
+    @classmethod
+    def _from_csv(cls, path: str) -> "DescriptionStore":
+        signature, entries = load_offset_index(path)
+        ranges = {name.lower(): (start, end) for name, start, end in entries}
+
+        def fetch(name):
+            with open(path, "rb") as f:
+                if list(storage.file_signature(path)) != signature:
+                    # the file was rewritten since the offsets were taken; the catalog
+                    # will pick up a fresh store, until then go through the table
+                    return _fetch_from_table(name)
+                start, end = ranges[name.lower()]
+                f.seek(start)
+                fields = _parse_record(f.read(end - start))
+            return fields[1] if len(fields) > 1 else ""
+
+        def items():
+            with open(path, "rb") as f:
+                records = _records(f)
+                next(records, None)
+                for _, _, raw in records:
+                    fields = _parse_record(raw)
+                    if fields and fields[0].strip():
+                        yield fields[0].strip(), fields[1] if len(fields) > 1 else ""
+
+        return cls([name for name, _, _ in entries], fetch, items, _fingerprint(("csv", signature)))
+
+    @classmethod
+    def _from_table(cls) -> "DescriptionStore":
+        names = storage.load_crop_details(columns=["Crop Name"])["Crop Name"].dropna().astype(str).tolist()
+
+        def items():
+            details = storage.load_crop_details()
+            for name, description in zip(details["Crop Name"].tolist(), details["Description"].tolist()):
+                if not pd.isna(name):
+                    yield str(name), "" if pd.isna(description) else str(description)
+
+        version = storage.table_version("crop_details")
+        return cls(list(dict.fromkeys(names)), _fetch_from_table, items,
+                   _fingerprint((storage.STORAGE_BACKEND, version)))
+
+    @classmethod
+    def from_frame(cls, details: pd.DataFrame) -> "DescriptionStore":
+        """An in-memory store over a crop_details frame."""
+        texts = {}
+        for name, description in zip(details["Crop Name"].tolist(), details["Description"].tolist()):
+            if not pd.isna(name):
+                texts.setdefault(str(name), "" if pd.isna(description) else str(description))
+        by_key = {name.lower(): text for name, text in texts.items()}
+        return cls(list(texts), lambda name: by_key.get(name.lower()), lambda: iter(texts.items()),
+                   _fingerprint(sorted(texts.items())), cache_size=0)
+
+    def __contains__(self, name) -> bool:
+        return str(name).lower() in self._canonical
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def get(self, name) -> str | None:
+        """The description for `name` (any case), or None if the crop has no row."""
+        key = str(name).lower()
+        if key not in self._canonical:
+            return None
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        text = self._fetch(self._canonical[key])
+        if text is not None and self._cache_size:
+            with self._lock:
+                self._cache[key] = text
+                while len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return text
+
+    def items(self):
+        """Every (crop name, description), read in one sequential pass and not cached."""
+        seen = set()
+        for name, text in self._items():
+            if name.lower() not in seen:
+                seen.add(name.lower())
+                yield name, text
+
+
+def _fetch_from_table(name: str) -> str | None:
+    rows = storage.load_crop_details(columns=["Description"], filters=[("Crop Name", "==", name)])
+    if rows.empty:
+        return None
+    description = rows["Description"].iloc[0]
+    return "" if pd.isna(description) else str(description)
+
+
+def _fingerprint(value) -> str:
+    return hashlib.sha1(repr(value).encode("utf-8")).hexdigest()
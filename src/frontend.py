@@ -1,13 +1,19 @@
 import streamlit as st
 import pandas as pd
 import os
+import tempfile
 from storage import (
-    DATA_DIR, load_users, save_users, load_crops, save_crops,
-    load_farmers, save_farmers, load_crop_profit, save_crop_profit,
-    load_crop_details, save_crop_details, next_id, ensure_data_files,
-    CROP_PROFIT_CSV, CROP_DETAILS_CSV
+    load_users, load_farmer_crops, load_farmers, allocate_id, ensure_data_files,
+    insert_row, update_rows, delete_rows, delete_crop_record, count_rows,
+    find_user, user_exists, reprice_crops_in_background, farmer_crop_totals, iter_crops,
+    crop_sketches, WriteConflictError
 )
 from security import hash_password, verify_password
+from crop_catalog import CropCatalog, get_catalog, set_catalog, reload_catalog
+from crop_attributes import SOIL_TYPES, WATER_LEVELS
+from price_history import get_price_history, record_price_change
+from report_cube import DIMENSIONS, get_report_cube
+from streaming import peak_rss_mb, write_chunks
 import re
 
 st.set_page_config(
@@ -51,17 +57,12 @@ if 'page' not in st.session_state:
     st.session_state.page = 'login'
 
 ensure_data_files()
-FARMER_CROPS_CSV = os.path.join(DATA_DIR, "farmer_crops.csv")
 
 try:
-    CROP_PROFIT_DATA = pd.read_csv(CROP_PROFIT_CSV)
-    crop_details_df = pd.read_csv(CROP_DETAILS_CSV)
-    CROP_DETAILS = {row["Crop Name"]: {"description": row["Description"]} 
-                   for idx, row in crop_details_df.iterrows()}
+    get_catalog()
 except Exception as e:
     st.error(f"Error loading crop data: {e}")
-    CROP_PROFIT_DATA = pd.DataFrame()
-    CROP_DETAILS = {}
+    set_catalog(CropCatalog.empty())
 
 def is_valid_password(password):
     pattern = r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*?&])[A-Za-z\d@$!%*?&]{8,}$'
@@ -94,10 +95,9 @@ def registration_page():
         submitted = st.form_submit_button("Register", type="primary")
         
         if submitted:
-            users = load_users()
             if not username or not name or not password:
                 st.error("❌ Please fill all required fields!")
-            elif not users.empty and (users["username"] == username).any():
+            elif user_exists(username):
                 st.error("❌ Username already exists!")
             elif len(name) < 2:
                 st.error("❌ Name must be at least 2 characters!")
@@ -111,7 +111,7 @@ def registration_page():
                 st.error("❌ Location is required for farmers!")
             else:
                 phash, salt = hash_password(password)
-                user_id = next_id(users, "user_id")
+                user_id = allocate_id("user_id")
                 new_user_row = {
                     "user_id": user_id,
                     "username": username,
@@ -120,12 +120,10 @@ def registration_page():
                     "password_hash": phash,
                     "salt": salt
                 }
-                users = pd.concat([users, pd.DataFrame([new_user_row])], ignore_index=True)
-                save_users(users)
+                insert_row("users", new_user_row)
                 
                 if role == "farmer":
-                    farmers = load_farmers()
-                    farmer_id = next_id(farmers, "farmer_id")
+                    farmer_id = allocate_id("farmer_id")
                     new_farmer_row = {
                         "farmer_id": farmer_id,
                         "username": username,
@@ -133,8 +131,7 @@ def registration_page():
                         "location": location,
                         "contact": contact
                     }
-                    farmers = pd.concat([farmers, pd.DataFrame([new_farmer_row])], ignore_index=True)
-                    save_farmers(farmers)
+                    insert_row("farmers", new_farmer_row)
                 
                 st.success(f"✅ {role.capitalize()} '{name}' registered successfully!")
                 st.info("Please go to Login page to access your account.")
@@ -143,47 +140,6 @@ def registration_page():
         st.session_state.page = 'login'
         st.rerun()
 
-def format_crop_description(description):
-    """Format crop description by parsing keywords and creating structured display"""
-    if not description:
-        return "No description available.", {}
-    
-    keywords = [
-        "GROWING PROCESS:",
-        "WATER REQUIREMENTS:",
-        "SUNLIGHT REQUIREMENTS:",
-        "SOIL REQUIREMENTS:",
-        "DURATION:",
-        "FERTILIZER NEEDS:"
-    ]
-    
-    sections = {}
-    intro_end = len(description)
-    for keyword in keywords:
-        if keyword in description:
-            pos = description.find(keyword)
-            if pos < intro_end:
-                intro_end = pos
-    
-    intro = description[:intro_end].strip()
-
-    for i, keyword in enumerate(keywords):
-        if keyword in description:
-            start = description.find(keyword) + len(keyword)
-            end = len(description)
-            for next_keyword in keywords[i+1:]:
-                if next_keyword in description:
-                    next_pos = description.find(next_keyword)
-                    if next_pos > start:
-                        end = min(end, next_pos)
-                        break
-            
-            section_text = description[start:end].strip()
-            clean_keyword = keyword.replace(":", "").title()
-            sections[clean_keyword] = section_text
-    
-    return intro, sections
-
 def login_page():
     st.markdown('<div class="main-header">🌾 Crop Management Portal</div>', unsafe_allow_html=True)
     
@@ -198,27 +154,24 @@ def login_page():
             submitted = st.form_submit_button("Login", type="primary")
             
             if submitted:
-                users = load_users()
+                row = find_user(username)
                 
-                if users.empty:
+                if row is None and count_rows("users") == 0:
                     st.error("❌ No users found. Please register first.")
+                elif row is None:
+                    st.error("❌ User not found.")
                 else:
-                    row = users[users["username"] == username]
-                    if row.empty:
-                        st.error("❌ User not found.")
+                    if verify_password(password, row["password_hash"], row["salt"]):
+                        st.session_state.user = {
+                            "user_id": int(row["user_id"]),
+                            "username": row["username"],
+                            "name": row["name"],
+                            "role": row["role"]
+                        }
+                        st.success(f"✅ Welcome, {row['name']}!")
+                        st.rerun()
                     else:
-                        row = row.iloc[0]
-                        if verify_password(password, row["password_hash"], row["salt"]):
-                            st.session_state.user = {
-                                "user_id": int(row["user_id"]),
-                                "username": row["username"],
-                                "name": row["name"],
-                                "role": row["role"]
-                            }
-                            st.success(f"✅ Welcome, {row['name']}!")
-                            st.rerun()
-                        else:
-                            st.error("❌ Incorrect password.")
+                        st.error("❌ Incorrect password.")
         
         if st.button("Don't have an account? Register"):
             st.session_state.page = 'register'
@@ -265,13 +218,9 @@ def admin_dashboard_home():
     with col2:
         st.metric("Total Farmers", len(farmers))
     with col3:
-        st.metric("Total Crops", len(CROP_PROFIT_DATA))
+        st.metric("Total Crops", len(get_catalog()))
     with col4:
-        if os.path.exists(FARMER_CROPS_CSV):
-            farmer_crops = pd.read_csv(FARMER_CROPS_CSV)
-            st.metric("Crop Records", len(farmer_crops))
-        else:
-            st.metric("Crop Records", 0)
+        st.metric("Crop Records", count_rows("farmer_crops"))
     
     st.markdown("---")
     col1, col2 = st.columns(2)
@@ -285,8 +234,9 @@ def admin_dashboard_home():
     
     with col2:
         st.subheader("🌾 Available Crops")
-        if not CROP_PROFIT_DATA.empty:
-            st.dataframe(CROP_PROFIT_DATA[['Crop Name', 'Season', 'Profit Per Acre']].head(5), 
+        catalog = get_catalog()
+        if not catalog.is_empty:
+            st.dataframe(catalog.profit_data[['Crop Name', 'Season', 'Profit Per Acre']].head(5), 
                         use_container_width=True)
         else:
             st.info("No crop data available.")
@@ -325,7 +275,7 @@ def manage_farmers_page():
                 ):
                     st.error("⚠️ Farmer with same name or contact already registered!")
                 else:
-                    farmer_id = next_id(farmers, "farmer_id")
+                    farmer_id = allocate_id("farmer_id")
                     new_row = {
                         "farmer_id": farmer_id,
                         "username": username if username else name.lower(),
@@ -333,8 +283,7 @@ def manage_farmers_page():
                         "location": location,
                         "contact": contact
                     }
-                    farmers = pd.concat([farmers, pd.DataFrame([new_row])], ignore_index=True)
-                    save_farmers(farmers)
+                    insert_row("farmers", new_row)
                     st.success(f"✅ Farmer '{name}' registered successfully!")
                     st.rerun()
 
@@ -359,12 +308,12 @@ def manage_farmers_page():
                     if len(new_contact) != 10 or not new_contact.isdigit():
                         st.error("❌ Contact must be exactly 10 digits!")
                     else:
-                        idx = farmers.index[farmers["farmer_id"].astype(str) == selected_id][0]
-                        farmers.at[idx, "username"] = new_username
-                        farmers.at[idx, "name"] = new_name
-                        farmers.at[idx, "location"] = new_location
-                        farmers.at[idx, "contact"] = new_contact
-                        save_farmers(farmers)
+                        update_rows("farmers", "farmer_id", selected_id, {
+                            "username": new_username,
+                            "name": new_name,
+                            "location": new_location,
+                            "contact": new_contact
+                        })
                         st.success("✅ Farmer updated successfully!")
                         st.rerun()
     with tab4:
@@ -380,8 +329,7 @@ def manage_farmers_page():
             st.warning(f"You are about to delete: **{farmer_info['name']}** (ID: {selected_id})")
             
             if st.button("Delete Farmer", type="primary"):
-                farmers = farmers[farmers["farmer_id"].astype(str) != selected_id]
-                save_farmers(farmers)
+                delete_rows("farmers", "farmer_id", selected_id)
                 st.success("✅ Farmer deleted successfully!")
                 st.rerun()
 
@@ -416,20 +364,17 @@ def manage_users_page():
                 new_password = st.text_input("New Password (leave blank to keep current)", type="password")
                 
                 if st.form_submit_button("Update User"):
-                    if new_username != user_row["username"] and new_username in users["username"].values:
+                    if new_username != user_row["username"] and user_exists(new_username):
                         st.error("❌ Username already exists!")
                     else:
-                        idx = users.index[users["username"] == selected_user][0]
-                        users.at[idx, "username"] = new_username
-                        users.at[idx, "name"] = new_name
-                        users.at[idx, "role"] = new_role
+                        changes = {"username": new_username, "name": new_name, "role": new_role}
                         
                         if new_password:
                             phash, salt = hash_password(new_password)
-                            users.at[idx, "password_hash"] = phash
-                            users.at[idx, "salt"] = salt
+                            changes["password_hash"] = phash
+                            changes["salt"] = salt
                         
-                        save_users(users)
+                        update_rows("users", "user_id", user_row["user_id"], changes)
                         st.success("✅ User updated successfully!")
                         st.rerun()
         else:
@@ -448,8 +393,7 @@ def manage_users_page():
             confirm = st.checkbox("I confirm I want to delete this user")
             
             if confirm and st.button("Delete User", type="primary"):
-                users = users[users["username"] != selected_user]
-                save_users(users)
+                delete_rows("users", "username", selected_user)
                 st.success("✅ User deleted successfully!")
                 st.rerun()
         else:
@@ -458,7 +402,8 @@ def manage_users_page():
 def view_crop_information_page():
     st.title("🌾 Crop Information Database")
     
-    if CROP_PROFIT_DATA.empty:
+    catalog = get_catalog()
+    if catalog.is_empty:
         st.warning("No crop data available.")
         return
 
@@ -466,18 +411,23 @@ def view_crop_information_page():
     
     with col1:
         season_filter = st.selectbox("Filter by Season", 
-                                     ["All"] + CROP_PROFIT_DATA["Season"].unique().tolist())
+                                     ["All"] + catalog.seasons)
     
     with col2:
         search_crop = st.text_input("Search Crop Name")
     
-    filtered_data = CROP_PROFIT_DATA.copy()
+    search_text = st.text_input("Search Descriptions", placeholder="e.g. drought tolerant, loamy soil, 90 days")
     
-    if season_filter != "All":
-        filtered_data = filtered_data[filtered_data["Season"] == season_filter]
+    filtered_data = catalog.rows(catalog.query(season=None if season_filter == "All" else season_filter,
+                                               name=search_crop))
     
-    if search_crop:
-        filtered_data = filtered_data[filtered_data["Crop Name"].str.contains(search_crop, case=False, na=False)]
+    if search_text:
+        results = catalog.search(search_text, limit=len(catalog))
+        rank = {r["Crop Name"]: i for i, r in enumerate(results)}
+        matched_in = {r["Crop Name"]: r["section"] or "Overview" for r in results}
+        filtered_data = filtered_data[filtered_data["Crop Name"].isin(rank)].copy()
+        filtered_data["Matched In"] = filtered_data["Crop Name"].map(matched_in)
+        filtered_data = filtered_data.sort_values("Crop Name", key=lambda names: names.map(rank))
     
     st.dataframe(filtered_data, use_container_width=True)
     
@@ -488,10 +438,10 @@ def view_crop_information_page():
         crop_names = filtered_data["Crop Name"].tolist()
         selected_crop = st.selectbox("Select Crop for Details", crop_names)
         
-        if selected_crop in CROP_DETAILS:
+        parsed = catalog.sections(selected_crop)
+        if parsed is not None:
             st.markdown("### Description")
-            description = CROP_DETAILS[selected_crop]["description"]
-            intro, sections = format_crop_description(description)
+            intro, sections = parsed
             
             if intro:
                 st.info(intro)
@@ -505,33 +455,40 @@ def view_crop_information_page():
 
 
 def update_crop_profits_page():
-    global CROP_PROFIT_DATA
     st.title("💰 Update Crop Profit Data")
     
-    if CROP_PROFIT_DATA.empty:
+    catalog = get_catalog()
+    if catalog.is_empty:
         st.warning("No crop profit data available.")
         return
     
-    st.dataframe(CROP_PROFIT_DATA, use_container_width=True)
+    st.dataframe(catalog.profit_data, use_container_width=True)
     
     st.markdown("---")
     st.subheader("Update Profit")
     
-    crop_names = CROP_PROFIT_DATA["Crop Name"].tolist()
+    crop_names = catalog.names
     selected_crop = st.selectbox("Select Crop", crop_names)
     
     if selected_crop:
-        crop_row = CROP_PROFIT_DATA[CROP_PROFIT_DATA["Crop Name"] == selected_crop].iloc[0]
+        crop_row = catalog.get(selected_crop)
         current_profit = crop_row["Profit Per Acre"]
         
         st.info(f"Current Profit: ₹{current_profit:,.2f} per acre")
         
+        trend = get_price_history().trend(selected_crop).dropna(subset=["Effective From"])
+        if not trend.empty:
+            st.markdown("**Price Trend**")
+            st.line_chart(trend.set_index("Effective From")["Profit Per Acre"])
+        
         new_profit = st.number_input("New Profit Per Acre (₹)", min_value=0.0, 
                                      value=float(current_profit), step=100.0)
         
         if st.button("Update Profit", type="primary"):
-            CROP_PROFIT_DATA.loc[CROP_PROFIT_DATA["Crop Name"] == selected_crop, "Profit Per Acre"] = new_profit
-            CROP_PROFIT_DATA.to_csv(CROP_PROFIT_CSV, index=False)
+            update_rows("crop_profit", "Crop Name", selected_crop, {"Profit Per Acre": new_profit})
+            record_price_change(selected_crop, current_profit, new_profit)
+            reload_catalog()
+            reprice_crops_in_background({selected_crop: new_profit})
             
             change = new_profit - current_profit
             change_pct = (change / current_profit * 100) if current_profit != 0 else 0
@@ -543,44 +500,120 @@ def update_crop_profits_page():
 def reports_analytics_page():
     st.title("📈 Reports & Analytics")
     
-    tab1, tab2 = st.tabs(["Profit Summary", "Export Reports"])
+    tab1, tab_cube, tab_top, tab_fast, tab2 = st.tabs(["Profit Summary", "Season / Location / Crop", "Top Crops",
+                                                       "Approximate Stats", "Export Reports"])
     
     with tab1:
-        if os.path.exists(FARMER_CROPS_CSV):
-            df = pd.read_csv(FARMER_CROPS_CSV)
-            if not df.empty:
-                df['Estimated Profit'] = pd.to_numeric(df['Estimated Profit'], errors='coerce')
-                summary = df.groupby("username")["Estimated Profit"].sum().reset_index()
-                summary.columns = ["Farmer", "Total Expected Profit (₹)"]
-                
-                total_profit = summary["Total Expected Profit (₹)"].sum()
-                
-                st.metric("Total Portal Expected Profit", f"₹{total_profit:,.2f}")
-                
-                st.markdown("---")
-                st.subheader("Profit by Farmer")
-                st.dataframe(summary, use_container_width=True)
-                st.bar_chart(summary.set_index("Farmer"))
-            else:
-                st.info("No crop records to analyze.")
+        totals = farmer_crop_totals()
+        if not totals["farmers"].empty:
+            portal = totals["portal"]
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Total Portal Expected Profit", f"₹{portal['Estimated Profit']:,.2f}")
+            col2.metric("Total Acreage", f"{portal['Field Size (acres)']:,.2f}")
+            col3.metric("Crop Records", f"{portal['Records']:,}")
+            
+            st.markdown("---")
+            st.subheader("Profit by Farmer")
+            summary = totals["farmers"].rename(columns={"username": "Farmer",
+                                                        "Estimated Profit": "Total Expected Profit (₹)"})
+            st.dataframe(summary, use_container_width=True)
+            st.bar_chart(summary.set_index("Farmer")["Total Expected Profit (₹)"])
+            
+            st.subheader("Profit by Crop")
+            st.dataframe(totals["crops"].rename(columns={"Estimated Profit": "Total Expected Profit (₹)"}),
+                         use_container_width=True)
+        else:
+            st.info("No crop records to analyze.")
+    
+    with tab_cube:
+        cube = get_report_cube()
+        if cube.total()["Records"] == 0:
+            st.info("No crop records to analyze.")
+        else:
+            st.caption("Pick values to drill into; the table breaks the selection down by the chosen dimension.")
+            cols = st.columns(len(DIMENSIONS))
+            path = {}
+            for col, dim in zip(cols, DIMENSIONS):
+                choice = col.selectbox(dim, ["All"] + cube.members[dim], key=f"cube_{dim}")
+                if choice != "All":
+                    path[dim] = choice
+            remaining = [dim for dim in DIMENSIONS if dim not in path]
+            
+            total = cube.total(path)
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Expected Profit", f"₹{total['Profit Sum']:,.2f}")
+            col2.metric("Acreage", f"{total['Acres Sum']:,.2f}")
+            col3.metric("Records", f"{total['Records']:,}")
+            
+            if remaining and total["Records"]:
+                by = st.radio("Break down by", remaining, horizontal=True, key="cube_by")
+                breakdown = cube.drill_down(path, by)
+                st.dataframe(breakdown, use_container_width=True)
+                st.bar_chart(breakdown.set_index(by)["Profit Sum"])
+    
+    with tab_top:
+        cube = get_report_cube()
+        col1, col2, col3 = st.columns(3)
+        season = col1.selectbox("Season", ["All"] + cube.members["Season"], key="top_season")
+        location = col2.selectbox("Location", ["All"] + cube.members["Location"], key="top_location")
+        count = col3.number_input("Crops to show", min_value=1, max_value=50, value=5, key="top_count")
+        top = cube.top("Crop Name", int(count), where={"Season": None if season == "All" else season,
+                                                       "Location": None if location == "All" else location})
+        if top.empty:
+            st.info("No crop records match.")
+        else:
+            st.dataframe(top, use_container_width=True)
+            st.bar_chart(top.set_index("Crop Name")["Profit Sum"])
+    
+    with tab_fast:
+        sketch = crop_sketches()
+        if not sketch.rows:
+            st.info("No crop records to analyze.")
         else:
-            st.info("No crop records found.")
+            st.caption("Read from fixed-size sketches kept up to date on every write, so these figures cost the "
+                       "same however many records there are. They are estimates; the error bounds are shown.")
+            quantiles = sketch.profit_quantiles()
+            cols = st.columns(1 + len(quantiles))
+            cols[0].metric("Distinct Farmers", f"~{sketch.farmers.count():,}",
+                           help=f"Typically within ±{sketch.farmers.relative_error:.1%}")
+            for col, (name, value) in zip(cols[1:], quantiles.items()):
+                col.metric(f"Expected Profit {name}", f"₹{value:,.0f}",
+                           help=f"Rank within ±{sketch.profit.rank_error:.1%} (99% confidence)")
+            
+            st.subheader("Distinct Farmers per Crop")
+            st.dataframe(sketch.distinct_farmers(), use_container_width=True)
+            st.subheader("Crops by Acreage")
+            acreage = sketch.top_crops_by_acreage(10)
+            st.dataframe(acreage, use_container_width=True)
+            st.bar_chart(acreage.set_index("Crop Name")["Field Size (acres)"])
+            if sketch.stale:
+                st.caption(f"Also counts {sketch.stale:,} records deleted or changed since the sketches were built.")
     
     with tab2:
         st.subheader("Export Data")
         
-        if os.path.exists(FARMER_CROPS_CSV):
-            df = pd.read_csv(FARMER_CROPS_CSV)
-            
-            csv = df.to_csv(index=False)
+        # written a chunk at a time, so the page never holds the records as a DataFrame;
+        # each export goes to its own temporary directory, removed once the CSV is read
+        if st.button("Prepare Farmer Crops Export"):
+            with tempfile.TemporaryDirectory() as export_dir:
+                export_file = os.path.join(export_dir, "farmer_crops_export.csv")
+                rows = write_chunks(iter_crops(), export_file)
+                with open(export_file, "rb") as f:
+                    st.session_state.export_csv = (rows, f.read())
+        rows, csv_data = st.session_state.get("export_csv", (None, None))
+        if rows == 0:
+            st.info("No data to export.")
+        elif rows:
             st.download_button(
-                label="📥 Download Farmer Crops (CSV)",
-                data=csv,
+                label=f"📥 Download Farmer Crops (CSV, {rows:,} records)",
+                data=csv_data,
                 file_name="farmer_crops_export.csv",
                 mime="text/csv"
             )
-        else:
-            st.info("No data to export.")
+    
+    peak = peak_rss_mb()
+    if peak is not None:
+        st.caption(f"Peak memory use of this app process so far: {peak:,.0f} MB")
 def farmer_dashboard():
     st.sidebar.title(f"👤 {st.session_state.user['name']}")
     st.sidebar.caption(f"Role: Farmer")
@@ -614,10 +647,8 @@ def farmer_dashboard_home():
     st.markdown('<div class="main-header">📊 Farmer Dashboard</div>', unsafe_allow_html=True)
     
     user = st.session_state.user
-    if os.path.exists(FARMER_CROPS_CSV):
-        df = pd.read_csv(FARMER_CROPS_CSV)
-        df['username'] = df['username'].astype(str)
-        my_crops = df[df["username"] == user["username"]]
+    my_crops = load_farmer_crops(user["username"])
+    if not my_crops.empty:
         
         col1, col2, col3 = st.columns(3)
         
@@ -626,7 +657,6 @@ def farmer_dashboard_home():
         
         with col2:
             if not my_crops.empty:
-                my_crops['Estimated Profit'] = pd.to_numeric(my_crops['Estimated Profit'], errors='coerce')
                 total = my_crops['Estimated Profit'].sum()
                 st.metric("Total Expected Profit", f"₹{total:,.2f}")
             else:
@@ -634,7 +664,7 @@ def farmer_dashboard_home():
         
         with col3:
             if not my_crops.empty:
-                total_acres = my_crops['Field Size (acres)'].astype(float).sum()
+                total_acres = my_crops['Field Size (acres)'].sum()
                 st.metric("Total Field Size", f"{total_acres:.2f} acres")
             else:
                 st.metric("Total Field Size", "0 acres")
@@ -651,20 +681,22 @@ def farmer_dashboard_home():
     
     st.markdown("---")
     st.subheader("🌾 Available Crops in Database")
-    if not CROP_PROFIT_DATA.empty:
-        st.dataframe(CROP_PROFIT_DATA, use_container_width=True)
+    catalog = get_catalog()
+    if not catalog.is_empty:
+        st.dataframe(catalog.profit_data, use_container_width=True)
 
 def search_filter_crops_page():
     st.title("🔍 Search & Filter Crops")
     
-    if CROP_PROFIT_DATA.empty:
+    catalog = get_catalog()
+    if catalog.is_empty:
         st.warning("No crop data available.")
         return
     
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        season_filter = st.selectbox("Season", ["All"] + CROP_PROFIT_DATA["Season"].unique().tolist())
+        season_filter = st.selectbox("Season", ["All"] + catalog.seasons)
     
     with col2:
         min_profit = st.number_input("Min Profit (₹)", min_value=0.0, value=0.0, step=1000.0)
@@ -672,16 +704,28 @@ def search_filter_crops_page():
     with col3:
         max_profit = st.number_input("Max Profit (₹)", min_value=0.0, value=0.0, step=1000.0)
     
-    filtered_data = CROP_PROFIT_DATA.copy()
+    col4, col5, col6, col7 = st.columns(4)
     
-    if season_filter != "All":
-        filtered_data = filtered_data[filtered_data["Season"] == season_filter]
+    with col4:
+        max_days = st.number_input("Max Duration (days)", min_value=0, value=0, step=10)
+    
+    with col5:
+        water_need = st.multiselect("Water Need", WATER_LEVELS)
+    
+    with col6:
+        soil = st.selectbox("Soil Type", ["All"] + list(SOIL_TYPES))
     
-    if min_profit > 0:
-        filtered_data = filtered_data[filtered_data["Profit Per Acre"] >= min_profit]
+    with col7:
+        sun_hours = st.number_input("Sunlight Available (hours/day)", min_value=0.0, max_value=24.0, value=0.0, step=1.0)
     
-    if max_profit > 0:
-        filtered_data = filtered_data[filtered_data["Profit Per Acre"] <= max_profit]
+    positions = catalog.query(season=None if season_filter == "All" else season_filter,
+                              min_profit=min_profit if min_profit > 0 else None,
+                              max_profit=max_profit if max_profit > 0 else None,
+                              max_days=max_days if max_days > 0 else None,
+                              water_need=water_need or None,
+                              soil=None if soil == "All" else soil,
+                              sun_hours=sun_hours if sun_hours > 0 else None)
+    filtered_data = catalog.rows(positions)
     
     st.markdown("---")
     
@@ -689,14 +733,15 @@ def search_filter_crops_page():
         st.warning("No crops match your filter criteria.")
     else:
         st.success(f"Found {len(filtered_data)} crops matching your criteria")
-        st.dataframe(filtered_data, use_container_width=True)
+        attributes = catalog.attributes.iloc[list(positions)][["Min Days", "Max Days", "Water Need", "Soil Types"]]
+        st.dataframe(filtered_data.join(attributes), use_container_width=True)
         crop_names = filtered_data["Crop Name"].tolist()
         selected_crop = st.selectbox("View Details", crop_names)
         
-        if selected_crop in CROP_DETAILS:
+        parsed = catalog.sections(selected_crop)
+        if parsed is not None:
             st.markdown("### Description")
-            description = CROP_DETAILS[selected_crop]["description"]
-            intro, sections = format_crop_description(description)
+            intro, sections = parsed
                 
             if intro:
                 st.info(intro)
@@ -712,23 +757,34 @@ def search_filter_crops_page():
 def add_my_crop_page():
     st.title("➕ Add My Crop with Profit Calculation")
     
-    if CROP_PROFIT_DATA.empty:
+    catalog = get_catalog()
+    if catalog.is_empty:
         st.warning("No crop data available.")
         return
     
     st.subheader("Available Crops")
-    st.dataframe(CROP_PROFIT_DATA[['Crop Name', 'Season', 'Profit Per Acre']], use_container_width=True)
+    st.dataframe(catalog.profit_data[['Crop Name', 'Season', 'Profit Per Acre']], use_container_width=True)
     
     st.markdown("---")
     
+    typed_crop = st.text_input("Find Crop", placeholder="Type a crop name, e.g. wheet, sugar cane, bhindi")
+    crop_names = list(catalog.names)
+    if typed_crop:
+        suggestions = catalog.suggest(typed_crop)
+        if suggestions:
+            matches = [s["Crop Name"] for s in suggestions]
+            st.caption("Closest matches: " + ", ".join(matches))
+            crop_names = matches + [name for name in crop_names if name not in matches]
+        else:
+            st.caption(f"No crop matches '{typed_crop}'.")
+    
     with st.form("add_crop_form"):
-        crop_names = CROP_PROFIT_DATA["Crop Name"].tolist()
         selected_crop = st.selectbox("Select Crop*", crop_names)
         
         field_size = st.number_input("Field Size (acres)*", min_value=0.01, value=1.0, step=0.1)
         
         if st.form_submit_button("Calculate & Add Crop", type="primary"):
-            crop_data = CROP_PROFIT_DATA[CROP_PROFIT_DATA["Crop Name"] == selected_crop].iloc[0]
+            crop_data = catalog.get(selected_crop)
             profit_per_acre = float(crop_data["Profit Per Acre"])
             total_profit = profit_per_acre * field_size
             st.success("💰 Profit Calculation")
@@ -739,11 +795,7 @@ def add_my_crop_page():
                 st.metric("Field Size", f"{field_size} acres")
             with col3:
                 st.metric("Total Profit", f"₹{total_profit:,.2f}")
-            if not os.path.exists(FARMER_CROPS_CSV):
-                with open(FARMER_CROPS_CSV, "w", encoding="utf-8") as f:
-                    f.write("username,Crop Name,Field Size (acres),Profit Per Acre,Estimated Profit\n")
             
-            df = pd.read_csv(FARMER_CROPS_CSV)
             new_row = {
                 "username": st.session_state.user["username"],
                 "Crop Name": selected_crop,
@@ -751,8 +803,7 @@ def add_my_crop_page():
                 "Profit Per Acre": profit_per_acre,
                 "Estimated Profit": total_profit
             }
-            df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-            df.to_csv(FARMER_CROPS_CSV, index=False)
+            insert_row("farmer_crops", new_row)
             
             st.success(f"✅ Crop '{selected_crop}' added successfully!")
             st.balloons()
@@ -762,20 +813,13 @@ def my_crops_page():
     
     user = st.session_state.user
     
-    if not os.path.exists(FARMER_CROPS_CSV):
-        st.info("You haven't added any crops yet.")
-        return
-    
-    df = pd.read_csv(FARMER_CROPS_CSV)
-    df['username'] = df['username'].astype(str)
-    my_crops = df[df["username"] == user["username"]].reset_index(drop=True)  
+    my_crops = load_farmer_crops(user["username"]).reset_index(drop=True)
     
     if my_crops.empty:
         st.info("You haven't added any crops yet.")
         return
     st.dataframe(my_crops, use_container_width=True)
 
-    my_crops['Estimated Profit'] = pd.to_numeric(my_crops['Estimated Profit'], errors='coerce')
     total = my_crops['Estimated Profit'].sum()
     st.metric("💰 Total Expected Profit", f"₹{total:,.2f}")
     
@@ -791,8 +835,7 @@ def my_crops_page():
         if selected_option and selected_option != "":
             if selected_option == "Delete All":
                 if st.button("🗑️ Delete All My Crops", type="primary"):
-                    df = df[df["username"] != user["username"]]
-                    df.to_csv(FARMER_CROPS_CSV, index=False)
+                    delete_rows("farmer_crops", "username", user["username"])
                     st.success("✅ All your crops have been deleted!")
                     st.rerun()
             else:
@@ -803,15 +846,7 @@ def my_crops_page():
                     st.warning(f"Delete: {row_to_delete['Crop Name']} ({row_to_delete['Field Size (acres)']} acres)")
                     
                     if st.button("🗑️ Delete This Crop", type="primary"):
-                        match = (
-                            (df["username"] == user["username"]) &
-                            (df["Crop Name"] == row_to_delete["Crop Name"]) &
-                            (df["Field Size (acres)"] == row_to_delete["Field Size (acres)"]) &
-                            (df["Profit Per Acre"] == row_to_delete["Profit Per Acre"]) &
-                            (df["Estimated Profit"] == row_to_delete["Estimated Profit"])
-                        )
-                        df = df[~match]
-                        df.to_csv(FARMER_CROPS_CSV, index=False)
+                        delete_crop_record(row_to_delete["record_id"], user["username"])
                         st.success(f"✅ Crop '{row_to_delete['Crop Name']}' deleted!")
                         st.rerun()
                 else:
@@ -844,7 +879,7 @@ def my_profile_page():
                 if len(contact) != 10 or not contact.isdigit():
                     st.error("❌ Contact must be exactly 10 digits!")
                 else:
-                    farmer_id = next_id(farmers, "farmer_id")
+                    farmer_id = allocate_id("farmer_id")
                     new_row = {
                         "farmer_id": farmer_id,
                         "username": user["username"],
@@ -852,8 +887,7 @@ def my_profile_page():
                         "location": location,
                         "contact": contact
                     }
-                    farmers = pd.concat([farmers, pd.DataFrame([new_row])], ignore_index=True)
-                    save_farmers(farmers)
+                    insert_row("farmers", new_row)
                     st.success("✅ Profile saved successfully!")
                     st.rerun()
     else:
@@ -867,11 +901,11 @@ def my_profile_page():
                 if len(contact) != 10 or not contact.isdigit():
                     st.error("❌ Contact must be exactly 10 digits!")
                 else:
-                    idx = farmers.index[farmers["username"] == user["username"]][0]
-                    farmers.at[idx, "name"] = name
-                    farmers.at[idx, "location"] = location
-                    farmers.at[idx, "contact"] = contact
-                    save_farmers(farmers)
+                    update_rows("farmers", "farmer_id", farmer_row["farmer_id"], {
+                        "name": name,
+                        "location": location,
+                        "contact": contact
+                    })
                     st.success("✅ Profile updated successfully!")
                     st.rerun()
     
@@ -885,18 +919,9 @@ def my_profile_page():
         
         if confirm_delete:
             if st.button("🗑️ Delete My Account", type="primary"):
-                users = load_users()
-                users = users[users["username"] != user["username"]]
-                save_users(users)
-                
-                farmers = load_farmers()
-                farmers = farmers[farmers["username"] != user["username"]]
-                save_farmers(farmers)
-                
-                if os.path.exists(FARMER_CROPS_CSV):
-                    df = pd.read_csv(FARMER_CROPS_CSV)
-                    df = df[df["username"] != user["username"]]
-                    df.to_csv(FARMER_CROPS_CSV, index=False)
+                delete_rows("users", "username", user["username"])
+                delete_rows("farmers", "username", user["username"])
+                delete_rows("farmer_crops", "username", user["username"])
                 
                 st.success("✅ Your account has been deleted.")
                 logout()
@@ -910,10 +935,14 @@ def main():
         else:
             registration_page()
     else:
-        if st.session_state.user['role'] == 'admin':
-            admin_dashboard()
-        else:
-            farmer_dashboard()
+        try:
+            if st.session_state.user['role'] == 'admin':
+                admin_dashboard()
+            else:
+                farmer_dashboard()
+        except WriteConflictError:  # someone else saved the table; their changes are kept
+            st.error("⚠️ This data was changed by someone else while you were editing it. "
+                     "Reload the page and try again.")
 
 if __name__ == "__main__":
     main()
@@ -9,26 +9,26 @@ from getpass import getpass
 
 from storage import (
     DATA_DIR,
-    load_users, save_users, save_crops,
-    load_crops, load_farmers, save_farmers,
-    next_id, ensure_data_files
+    load_users,
+    load_farmer_crops, load_farmers,
+    load_crop_profit, load_crop_details, save_crop_profit, save_crop_details,
+    insert_row, update_rows, delete_rows, delete_crop_record,
+    allocate_id, ensure_data_files, find_user, user_exists, count_rows,
+    reprice_crops_in_background, farmer_crop_totals, iter_crops, crop_sketches, WriteConflictError
 )
 from security import hash_password, verify_password
-
-# ================= File Paths =================
-CROP_PROFIT_CSV = os.path.join(DATA_DIR, "crop_profit_data.csv")
-CROP_DETAILS_CSV = os.path.join(DATA_DIR, "crop_details.csv")
-FARMER_CROPS_CSV = os.path.join(DATA_DIR, "farmer_crops.csv")
+from crop_catalog import CropCatalog, get_catalog, set_catalog, reload_catalog
+from crop_attributes import SOIL_TYPES
+from price_history import get_price_history, record_price_change
+from report_cube import DIMENSIONS, get_report_cube
+from streaming import Sum, fold, peak_rss_mb, write_chunks
 
 #-------------Load Data---------------
 try:
-    CROP_PROFIT_DATA = pd.read_csv(CROP_PROFIT_CSV)
-    crop_details_df = pd.read_csv(CROP_DETAILS_CSV)
-    CROP_DETAILS = {row["Crop Name"]: {"description": row["Description"]} for idx, row in crop_details_df.iterrows()}
+    get_catalog()
 except Exception as e:  
     print(f"Warning: Error loading crop or details CSV: {e}")
-    CROP_PROFIT_DATA = pd.DataFrame()
-    CROP_DETAILS = {}
+    set_catalog(CropCatalog.empty())
 
 os.makedirs(DATA_DIR, exist_ok=True)
 
@@ -45,7 +45,7 @@ def print_table(df: pd.DataFrame, headers="keys"):
 def display_available_crops():
     """Display available crops from database"""
     print("\n--- Available Crops in Database ---")
-    for idx, row in CROP_PROFIT_DATA.iterrows():
+    for row in get_catalog().records:
         print(f"• {row['Crop Name']:<15} | Season: {row['Season']:<12} | Profit/Acre: ₹{row['Profit Per Acre']:,}")
 
 # ================= Password Validation =================
@@ -55,10 +55,9 @@ def is_valid_password(password):
 
 # ================= Auth Functions =================
 def register_user():
-    users = load_users()
     print("\n=== User Registration ===")
     username = input("Choose a username: ").strip()
-    if not users.empty and (users["username"] == username).any():
+    if user_exists(username):
         print("Username already exists! Try another.")
         return
     
@@ -94,7 +93,7 @@ def register_user():
         location = input("Enter your location: ").strip()
 
     phash, salt = hash_password(password)
-    user_id = next_id(users, "user_id")
+    user_id = allocate_id("user_id")
     new_user_row = {
         "user_id": user_id,
         "username": username,
@@ -103,12 +102,10 @@ def register_user():
         "password_hash": phash,
         "salt": salt
     }
-    users = pd.concat([users, pd.DataFrame([new_user_row])], ignore_index=True)
-    save_users(users)
+    insert_row("users", new_user_row)
     
     if role == "farmer":
-        farmers = load_farmers()
-        farmer_id = next_id(farmers, "farmer_id")
+        farmer_id = allocate_id("farmer_id")
         new_farmer_row = {
             "farmer_id": farmer_id,
             "username": username,
@@ -116,8 +113,7 @@ def register_user():
             "location": location,
             "contact": contact
         }
-        farmers = pd.concat([farmers, pd.DataFrame([new_farmer_row])], ignore_index=True)
-        save_farmers(farmers)
+        insert_row("farmers", new_farmer_row)
         print(f"✅ Farmer '{name}' registered successfully!")
         print(f"   Contact: {contact}")
         print(f"   Location: {location}")
@@ -126,21 +122,18 @@ def register_user():
 
 
 def login():
-    users = load_users()
     print("\n=== Login ===")
     username = input("Username: ").strip()
     password = getpass("Password: ").strip()
     
-    if users.empty:
-        print("No users found. Please register first.")
-        return None
-        
-    row = users[users["username"] == username]
-    if row.empty:
-        print("User not found.")
+    row = find_user(username)
+    if row is None:
+        if count_rows("users") == 0:
+            print("No users found. Please register first.")
+        else:
+            print("User not found.")
         return None
         
-    row = row.iloc[0]
     if verify_password(password, row["password_hash"], row["salt"]):
         print(f"✅ Welcome, {row['name']}! Role: {row['role']}")
         return {"user_id": int(row["user_id"]), "username": row["username"], "name": row["name"], "role": row["role"]}
@@ -171,14 +164,11 @@ def view_crop_information():
         print("="*60)
         print("\n--- Available Crops ---")
         
-        available_crops = CROP_PROFIT_DATA["Crop Name"].tolist()
+        catalog = get_catalog()
+        available_crops = catalog.names
         
-        for idx, crop_name in enumerate(available_crops, 1):
-            profit_data = CROP_PROFIT_DATA[CROP_PROFIT_DATA["Crop Name"] == crop_name]
-            if not profit_data.empty:
-                profit = profit_data["Profit Per Acre"].values[0]
-                season = profit_data["Season"].values[0]
-                print(f"{idx:<2} {crop_name:<15} | Season: {season:<12} | Profit/Acre: ₹{profit:,}")
+        for idx, row in enumerate(catalog.records, 1):
+            print(f"{idx:<2} {row['Crop Name']:<15} | Season: {row['Season']:<12} | Profit/Acre: ₹{row['Profit Per Acre']:,}")
         
         print(f"\n0. Return to Dashboard")  
         print("="*60)
@@ -201,43 +191,68 @@ def view_crop_information():
 
 # ================= Search & Filter Crops =================
 def search_and_filter_crops():
-    """Search crops by season and profit range, then view details"""
-    if CROP_PROFIT_DATA.empty:
+    """Search crops by season, profit range and growing conditions, then view details"""
+    catalog = get_catalog()
+    if catalog.is_empty:
         print("No crop data available.")
         return
 
     print("\n--- Search & Filter Crops ---")
     
     season_input = input("Enter season to filter (Kharif/Rabi/Year-round/Zaidi or leave blank for all): ").strip().capitalize()
-    filtered_df = CROP_PROFIT_DATA.copy()
-    if season_input:
-        filtered_df = filtered_df[filtered_df["Season"] == season_input]
     
+    min_profit = None
     min_profit_input = input("Enter minimum profit per acre (or leave blank for no minimum): ").strip()
     if min_profit_input:
         try:
             min_profit = float(min_profit_input)
-            filtered_df = filtered_df[filtered_df["Profit Per Acre"] >= min_profit]
         except ValueError:
             print("Invalid input. Ignoring minimum profit filter.")
     
+    max_profit = None
     max_profit_input = input("Enter maximum profit per acre (or leave blank for no maximum): ").strip()
     if max_profit_input:
         try:
             max_profit = float(max_profit_input)
-            filtered_df = filtered_df[filtered_df["Profit Per Acre"] <= max_profit]
         except ValueError:
             print("Invalid input. Ignoring maximum profit filter.")
     
-    if filtered_df.empty:
+    max_days = None
+    max_days_input = input("Enter maximum crop duration in days (or leave blank for any): ").strip()
+    if max_days_input:
+        try:
+            max_days = int(max_days_input)
+        except ValueError:
+            print("Invalid input. Ignoring duration filter.")
+    
+    water_need = input("Enter water need (Low/Medium/High or leave blank for any): ").strip().capitalize() or None
+    soil = input(f"Enter soil type ({'/'.join(SOIL_TYPES)} or leave blank for any): ").strip().capitalize() or None
+    
+    sun_hours = None
+    sun_hours_input = input("Enter hours of sunlight your field gets (or leave blank for any): ").strip()
+    if sun_hours_input:
+        try:
+            sun_hours = float(sun_hours_input)
+        except ValueError:
+            print("Invalid input. Ignoring sunlight filter.")
+    
+    positions = catalog.query(season_input or None, min_profit, max_profit,
+                              max_days=max_days, water_need=water_need, soil=soil, sun_hours=sun_hours)
+    if not positions:
         print("No crops match your filter criteria.")
         return
     
-    filtered_df = filtered_df.reset_index(drop=True)
+    filtered_df = catalog.rows(positions).reset_index(drop=True)
+    attributes = catalog.attributes.iloc[list(positions)].reset_index(drop=True)
     
     print("\n--- Filtered Crops ---")
     for idx, row in filtered_df.iterrows():
-        print(f"{idx+1}. {row['Crop Name']:<15} | Season: {row['Season']:<12} | Profit/Acre: ₹{row['Profit Per Acre']:,}")
+        attrs = attributes.iloc[idx]
+        days = "Perennial" if attrs["Perennial"] else (
+            f"{attrs['Min Days']}-{attrs['Max Days']} days" if not pd.isna(attrs["Max Days"]) else "-")
+        water = attrs["Water Need"] if not pd.isna(attrs["Water Need"]) else "-"
+        print(f"{idx+1}. {row['Crop Name']:<15} | Season: {row['Season']:<12} | Profit/Acre: ₹{row['Profit Per Acre']:,}"
+              f" | {days:<14} | Water: {water}")
 
     choice = input("\nEnter crop number to view details or 'q' to quit: ").strip()
     if choice.lower() == 'q':
@@ -254,25 +269,186 @@ def search_and_filter_crops():
 
 
 
+# ================= Crop Price History =================
+def crop_price_history():
+    """Admin: a crop's price changes, its price on a given date, and farmer profits at that date's prices"""
+    catalog = get_catalog()
+    crop = catalog.resolve(input("Enter crop name: ").strip())
+    if crop is None:
+        print("❌ Crop not found.")
+        return
+
+    history = get_price_history()
+    trend = history.trend(crop)
+    print(f"\n--- Price History: {crop} ---")
+    if trend.empty:
+        print(f"No price changes recorded. Current profit: ₹{catalog.get(crop)['Profit Per Acre']:,.2f}/acre")
+    else:
+        for _, row in trend.iterrows():
+            since = "(before records)" if pd.isna(row["Effective From"]) else row["Effective From"].strftime("%Y-%m-%d %H:%M")
+            print(f"{since:<18} ₹{row['Profit Per Acre']:,.2f}/acre")
+
+    date_input = input("\nEnter a date (YYYY-MM-DD) to see prices as of that day, or leave blank: ").strip()
+    if not date_input:
+        return
+    try:
+        as_of = pd.Timestamp(date_input) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)  # end of that day
+    except ValueError:
+        print("❌ Invalid date.")
+        return
+    price = history.as_of(crop, as_of)
+    if price is None and crop not in history:
+        price = catalog.get(crop)["Profit Per Acre"]
+    print(f"{crop} on {date_input}: " + (f"₹{price:,.2f}/acre" if price is not None else "no price recorded"))
+
+    current = {r["Crop Name"]: r["Profit Per Acre"] for r in catalog.records}
+    chunks = (crops.assign(Then=history.estimated_profits_as_of(crops, as_of, current))
+              for crops in iter_crops(columns=["Crop Name", "Field Size (acres)", "Estimated Profit"]))
+    totals = fold(chunks, {"then": Sum("Then"), "stored": Sum("Estimated Profit")})
+    print(f"Total estimated profit of all farmer crops at {date_input} prices: ₹{totals['then']:,.2f}")
+    print(f"Total estimated profit at stored prices:                  ₹{totals['stored']:,.2f}")
+
+
+def _format_cube(df: pd.DataFrame) -> pd.DataFrame:
+    shown = df.copy()
+    for col in ("Profit Sum", "Profit Mean"):
+        shown[col] = shown[col].map(lambda v: f"₹{v:,.2f}")
+    for col in ("Acres Sum", "Acres Mean"):
+        shown[col] = shown[col].map(lambda v: f"{v:,.2f}")
+    return shown
+
+
+def profit_cube_report():
+    """Admin: profit and acreage by season, location and crop, drilling down one dimension at a time"""
+    cube = get_report_cube()
+    path = {}
+    while True:
+        total = cube.total(path)
+        scope = ", ".join(f"{dim}: {value}" for dim, value in path.items()) or "All records"
+        print(f"\n--- {scope} | {total['Records']} records | ₹{total['Profit Sum']:,.2f} expected profit "
+              f"| {total['Acres Sum']:,.2f} acres ---")
+        remaining = [dim for dim in DIMENSIONS if dim not in path]
+        if total["Records"] == 0 or not remaining:
+            return
+        for i, dim in enumerate(remaining, 1):
+            print(f"{i}. Break down by {dim}")
+        print("0. Done")
+        choice = input("Enter your choice: ").strip()
+        if choice in ("", "0"):
+            return
+        if not choice.isdigit() or not 1 <= int(choice) <= len(remaining):
+            print("❌ Invalid choice!")
+            continue
+        dim = remaining[int(choice) - 1]
+        breakdown = cube.drill_down(path, dim)
+        print_table(_format_cube(breakdown))
+        member = input(f"Enter a {dim} to drill into (or leave blank to stop): ").strip()
+        if not member:
+            return
+        matches = [m for m in breakdown[dim] if str(m).lower() == member.lower()]
+        if not matches:
+            print(f"❌ {member} is not in this breakdown.")
+            continue
+        path[dim] = matches[0]
+
+
+def top_crops_report():
+    """Admin: the most profitable crops overall, or for a season and/or location"""
+    cube = get_report_cube()
+    season = input(f"Enter season ({'/'.join(cube.members['Season'])} or leave blank for all): ").strip() or None
+    location = input("Enter location (or leave blank for all): ").strip() or None
+    count_input = input("How many crops to show? [5]: ").strip()
+    count = int(count_input) if count_input.isdigit() and int(count_input) > 0 else 5
+    top = cube.top("Crop Name", count, where={"Season": season, "Location": location})
+    scope = " / ".join(v for v in (season, location) if v) or "all seasons and locations"
+    print(f"\n--- Top Crops by Expected Profit ({scope}) ---")
+    print_table(_format_cube(top))
+
+
+
+def approximate_portal_stats():
+    """Admin: fleet-wide figures read from the farmer_crops sketches instead of scanning the records"""
+    sketch = crop_sketches()
+    if not sketch.rows:
+        print("No crop records to summarize.")
+        return
+    print(f"\n--- Approximate Portal Stats ({sketch.rows - sketch.stale:,} records) ---")
+    print(f"Distinct farmers: ~{sketch.farmers.count():,} (typically within ±{sketch.farmers.relative_error:.1%})")
+    print("\nDistinct farmers per crop:")
+    print_table(sketch.distinct_farmers())
+    quantiles = ", ".join(f"{name} ₹{value:,.0f}" for name, value in sketch.profit_quantiles().items())
+    print(f"\nExpected profit per record: {quantiles} (rank within ±{sketch.profit.rank_error:.1%})")
+    print("\nCrops by acreage:")
+    acreage = sketch.top_crops_by_acreage(10)
+    for col in ("Field Size (acres)", "Max Overcount"):
+        acreage[col] = acreage[col].map(lambda v: f"{v:,.2f}")
+    print_table(acreage)
+    if sketch.stale:
+        print(f"(also counts {sketch.stale:,} records deleted or changed since the sketches were built)")
+
+
+# ================= Search Crop Descriptions =================
+def search_crop_descriptions():
+    """Full-text search over crop descriptions, e.g. 'drought tolerant' or 'loamy soil'"""
+    catalog = get_catalog()
+    query = input("Search crop descriptions: ").strip()
+    if not query:
+        return
+    
+    results = catalog.search(query, limit=10)
+    if not results:
+        print("No crops match your search.")
+        return
+    
+    print("\n--- Search Results ---")
+    for idx, result in enumerate(results, 1):
+        print(f"{idx}. {result['Crop Name']:<15} | Matched in: {result['section'] or 'Overview'}")
+
+    choice = input("\nEnter result number to view details or 'q' to quit: ").strip()
+    if choice.lower() == 'q':
+        return
+    try:
+        choice_num = int(choice)
+        if 1 <= choice_num <= len(results):
+            display_single_crop_details(results[choice_num - 1]["Crop Name"])
+        else:
+            print("Invalid choice.")
+    except ValueError:
+        print("Invalid input.")
+
+
+
 # ================= Export Reports Enhancement =================
 def export_farmer_crops():
-    if os.path.exists(FARMER_CROPS_CSV):
-        df = pd.read_csv(FARMER_CROPS_CSV)
-        export_file = os.path.join(DATA_DIR, "farmer_crops_export.xlsx")
-        df.to_excel(export_file, index=False)
-        print(f"✅ Farmer crops exported to {export_file}")
+    """Write every farmer crop record to a CSV or Excel file, a chunk at a time"""
+    fmt = input("Export format (csv/xlsx) [xlsx]: ").strip().lower() or "xlsx"
+    if fmt not in ("csv", "xlsx"):
+        print("❌ Invalid format!")
+        return
+    export_file = os.path.join(DATA_DIR, f"farmer_crops_export.{fmt}")
+    try:
+        rows = write_chunks(iter_crops(), export_file)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return
+    if rows:
+        print(f"✅ {rows:,} farmer crops exported to {export_file}")
     else:
+        os.remove(export_file)
         print("No crop records to export.")
 
 # ================= Profit Summary Dashboard Enhancement =================
 def profit_summary_dashboard():
-    if os.path.exists(FARMER_CROPS_CSV):
-        df = pd.read_csv(FARMER_CROPS_CSV)
-        summary = df.groupby("username")["Estimated Profit"].sum().reset_index()
-        total_portal_profit = summary["Estimated Profit"].sum()
+    totals = farmer_crop_totals()
+    summary = totals["farmers"]
+    if not summary.empty:
+        portal = totals["portal"]
         print("\n--- Profit Summary per Farmer ---")
         print_table(summary)
-        print(f"Total Portal Expected Profit: ₹{total_portal_profit:,.2f}")
+        print("\n--- Profit Summary per Crop ---")
+        print_table(totals["crops"])
+        print(f"Total Portal Expected Profit: ₹{portal['Estimated Profit']:,.2f} "
+              f"({portal['Field Size (acres)']:,.2f} acres, {portal['Records']} records)")
     else:
         print("No crops to summarize.")
 
@@ -283,31 +459,30 @@ def display_single_crop_details(crop_name):
     print(f"📋 DETAILED INFORMATION: {crop_name.upper()}")
     print("="*70)
     
-    profit_data = CROP_PROFIT_DATA[CROP_PROFIT_DATA["Crop Name"] == crop_name]
-    if not profit_data.empty:
-        profit_per_acre = profit_data.iloc[0]["Profit Per Acre"]
-        season = profit_data.iloc[0]["Season"]
+    catalog = get_catalog()
+    profit_data = catalog.get(crop_name)
+    if profit_data is not None:
+        profit_per_acre = profit_data["Profit Per Acre"]
+        season = profit_data["Season"]
         
         print(f"\n💰 Expected Profit: ₹{profit_per_acre:,} per acre")
         print(f"🌦️  Best Season: {season}")
         print("\n" + "-"*70)
     
-    if crop_name in CROP_DETAILS:
-        description = CROP_DETAILS[crop_name]["description"]
-        print(description)
+    parsed = catalog.sections(crop_name)
+    if parsed is not None:
+        intro, sections = parsed
+        print(intro)
+        for title, content in sections.items():
+            print(f"\n{title}:")
+            print(content)
     
     print("\n" + "="*70)
     input("\nPress Enter to continue...")
 
 # ================= Farmer Management Functions =================
 def view_my_crops(user):
-    if not os.path.exists(FARMER_CROPS_CSV):
-        print("No crop records found.")
-        return
-    
-    df = pd.read_csv(FARMER_CROPS_CSV) 
-    df['username'] = df['username'].astype(str)
-    my_crops = df[df["username"] == user["username"]]
+    my_crops = load_farmer_crops(user["username"])
     
     print("\n--- My Crops ---")
     if my_crops.empty:
@@ -316,7 +491,6 @@ def view_my_crops(user):
         print_table(my_crops)
 
         try:
-            my_crops['Estimated Profit'] = pd.to_numeric(my_crops['Estimated Profit'], errors='coerce')
             total = my_crops['Estimated Profit'].sum()
             print(f"\n💰 Total Expected Profit: ₹{total:,.2f}")
         except Exception:
@@ -347,7 +521,7 @@ def register_farmer():
     location = input("Enter location: ").strip()
     username = input("Enter associated username (optional): ").strip() or name.lower()
     
-    farmer_id = next_id(farmers, "farmer_id")
+    farmer_id = allocate_id("farmer_id")
     new_row = {
         "farmer_id": farmer_id,
         "username": username,
@@ -355,8 +529,7 @@ def register_farmer():
         "location": location,
         "contact": contact
     }
-    farmers = pd.concat([farmers, pd.DataFrame([new_row])], ignore_index=True)
-    save_farmers(farmers)
+    insert_row("farmers", new_row)
     
     print(f"✅ Farmer '{name}' registered successfully!")
     print(f"   Contact: {contact}")
@@ -399,8 +572,7 @@ def view_update_farmer_contact():
             else:
                 print("❌ Invalid contact number! Please enter exactly 10 digits.")
         
-        farmers.loc[farmers["name"] == farmer_name, "contact"] = new_contact
-        save_farmers(farmers)
+        update_rows("farmers", "name", farmer_name, {"contact": new_contact})
         
         print(f"✅ Contact updated successfully for farmer '{farmer_name}'!")
         print(f"   New contact: {new_contact}")
@@ -408,9 +580,9 @@ def view_update_farmer_contact():
 # ================= Crop Management Functions =================
 def update_crop_profit_data_only():
     """Update crop profit data with neat column formatting"""
-    global CROP_PROFIT_DATA
+    catalog = get_catalog()
     
-    if CROP_PROFIT_DATA.empty:
+    if catalog.is_empty:
         print("No crop profit data available.")
         return
 
@@ -420,7 +592,7 @@ def update_crop_profit_data_only():
     print()
     print(f"{'No.':<4} {'Crop Name':<20} {'Season':<15} {'Current Profit/Acre':<20}")
     print("-"*80)
-    for idx, row in CROP_PROFIT_DATA.iterrows():
+    for idx, row in enumerate(catalog.records):
         crop_name = str(row['Crop Name'])[:19]  
         season = str(row['Season'])[:14]
         profit = f"₹{row['Profit Per Acre']:,.2f}"
@@ -431,7 +603,7 @@ def update_crop_profit_data_only():
     print()
     try:
         sel = int(input("Enter crop number to update profit: ").strip())
-        if sel < 1 or sel > len(CROP_PROFIT_DATA):
+        if sel < 1 or sel > len(catalog):
             print("❌ Invalid crop number.")
             return
     except ValueError:
@@ -446,12 +618,13 @@ def update_crop_profit_data_only():
     except ValueError:
         print("❌ Invalid number. Please enter a valid amount.")
         return
-    crop_name = CROP_PROFIT_DATA.iloc[sel-1]["Crop Name"]
-    old_profit = CROP_PROFIT_DATA.iloc[sel-1]["Profit Per Acre"]
+    crop_name = catalog.records[sel-1]["Crop Name"]
+    old_profit = catalog.records[sel-1]["Profit Per Acre"]
     
-    CROP_PROFIT_DATA.loc[CROP_PROFIT_DATA["Crop Name"] == crop_name, "Profit Per Acre"] = profit_value
-    CROP_PROFIT_DATA.to_csv(CROP_PROFIT_CSV, index=False)
-    CROP_PROFIT_DATA = pd.read_csv(CROP_PROFIT_CSV)
+    update_rows("crop_profit", "Crop Name", crop_name, {"Profit Per Acre": profit_value})
+    record_price_change(crop_name, old_profit, profit_value)
+    reload_catalog()
+    reprice_crops_in_background({crop_name: profit_value})
 
     print()
     print("="*80)
@@ -459,6 +632,7 @@ def update_crop_profit_data_only():
     print("="*80)
     print(f"  Old Profit: ₹{old_profit:,.2f}/acre")
     print(f"  New Profit: ₹{profit_value:,.2f}/acre")
+    print("  Farmer records for this crop are being updated to the new price.")
 
     change_amount = profit_value - old_profit
     if old_profit != 0:
@@ -480,12 +654,13 @@ def update_farmer():
     if (farmers["farmer_id"].astype(str) == fid).any():
         idx = farmers.index[farmers["farmer_id"].astype(str) == fid][0]
         print("Leave blank to keep existing value.")
+        changes = {}
         for field in ["username", "name", "location", "contact"]:
             cur = farmers.at[idx, field]
             val = input(f"{field} [{cur}]: ").strip()
             if val:
-                farmers.at[idx, field] = val
-        save_farmers(farmers)
+                changes[field] = val
+        update_rows("farmers", "farmer_id", fid, changes)
         print("Farmer updated.")
     else:
         print("Invalid farmer_id.")
@@ -498,26 +673,48 @@ def delete_farmer():
     print_table(farmers)
     fid = input("Enter farmer_id to delete: ").strip()
     if (farmers["farmer_id"].astype(str) == fid).any():
-        farmers = farmers[farmers["farmer_id"].astype(str) != fid]
-        save_farmers(farmers)
+        delete_rows("farmers", "farmer_id", fid)
         print("Farmer deleted.")
     else:
         print("Invalid farmer_id.")
 
+def choose_crop_name(text):
+    """Turn what the farmer typed into a catalog crop name, asking when it's only a close match"""
+    catalog = get_catalog()
+    if text in catalog:
+        return catalog.get(text)["Crop Name"]
+
+    suggestions = catalog.suggest(text)
+    if not suggestions:
+        print(f"❌ Crop '{text}' not found in our database. Please choose from the available list.")
+        return None
+    if suggestions[0]["score"] == 1.0:  # a spacing variant or a local name, e.g. "sugar cane" or "bhindi"
+        print(f"✔️  Using '{suggestions[0]['Crop Name']}' for '{text}'.")
+        return suggestions[0]["Crop Name"]
+
+    print(f"Crop '{text}' not found. Did you mean:")
+    for idx, suggestion in enumerate(suggestions, 1):
+        print(f"{idx}. {suggestion['Crop Name']}")
+    choice = input("Enter a number, or press Enter to cancel: ").strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(suggestions):
+        return suggestions[int(choice) - 1]["Crop Name"]
+    return None
+
 def add_crop_with_profit(user):
     print("\n--- Add Crop with Profit Calculation ---")
     display_available_crops()
     
-    available_crops = CROP_PROFIT_DATA["Crop Name"].tolist()
+    available_crops = get_catalog().names
     print(f"\nAvailable crop choices: {', '.join(available_crops)}")
     
     crop = input("\nEnter crop name from the list above: ").strip()
-    crop_data = CROP_PROFIT_DATA[CROP_PROFIT_DATA["Crop Name"].astype(str).str.lower() == crop.lower()]
-    if crop_data.empty:
-        print(f"❌ Crop '{crop}' not found in our database. Please choose from the available list.")
+    crop = choose_crop_name(crop)
+    if crop is None:
         return
+    crop_data = get_catalog().get(crop)
 
-    profit_per_acre = crop_data.iloc[0]["Profit Per Acre"]
+    crop = crop_data["Crop Name"]
+    profit_per_acre = crop_data["Profit Per Acre"]
     try:
         field_size = float(input("Enter field size (in acres): ").strip())
         if field_size <= 0:
@@ -540,10 +737,6 @@ def add_crop_with_profit(user):
     print("="*50)
     
   
-    if not os.path.exists(FARMER_CROPS_CSV):
-        with open(FARMER_CROPS_CSV, "w", encoding="utf-8") as f:
-            f.write("username,Crop Name,Field Size (acres),Profit Per Acre,Estimated Profit\n")
-    df = pd.read_csv(FARMER_CROPS_CSV)
     new_row = {
         "username": user["username"],
         "Crop Name": crop,
@@ -551,8 +744,7 @@ def add_crop_with_profit(user):
         "Profit Per Acre": profit_per_acre,
         "Estimated Profit": total_profit
     }
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    df.to_csv(FARMER_CROPS_CSV, index=False)
+    insert_row("farmer_crops", new_row)
     
     print(f"\n✅ Crop '{crop}' added with profit calculation saved!")
 
@@ -569,17 +761,6 @@ def add_crop_record():
     """Admin: Add a new crop record directly to crop_details.csv and crop_profit_data.csv"""
     print("\n--- Add New Crop Record ---")
 
-  
-    try:
-        crop_details = pd.read_csv(CROP_DETAILS_CSV)
-    except FileNotFoundError:
-        crop_details = pd.DataFrame(columns=["Crop Name", "Description"])
-
-    try:
-        crop_profit = pd.read_csv(CROP_PROFIT_CSV)
-    except FileNotFoundError:
-        crop_profit = pd.DataFrame(columns=["Crop Name", "Profit Per Acre", "Season"])
-
     crop_name = input("Crop Name: ").strip()
     description = input("Description: ").strip()
 
@@ -594,29 +775,22 @@ def add_crop_record():
     season = input("Season: ").strip()
 
  
-    new_details = {"Crop Name": crop_name, "Description": description}
-    crop_details = pd.concat([crop_details, pd.DataFrame([new_details])], ignore_index=True)
-
-    new_profit = {"Crop Name": crop_name, "Profit Per Acre": profit_per_acre, "Season": season}
-    crop_profit = pd.concat([crop_profit, pd.DataFrame([new_profit])], ignore_index=True)
-
-    crop_details.to_csv(CROP_DETAILS_CSV, index=False)
-    crop_profit.to_csv(CROP_PROFIT_CSV, index=False)
+    insert_row("crop_details", {"Crop Name": crop_name, "Description": description})
+    insert_row("crop_profit", {"Crop Name": crop_name, "Profit Per Acre": profit_per_acre, "Season": season})
+    reload_catalog()
 
     print(f"✅ Crop '{crop_name}' added successfully!")
 
 
 def update_crop():
     """Admin: Update an existing crop record in crop_details.csv and crop_profit_data.csv"""
-    try:
-        crop_details = pd.read_csv(CROP_DETAILS_CSV)
-    except FileNotFoundError:
+    crop_details = load_crop_details()
+    if crop_details.empty:
         print("❌ No crop details found.")
         return
 
-    try:
-        crop_profit = pd.read_csv(CROP_PROFIT_CSV)
-    except FileNotFoundError:
+    crop_profit = load_crop_profit()
+    if crop_profit.empty:
         print("❌ No crop profit data found.")
         return
 
@@ -639,28 +813,32 @@ def update_crop():
     cur_desc = crop_details.at[choice_idx, "Description"]
     desc = input(f"Description [{cur_desc}]: ").strip()
     if desc:
-        crop_details.at[choice_idx, "Description"] = desc
+        update_rows("crop_details", "Crop Name", crop_name_old, {"Description": desc})
 
     profit_idx = crop_profit.index[crop_profit["Crop Name"] == crop_name_old][0]
     cur_profit = crop_profit.at[profit_idx, "Profit Per Acre"]
     cur_season = crop_profit.at[profit_idx, "Season"]
 
+    profit_changes = {}
     val_profit = input(f"Profit Per Acre [{cur_profit}]: ").strip()
     if val_profit:
         try:
-            val_profit = float(val_profit)
-            crop_profit.at[profit_idx, "Profit Per Acre"] = val_profit
+            profit_changes["Profit Per Acre"] = float(val_profit)
         except ValueError:
             print("❌ Invalid number! Profit not updated.")
 
     val_season = input(f"Season [{cur_season}]: ").strip()
     if val_season:
-        crop_profit.at[profit_idx, "Season"] = val_season
+        profit_changes["Season"] = val_season
 
-    crop_details.to_csv(CROP_DETAILS_CSV, index=False)
-    crop_profit.to_csv(CROP_PROFIT_CSV, index=False)
+    update_rows("crop_profit", "Crop Name", crop_name_old, profit_changes)
+    if "Profit Per Acre" in profit_changes:
+        record_price_change(crop_name_old, cur_profit, profit_changes["Profit Per Acre"])
+    reload_catalog()
+    if "Profit Per Acre" in profit_changes:
+        reprice_crops_in_background({crop_name_old: profit_changes["Profit Per Acre"]})
 
-    print(f"✅ Crop '{crop_details.at[choice_idx, 'Crop Name']}' updated successfully!")
+    print(f"✅ Crop '{crop_name_old}' updated successfully!")
 
 
 """def delete_crop():
@@ -681,14 +859,13 @@ def update_crop():
 
 def save_crop_files(crops_df):
     """Save crops to both crop_details and crop_profit CSVs."""
-    global CROP_PROFIT_DATA 
-    crops_df.to_csv(CROP_DETAILS_CSV, index=False)
+    save_crop_details(crops_df)
     profit_cols = ["crop_id", "crop_name", "price_per_quintal"]
     if all(col in crops_df.columns for col in profit_cols):
-        CROP_PROFIT_DATA = crops_df[profit_cols].copy()
-        CROP_PROFIT_DATA.to_csv(CROP_PROFIT_CSV, index=False)
+        save_crop_profit(crops_df[profit_cols].copy())
     else:
         print("⚠️ Some columns missing for profit CSV. Skipping profit update.")
+    reload_catalog()
 
 # ================= User Management Functions =================
 def view_users():
@@ -701,8 +878,7 @@ def view_users():
     print_table(display_df)
 
 def update_user():
-    users = load_users()
-    if users.empty:
+    if count_rows("users") == 0:
         print("No users to update.")
         return
 
@@ -710,44 +886,44 @@ def update_user():
     view_users()
     username = input("\nEnter username to update: ").strip()
     
-    if username not in users["username"].values:
+    user_row = find_user(username)
+    if user_row is None:
         print(f"❌ User '{username}' not found!")
         return
     
-    idx = users.index[users["username"] == username][0]
+    changes = {}
     print("\nLeave blank to keep existing value.")
 
-    new_username = input(f"Username [{users.at[idx, 'username']}]: ").strip()
+    new_username = input(f"Username [{user_row['username']}]: ").strip()
     if new_username:
-        if new_username in users["username"].values and new_username != users.at[idx, "username"]:
+        if new_username != user_row["username"] and user_exists(new_username):
             print("❌ Username already exists!")
             return
-        users.at[idx, "username"] = new_username
+        changes["username"] = new_username
 
     new_password = input("Password [hidden]: ").strip()
     if new_password:
         phash, salt = hash_password(new_password)
-        users.at[idx, "password_hash"] = phash
-        users.at[idx, "salt"] = salt
+        changes["password_hash"] = phash
+        changes["salt"] = salt
 
-    current_role = users.at[idx, "role"]
+    current_role = user_row["role"]
     new_role = input(f"Role [{current_role}]: ").strip()
     if new_role:
         if new_role.lower() not in ["admin", "farmer"]:
             print("❌ Invalid role.")
             return
-        users.at[idx, "role"] = new_role
+        changes["role"] = new_role
 
-    new_name = input(f"Name [{users.at[idx, 'name']}]: ").strip()
+    new_name = input(f"Name [{user_row['name']}]: ").strip()
     if new_name:
-        users.at[idx, "name"] = new_name
+        changes["name"] = new_name
 
-    save_users(users)
+    update_rows("users", "user_id", user_row["user_id"], changes)
     print(f"✅ User '{username}' updated successfully!")
 
 def delete_user():
-    users = load_users()
-    if users.empty:
+    if count_rows("users") == 0:
         print("No users to delete.")
         return
 
@@ -755,15 +931,14 @@ def delete_user():
     view_users()
     username = input("\nEnter username to delete: ").strip()
     
-    if username not in users["username"].values:
+    if not user_exists(username):
         print(f"❌ User '{username}' not found!")
         return
         
     confirm = input(f"Are you sure you want to delete user '{username}'? (yes/no): ").strip().lower()
     
     if confirm == "yes":
-        users = users[users["username"] != username]
-        save_users(users)
+        delete_rows("users", "username", username)
         print(f"✅ User '{username}' deleted successfully!")
     else:
         print("Deletion cancelled.")
@@ -778,16 +953,19 @@ def user_management_menu():
         
         choice = input("Enter your choice: ").strip()
         
-        if choice == "1":
-            view_users()
-        elif choice == "2":
-            update_user()
-        elif choice == "3":
-            delete_user()
-        elif choice == "0":
-            break
-        else:
-            print("❌ Invalid choice!")
+        try:
+            if choice == "1":
+                view_users()
+            elif choice == "2":
+                update_user()
+            elif choice == "3":
+                delete_user()
+            elif choice == "0":
+                break
+            else:
+                print("❌ Invalid choice!")
+        except WriteConflictError as e:  # someone else saved the table; their changes are kept
+            print(f"❌ {e}")
         pause()
 
 # ================= Client/Farmer Functions =================
@@ -797,6 +975,7 @@ def upsert_my_record(user):
     
     if not farmers.empty and mask.any():
         idx = farmers.index[mask][0]
+        changes = {}
         print("Updating your existing record. Leave blank to keep current value.")
         for field in ["name", "location", "contact"]:
             cur = farmers.at[idx, field]
@@ -809,9 +988,8 @@ def upsert_my_record(user):
             else:
                 val = input(f"{field} [{cur}]: ").strip()
             if val:
-                farmers.at[idx, field] = val
-
-
+                changes[field] = val
+        update_rows("farmers", "farmer_id", farmers.at[idx, "farmer_id"], changes)
 
     else:
         print("Creating your crop record.")
@@ -823,7 +1001,7 @@ def upsert_my_record(user):
                 break
             print("❌ Invalid contact number! Please enter exactly 10 digits.")
 
-        farmer_id = next_id(farmers, "farmer_id")
+        farmer_id = allocate_id("farmer_id")
         new_row = {
             "farmer_id": farmer_id,
             "username": user["username"],
@@ -831,9 +1009,8 @@ def upsert_my_record(user):
             "location": location,
             "contact": contact
         }
-        farmers = pd.concat([farmers, pd.DataFrame([new_row])], ignore_index=True)
+        insert_row("farmers", new_row)
     
-    save_farmers(farmers)
     print("Saved!")
 
 def delete_my_account(user):
@@ -843,29 +1020,15 @@ def delete_my_account(user):
         print("Cancelled.")
         return
 
-    users = load_users()
-    users = users[users["username"] != user["username"]]
-    save_users(users)
-
-    farmers = load_farmers()
-    farmers = farmers[farmers["username"] != user["username"]]
-    save_farmers(farmers)
-
-    if os.path.exists(FARMER_CROPS_CSV):
-        df = pd.read_csv(FARMER_CROPS_CSV)
-        df = df[df["username"] != user["username"]]
-        df.to_csv(FARMER_CROPS_CSV, index=False)
+    delete_rows("users", "username", user["username"])
+    delete_rows("farmers", "username", user["username"])
+    delete_rows("farmer_crops", "username", user["username"])
 
     print("✅ Your account and all associated data have been deleted. Logging out...")
     sys.exit()
 
 def delete_my_record(user):
-    if not os.path.exists(FARMER_CROPS_CSV):
-        print("No crop records found.")
-        return
-    df = pd.read_csv(FARMER_CROPS_CSV)
-    df['username'] = df['username'].astype(str)
-    my_crops = df[df["username"] == user["username"]]
+    my_crops = load_farmer_crops(user["username"])
     if my_crops.empty:
         print("No crops found for you.")
         return
@@ -879,8 +1042,7 @@ def delete_my_record(user):
         print("Cancelled.")
         return
     elif ans == 'all':
-        df = df[df["username"] != user["username"]]
-        df.to_csv(FARMER_CROPS_CSV, index=False)
+        delete_rows("farmer_crops", "username", user["username"])
         print("All your crops have been deleted.")
         return
     else:
@@ -890,15 +1052,7 @@ def delete_my_record(user):
                 print("Invalid crop number.")
                 return
             row_to_delete = my_crops.iloc[idx]
-            match = (
-                (df["username"] == user["username"]) &
-                (df["Crop Name"] == row_to_delete["Crop Name"]) &
-                (df["Field Size (acres)"] == row_to_delete["Field Size (acres)"]) &
-                (df["Profit Per Acre"] == row_to_delete["Profit Per Acre"]) &
-                (df["Estimated Profit"] == row_to_delete["Estimated Profit"])
-            )
-            df = df[~match]
-            df.to_csv(FARMER_CROPS_CSV, index=False)
+            delete_crop_record(row_to_delete["record_id"], user["username"])
             print(f"Crop '{row_to_delete['Crop Name']}' deleted.")
         except Exception:
             print("Invalid input. Cancelled.")
@@ -908,16 +1062,31 @@ def reports_menu():
         print("\n=== Reports & Analytics ===")
         print("1. Export Farmer Crops Report (CSV/Excel)")
         print("2. Profit Summary Dashboard")
+        print("3. Crop Price History")
+        print("4. Profit by Season / Location / Crop")
+        print("5. Top Crops by Season / Location")
+        print("6. Approximate Portal Stats (fast)")
         print("0. Back to Admin Menu")
         choice = input("Enter your choice: ").strip()
         if choice == "1":
             export_farmer_crops()
         elif choice == "2":
             profit_summary_dashboard()
+        elif choice == "3":
+            crop_price_history()
+        elif choice == "4":
+            profit_cube_report()
+        elif choice == "5":
+            top_crops_report()
+        elif choice == "6":
+            approximate_portal_stats()
         elif choice == "0":
             break
         else:
             print("❌ Invalid choice!")
+        peak = peak_rss_mb()
+        if peak is not None:
+            print(f"(peak memory use so far: {peak:,.0f} MB)")
         pause()
 
 
@@ -937,27 +1106,30 @@ def admin_menu(user):
         
         choice = input("Enter your choice: ").strip()
         
-        if choice == "1":
-            register_farmer()
-        elif choice == "2":
-            view_farmers()
-        elif choice == "3":
-            update_farmer()
-        elif choice == "4":
-            delete_farmer()
-        elif choice == "5":
-            user_management_menu()  
-        elif choice == "6":
-            view_crop_information()  
-        elif choice == "7":
-            update_crop_profit_data_only()
-        elif choice == "8":
-            reports_menu()  
-        elif choice == "0":
-            print("👋 Logging out...")
-            break
-        else:
-            print("❌ Invalid choice!")
+        try:
+            if choice == "1":
+                register_farmer()
+            elif choice == "2":
+                view_farmers()
+            elif choice == "3":
+                update_farmer()
+            elif choice == "4":
+                delete_farmer()
+            elif choice == "5":
+                user_management_menu()  
+            elif choice == "6":
+                view_crop_information()  
+            elif choice == "7":
+                update_crop_profit_data_only()
+            elif choice == "8":
+                reports_menu()  
+            elif choice == "0":
+                print("👋 Logging out...")
+                break
+            else:
+                print("❌ Invalid choice!")
+        except WriteConflictError as e:  # someone else saved the table; their changes are kept
+            print(f"❌ {e}")
         pause()
 
 
@@ -974,29 +1146,35 @@ def farmer_menu(user):
         print("5. Delete My Crop Record")
         print("6. Update My Personal Record (name, location, contact)")
         print("7. Delete My Account")
+        print("8. Search Crop Descriptions")
         print("0. Logout")
         
         choice = input("Enter your choice: ").strip()
         
-        if choice == "1":
-            view_crop_information()
-        elif choice == "2":
-            search_and_filter_crops()
-        elif choice == "3":
-            add_crop_with_profit(user)  
-        elif choice == "4":
-            view_my_crops(user) 
-        elif choice == "5":
-            delete_my_record(user)  
-        elif choice == "6":
-            upsert_my_record(user)  
-        elif choice == "7":
-            delete_my_account(user)  
-        elif choice == "0":
-            print("👋 Logging out...")
-            break
-        else:
-            print("❌ Invalid choice!")
+        try:
+            if choice == "1":
+                view_crop_information()
+            elif choice == "2":
+                search_and_filter_crops()
+            elif choice == "3":
+                add_crop_with_profit(user)  
+            elif choice == "4":
+                view_my_crops(user) 
+            elif choice == "5":
+                delete_my_record(user)  
+            elif choice == "6":
+                upsert_my_record(user)  
+            elif choice == "7":
+                delete_my_account(user)  
+            elif choice == "8":
+                search_crop_descriptions()
+            elif choice == "0":
+                print("👋 Logging out...")
+                break
+            else:
+                print("❌ Invalid choice!")
+        except WriteConflictError as e:  # someone else saved the table; their changes are kept
+            print(f"❌ {e}")
         pause()
 
 
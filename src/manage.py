@@ -0,0 +1,236 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import report_engine
+import sketches
+import storage
+import streaming
+from crop_catalog import get_catalog
+
+# ================= Maintenance Commands =================
+# Usage: python src/manage.py <command>
+
+def cmd_migrate_sqlite(args):
+    counts = storage.migrate_csv_to_sqlite()
+    for table, n in counts.items():
+        print(f"✅ {table}: {n} rows copied")
+    print(f"SQLite database written to {storage.SQLITE_DB}")
+    print("Set CROP_PORTAL_BACKEND=sqlite to use it.")
+
+
+def cmd_migrate_parquet(args):
+    counts = storage.migrate_csv_to_parquet()
+    for table, n in counts.items():
+        print(f"✅ {table}: {n} rows converted")
+    print(f"Parquet tables written to {storage.PARQUET_DIR}")
+    print("Set CROP_PORTAL_BACKEND=parquet to use them.")
+
+
+def cmd_export_csv(args):
+    counts = storage.export_parquet_to_csv()
+    for table, n in counts.items():
+        print(f"✅ {table}: {n} rows written to CSV")
+
+
+def cmd_compact(args):
+    dropped = storage.compact_crops()
+    print(f"✅ farmer_crops compacted, {dropped} deleted rows removed.")
+
+
+def cmd_backfill_record_ids(args):
+    filled = storage.backfill_record_ids()
+    print(f"✅ {filled} farmer_crops rows given a record_id.")
+
+
+def cmd_partition_crops(args):
+    moved = storage.partition_crops()
+    print(f"✅ {moved} farmer_crops rows moved into {storage.FARMER_CROPS_DIR}")
+
+
+def _totals_differ(stored: list, rebuilt: list) -> bool:
+    return any(abs(a - b) > 1e-6 * max(1.0, abs(b)) for a, b in zip(stored, rebuilt))
+
+
+def cmd_rebuild_aggregates(args):
+    """Recompute the farmer_crops aggregates from scratch, reporting any drift in the stored ones."""
+    if storage.use_sqlite():
+        print("The sqlite backend computes farmer_crops totals with GROUP BY; there is nothing to rebuild.")
+        return
+    stored = storage.stored_aggregates()
+    rebuilt = storage.rebuild_aggregates()
+    if stored is None:
+        print("Stored aggregates were missing or out of date.")
+    else:
+        pairs = [(f"{scope} {key}", stored[scope].get(key, [0, 0, 0]), rebuilt[scope].get(key, [0, 0, 0]))
+                 for scope in ("farmers", "crops") for key in stored[scope].keys() | rebuilt[scope].keys()]
+        pairs.append(("portal", stored["portal"], rebuilt["portal"]))
+        drift = [(label, old, new) for label, old, new in pairs if _totals_differ(old, new)]
+        for label, old, new in drift:
+            print(f"⚠️ {label}: stored {old}, recomputed {new}")
+        if not drift:
+            print("Stored aggregates matched a full recompute.")
+    profit, acres, records = rebuilt["portal"]
+    print(f"✅ Aggregates rebuilt: {len(rebuilt['farmers'])} farmers, {len(rebuilt['crops'])} crops, "
+          f"{records} records, {acres:,.2f} acres, ₹{profit:,.2f} expected profit.")
+
+
+def _exact_sketch_answers() -> tuple:
+    """Distinct farmers per crop, Estimated Profit values and acreage per crop, computed exactly from one scan."""
+    pairs, profits, acres = [], [], []
+    for chunk in storage.iter_crops(columns=sketches.CropSketches.COLUMNS):
+        crops = pd.Series(sketches.crop_labels(chunk["Crop Name"]), index=chunk.index)
+        usernames = chunk["username"].astype(object).where(chunk["username"].notna(), "").astype(str).str.strip()
+        pairs.append(pd.DataFrame({"Crop Name": crops, "username": usernames}).drop_duplicates())
+        profits.append(pd.to_numeric(chunk["Estimated Profit"], errors="coerce").dropna().to_numpy())
+        acres.append(pd.to_numeric(chunk["Field Size (acres)"], errors="coerce").where(lambda a: a > 0)
+                     .groupby(crops).sum())
+    if not pairs:
+        return pd.Series(dtype="int64"), np.empty(0), pd.Series(dtype="float64")
+    farmers = pd.concat(pairs).drop_duplicates().groupby("Crop Name").size()
+    return farmers, np.sort(np.concatenate(profits)), pd.concat(acres).groupby(level=0).sum()
+
+
+def cmd_rebuild_sketches(args):
+    """Rebuild the approximate farmer_crops sketches; with --check, compare their answers with exact ones."""
+    built = storage.rebuild_sketches()
+    print(f"✅ Sketches rebuilt from {built.rows:,} records.")
+    if not args.check:
+        return
+    farmers, profits, acres = _exact_sketch_answers()
+    estimates = built.distinct_farmers().set_index("Crop Name")["Farmers"]
+    errors = (estimates.reindex(farmers.index).fillna(0) / farmers - 1).abs()
+    if len(errors):
+        worst = errors.idxmax()
+        print(f"Distinct farmers per crop: worst error {errors[worst]:.2%} ({worst}: ~{estimates.get(worst, 0):,} "
+              f"vs {farmers[worst]:,}); typical error ±{built.farmers.relative_error:.1%}")
+    for name, value in built.profit_quantiles().items():
+        if len(profits) and not np.isnan(value):
+            rank = np.searchsorted(profits, value, side="right") / len(profits)
+            print(f"Estimated Profit {name}: ₹{value:,.2f} sits at rank {rank:.2%} "
+                  f"(bound ±{built.profit.rank_error:.1%})")
+    for crop, weight, error in built.acreage.top(5):
+        print(f"Acreage {crop}: ~{weight:,.2f} vs {acres.get(crop, 0.0):,.2f} exact (may overcount by {error:,.2f})")
+
+
+def cmd_bench_reports(args):
+    """Time the per-farmer and per-crop summaries over a synthetic farmer_crops log: streamed in this process
+    (with its peak memory), loaded whole, and on the process pool at several worker counts."""
+    rng = np.random.default_rng(0)
+    crops = get_catalog().names or ["Rice", "Wheat", "Maize"]
+    columns = storage.TABLES["farmer_crops"][1]
+    groupings = [("username",), ("Crop Name",)]
+    dtypes = {col: storage.SCHEMAS["farmer_crops"].get(col, str) for col in ["Crop Name", "username"]}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "farmer_crops.csv")
+        print(f"Writing {args.rows:,} synthetic records...")
+        for start in range(0, args.rows, storage.STREAM_CHUNK_ROWS):
+            n = min(storage.STREAM_CHUNK_ROWS, args.rows - start)
+            sizes = rng.integers(1, 100, n).astype("float64")
+            prices = rng.integers(5_000, 100_000, n).astype("float64")
+            pd.DataFrame({
+                "record_id": np.arange(start + 1, start + n + 1),
+                "username": np.char.add("farmer", rng.integers(0, args.farmers, n).astype(str)),
+                "Crop Name": rng.choice(crops, n),
+                "Field Size (acres)": sizes, "Profit Per Acre": prices, "Estimated Profit": sizes * prices,
+            }, columns=columns).to_csv(path, mode="a" if start else "w", header=not start, index=False)
+        tasks = report_engine.plan_csv([path], {}, storage.REPORT_CHUNK_BYTES)
+        print(f"{os.path.getsize(path) / 2**20:,.0f} MB in {len(tasks)} chunks, {os.cpu_count()} CPUs\n")
+
+        # streamed first, so its peak memory isn't masked by the whole-table load below
+        started = time.perf_counter()
+        folds = {keys: streaming.Sum(report_engine.MEASURES[0], keys) for keys in groupings}
+        streaming.fold(pd.read_csv(path, usecols=["username", "Crop Name"] + report_engine.MEASURES, dtype=dtypes,
+                                   chunksize=storage.STREAM_CHUNK_ROWS), folds)
+        print(f"{'streamed':>16}: {time.perf_counter() - started:6.2f}s  "
+              f"peak {streaming.peak_rss_mb() or 0:,.0f} MB ({storage.STREAM_CHUNK_ROWS:,}-row chunks)")
+
+        started = time.perf_counter()
+        frame = pd.read_csv(path, usecols=["username", "Crop Name"] + report_engine.MEASURES, dtype=dtypes)
+        expected = [frame.groupby(list(keys), observed=True)[report_engine.MEASURES].sum() for keys in groupings]
+        baseline = time.perf_counter() - started
+        print(f"{'single groupby':>16}: {baseline:6.2f}s  peak {streaming.peak_rss_mb() or 0:,.0f} MB")
+        del frame
+
+        columns = sorted({key for keys in groupings for key in keys}) + report_engine.MEASURES
+        first = None
+        for workers in args.workers:
+            report_engine.run(tasks[:workers], groupings, columns, dtypes, workers)  # start the pool
+            started = time.perf_counter()
+            totals = report_engine.run(tasks, groupings, columns, dtypes, workers)
+            elapsed = time.perf_counter() - started
+            first = first or elapsed
+            same = all(np.allclose(t.set_index(list(keys))[report_engine.MEASURES].to_numpy(), e.to_numpy())
+                       for t, e, keys in zip(totals, expected, groupings))
+            print(f"{workers:>8} workers: {elapsed:6.2f}s  x{first / elapsed:4.1f}  {'✅' if same else '❌ totals differ'}")
+
+
+def cmd_import_crops(args):
+    """Bulk-add farmer crop records from a CSV with username, Crop Name and Field Size (acres) columns.
+
+    Free-text crop names are mapped to catalog names (typos, spacing and local
+    aliases are fine); rows whose name can't be resolved are listed and skipped.
+    """
+    catalog = get_catalog()
+    incoming = pd.read_csv(args.path, dtype=str, keep_default_na=False)
+    rows, skipped = [], 0
+    for line, record in enumerate(incoming.to_dict("records"), start=2):
+        crop = catalog.resolve(record.get("Crop Name", ""))
+        try:
+            field_size = float(record.get("Field Size (acres)", ""))
+        except ValueError:
+            field_size = None
+        if crop is None or field_size is None or not record.get("username"):
+            skipped += 1
+            hint = ""
+            if crop is None:
+                hint = ", ".join(s["Crop Name"] for s in catalog.suggest(record.get("Crop Name", ""), limit=3))
+            print(f"⚠️  line {line}: skipped {record}" + (f" (did you mean: {hint}?)" if hint else ""))
+            continue
+        profit_per_acre = float(catalog.get(crop)["Profit Per Acre"])
+        rows.append({"username": record["username"], "Crop Name": crop, "Field Size (acres)": field_size,
+                     "Profit Per Acre": profit_per_acre, "Estimated Profit": profit_per_acre * field_size})
+    if rows:
+        storage.insert_rows("farmer_crops", rows)
+    print(f"✅ {len(rows)} farmer_crops rows imported, {skipped} skipped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crop portal data maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("migrate-sqlite", help="copy all CSV tables into data/portal.db").set_defaults(func=cmd_migrate_sqlite)
+    sub.add_parser("migrate-parquet", help="convert all CSV tables into data/parquet/").set_defaults(
+        func=cmd_migrate_parquet)
+    sub.add_parser("export-csv", help="write the data/parquet/ tables back out as CSV").set_defaults(
+        func=cmd_export_csv)
+    sub.add_parser("compact", help="fold deleted farmer_crops rows into the CSV").set_defaults(func=cmd_compact)
+    sub.add_parser("backfill-record-ids", help="assign record_id to farmer_crops rows that lack one").set_defaults(
+        func=cmd_backfill_record_ids)
+    sub.add_parser("partition-crops", help="split farmer_crops.csv into one file per farmer").set_defaults(
+        func=cmd_partition_crops)
+    sub.add_parser("rebuild-aggregates", help="recompute the farmer_crops profit totals and check the stored ones").set_defaults(
+        func=cmd_rebuild_aggregates)
+    sketch_parser = sub.add_parser("rebuild-sketches", help="rebuild the approximate farmer_crops sketches")
+    sketch_parser.add_argument("--check", action="store_true", help="compare the sketch answers with exact ones")
+    sketch_parser.set_defaults(func=cmd_rebuild_sketches)
+    bench_parser = sub.add_parser("bench-reports", help="time the parallel report engine on synthetic data")
+    bench_parser.add_argument("--rows", type=int, default=2_000_000, help="synthetic farmer_crops records")
+    bench_parser.add_argument("--farmers", type=int, default=20_000, help="distinct usernames")
+    bench_parser.add_argument("--workers", type=lambda s: [int(w) for w in s.split(",")], default=[1, 2, 4, 8],
+                              help="comma-separated worker counts, e.g. 1,2,4")
+    bench_parser.set_defaults(func=cmd_bench_reports)
+    import_parser = sub.add_parser("import-crops", help="bulk-add farmer crop records from a CSV, normalizing crop names")
+    import_parser.add_argument("path", help="CSV with username, Crop Name and Field Size (acres) columns")
+    import_parser.set_defaults(func=cmd_import_crops)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import re
+from difflib import SequenceMatcher
+
+# ----------------- Crop Name Resolution -----------------
+# Maps free-text crop names ("wheet", "sugar cane", "bhindi") to catalog names.
+# Names and aliases are compared on a key with case, spaces and punctuation
+# removed. Exact keys are a dict lookup; anything else is looked up by shared
+# character trigrams and the best few candidates are re-scored with difflib.
+
+# A suggestion scoring at least this is taken as the answer by resolve().
+RESOLVE_MIN_SCORE = 0.75
+
+# Suggestions below this are too far off to show.
+SUGGEST_MIN_SCORE = 0.5
+
+# How many trigram candidates are re-scored per query.
+CANDIDATES = 20
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+def name_key(text) -> str:
+    """'Sugar-Cane ' -> 'sugarcane'"""
+    return _NON_ALNUM.sub("", str(text).lower())
+
+def trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Trigram index over crop names and their aliases."""
+
+    def __init__(self, names, aliases: dict | None = None):
+        """`names` are the catalog names; `aliases` maps other spellings to one of them."""
+        self.entries = []       # entry id -> (key, crop name, text it was indexed from)
+        self._exact = {}        # key -> crop name
+        self._postings = {}     # trigram -> [entry id, ...]
+        canonical = {name_key(name): name for name in names}
+        pairs = [(name, name) for name in names]
+        pairs += [(alias, canonical.get(name_key(name))) for alias, name in (aliases or {}).items()]
+        for text, name in pairs:
+            key = name_key(text)
+            if not key or name is None or key in self._exact:
+                continue
+            self._exact[key] = name
+            entry_id = len(self.entries)
+            self.entries.append((key, name, text))
+            for gram in trigrams(key):
+                self._postings.setdefault(gram, []).append(entry_id)
+
+    def exact(self, text) -> str | None:
+        """The crop `text` names exactly (ignoring case, spaces and punctuation), or None."""
+        return self._exact.get(name_key(text))
+
+    def suggest(self, text, limit: int = 5, min_score: float = SUGGEST_MIN_SCORE) -> list:
+        """Closest crops to `text` as [{"Crop Name", "score", "matched"}], best first, one entry per crop.
+
+        "matched" is the name or alias that was closest; an exact match scores 1.0.
+        """
+        key = name_key(text)
+        if not key:
+            return []
+        shared = {}
+        for gram in trigrams(key):
+            for entry_id in self._postings.get(gram, ()):
+                shared[entry_id] = shared.get(entry_id, 0) + 1
+        candidates = sorted(shared, key=shared.get, reverse=True)[:CANDIDATES]
+
+        best = {}
+        for entry_id in candidates:
+            entry_key, name, matched = self.entries[entry_id]
+            score = 1.0 if entry_key == key else SequenceMatcher(None, key, entry_key).ratio()
+            if score >= min_score and score > best.get(name, (0.0, None))[0]:
+                best[name] = (score, matched)
+        ranked = sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        return [{"Crop Name": name, "score": round(score, 3), "matched": matched}
+                for name, (score, matched) in ranked]
+
+    def resolve(self, text, min_score: float = RESOLVE_MIN_SCORE) -> str | None:
+        """The crop `text` most likely means, or None if nothing is close enough to pick without asking."""
+        name = self.exact(text)
+        if name is not None:
+            return name
+        suggestions = self.suggest(text, limit=1, min_score=min_score)
+        return suggestions[0]["Crop Name"] if suggestions else None
@@ -0,0 +1,144 @@
+import os
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# ----------------- Parquet Storage Engine -----------------
+# Used by storage.py when CROP_PORTAL_BACKEND=parquet. Each table is a directory
+# of Parquet part files: inserts add a small part, rewrites replace them all with
+# one part split into row groups. Reads only decode the requested columns and
+# skip row groups whose min/max statistics can't match the filters.
+
+ROW_GROUP_SIZE = 10_000
+
+# Parts are merged back into one file once an insert pushes a table past this many.
+MAX_PARTS = 64
+
+ARROW_TYPES = {"Int64": pa.int64(), "float64": pa.float64()}
+
+
+def table_dir(root: str, table: str) -> str:
+    return os.path.join(root, table)
+
+
+def _parts(root: str, table: str) -> list:
+    path = table_dir(root, table)
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".parquet"))
+
+
+def _part_name() -> str:
+    # Zero-padded time first, so sorting the names gives insertion order.
+    return f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet"
+
+
+def _schema(columns: list, dtypes: dict) -> pa.Schema:
+    """Arrow schema for a table. Category and undeclared columns are stored as plain strings."""
+    return pa.schema([(c, ARROW_TYPES.get(dtypes.get(c), pa.string())) for c in columns])
+
+
+def _to_arrow(df: pd.DataFrame, columns: list, dtypes: dict) -> pa.Table:
+    schema = _schema(columns, dtypes)
+    df = df.reindex(columns=columns)
+    arrays = []
+    for field in schema:
+        col = df[field.name]
+        if pa.types.is_string(field.type):
+            values = [None if pd.isna(v) else str(v) for v in col.tolist()]
+        else:
+            values = [None if pd.isna(v) else v for v in pd.to_numeric(col, errors="coerce").tolist()]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _write_part(root: str, table: str, frame: pa.Table) -> str:
+    """Write `frame` as a new part. It only gets its .parquet name once complete, so readers never see half a file."""
+    path = os.path.join(table_dir(root, table), _part_name())
+    pq.write_table(frame, path + ".tmp", row_group_size=ROW_GROUP_SIZE)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def ensure_tables(root: str, tables: dict):
+    """Create a directory for every table in `tables` ({name: columns})."""
+    for table in tables:
+        os.makedirs(table_dir(root, table), exist_ok=True)
+
+
+def read_table(root: str, table: str, columns: list, dtypes: dict, filters: list | None = None) -> pd.DataFrame:
+    """Read `columns` of a table, keeping only rows that match pyarrow-style `filters`.
+
+    If a concurrent rewrite swaps the parts while they are being read, the read is retried.
+    """
+    while True:
+        parts = _parts(root, table)
+        if not parts:
+            return _schema(columns, dtypes).empty_table().to_pandas()
+        try:
+            frame = pq.read_table(parts, columns=columns, filters=filters or None)
+        except FileNotFoundError:
+            continue
+        if _parts(root, table) == parts:
+            return frame.to_pandas()
+
+
+def part_paths(root: str, table: str) -> list:
+    """The table's part files in insertion order."""
+    return _parts(root, table)
+
+
+def iter_table(root: str, table: str, columns: list, chunk_rows: int):
+    """Yield `columns` of a table in frames of up to chunk_rows, one record batch in memory at a time.
+
+    Every part is opened before the first batch is read, so a concurrent rewrite
+    can't swap parts out from under the scan.
+    """
+    while True:
+        try:
+            files = [pq.ParquetFile(part) for part in _parts(root, table)]
+            break
+        except FileNotFoundError:
+            continue
+    for part in files:
+        for batch in part.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+
+
+def table_version(root: str, table: str) -> tuple:
+    """Changes whenever a part is added or replaced; part names are never reused."""
+    return tuple(os.path.basename(part) for part in _parts(root, table))
+
+
+def count_rows(root: str, table: str) -> int:
+    """Row count from the part footers, without reading any column data."""
+    return sum(pq.ParquetFile(part).metadata.num_rows for part in _parts(root, table))
+
+
+def replace_table(root: str, table: str, df: pd.DataFrame, columns: list, dtypes: dict):
+    """Overwrite the whole table with `df` as a single part. Hold the table's lock while calling."""
+    os.makedirs(table_dir(root, table), exist_ok=True)
+    old_parts = _parts(root, table)
+    _write_part(root, table, _to_arrow(df, columns, dtypes))
+    for part in old_parts:
+        os.remove(part)
+
+
+def append_rows(root: str, table: str, rows: list, columns: list, dtypes: dict):
+    """Add `rows` as a new part without reading the table. Hold the table's lock while calling."""
+    os.makedirs(table_dir(root, table), exist_ok=True)
+    _write_part(root, table, _to_arrow(pd.DataFrame(rows, columns=columns), columns, dtypes))
+    if len(_parts(root, table)) > MAX_PARTS:
+        compact(root, table, columns, dtypes)
+
+
+def compact(root: str, table: str, columns: list, dtypes: dict) -> int:
+    """Merge every part of a table into one. Returns the number of parts merged."""
+    parts = _parts(root, table)
+    if len(parts) > 1:
+        replace_table(root, table, read_table(root, table, columns, dtypes), columns, dtypes)
+    return len(parts)
+
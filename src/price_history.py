@@ -0,0 +1,119 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from storage import ensure_data_files, insert_rows, load_crop_prices, table_version
+
+# ----------------- Crop Price History -----------------
+# crop_prices.csv is an append-only log of every Profit Per Acre change. A row
+# with an empty Effective From is the price a crop had before its history was
+# recorded (it applies to every earlier date). PriceHistory keeps each crop's
+# changes sorted by time, so "price of X on date D" is a binary search and
+# historical profits for a whole frame of records are one merge_asof.
+
+# Stands in for "since the beginning" in the time index.
+BASELINE = pd.Timestamp.min
+
+
+def _crop_key(names: pd.Series) -> pd.Series:
+    return names.astype(object).where(names.notna(), "").astype(str).str.strip().str.lower()
+
+
+class PriceHistory:
+    """Per-crop, time-sorted Profit Per Acre history. Built from load_crop_prices(); never modified."""
+
+    def __init__(self, prices: pd.DataFrame, version=None):
+        self.version = version
+        frame = pd.DataFrame({
+            "key": _crop_key(prices["Crop Name"]),
+            "Crop Name": prices["Crop Name"].astype(object),
+            "time": pd.to_datetime(prices["Effective From"], errors="coerce").fillna(BASELINE),
+            "Profit Per Acre": prices["Profit Per Acre"].astype("float64"),
+        })
+        # stable sort keeps file order for equal times, so the later write wins
+        self.frame = frame.sort_values("time", kind="stable").reset_index(drop=True)
+
+        # crop key -> (times as int64 ns, prices), both ascending by time
+        self._series = {}
+        for key, rows in self.frame.groupby("key", sort=False):
+            self._series[key] = (rows["time"].to_numpy(dtype="datetime64[ns]").astype(np.int64),
+                                 rows["Profit Per Acre"].to_numpy())
+
+    def __contains__(self, crop) -> bool:
+        return str(crop).strip().lower() in self._series
+
+    def as_of(self, crop, when=None) -> float | None:
+        """Profit Per Acre of `crop` in effect at `when` (default now), or None if none is recorded by then."""
+        series = self._series.get(str(crop).strip().lower())
+        if series is None:
+            return None
+        times, prices = series
+        at = np.datetime64(pd.Timestamp(when or datetime.now()), "ns").astype(np.int64)
+        i = int(np.searchsorted(times, at, side="right")) - 1
+        return None if i < 0 else float(prices[i])
+
+    def trend(self, crop) -> pd.DataFrame:
+        """A crop's price changes as Effective From / Profit Per Acre rows, oldest first (NaT = before records)."""
+        rows = self.frame[self.frame["key"] == str(crop).strip().lower()]
+        return pd.DataFrame({"Effective From": rows["time"].where(rows["time"] != BASELINE),
+                             "Profit Per Acre": rows["Profit Per Acre"]}).reset_index(drop=True)
+
+    def profits_as_of(self, records: pd.DataFrame, when=None, current: dict | None = None) -> pd.Series:
+        """Profit Per Acre for each row of `records` (a farmer_crops frame) as of `when`, in one pass.
+
+        `when` is a timestamp for every row (default now) or the name of a datetime
+        column in `records` giving each row its own date. Crops with no recorded
+        changes take their price from `current` ({crop name: price}), since it has
+        never changed; anything else without a price gets NaN.
+        """
+        if isinstance(when, str) and when in records.columns:
+            times = pd.to_datetime(records[when], errors="coerce")
+        else:
+            times = pd.Series(pd.Timestamp(when or datetime.now()), index=records.index)
+        left = pd.DataFrame({"key": _crop_key(records["Crop Name"]).to_numpy(),
+                             "time": times.to_numpy(dtype="datetime64[ns]"),
+                             "row": np.arange(len(records))})
+        left = left[left["time"].notna()].sort_values("time", kind="stable")
+        merged = pd.merge_asof(left, self.frame[["key", "time", "Profit Per Acre"]], on="time", by="key",
+                               direction="backward")
+        result = np.full(len(records), np.nan)
+        result[merged["row"].to_numpy()] = merged["Profit Per Acre"].to_numpy()
+        if current:
+            keys = _crop_key(records["Crop Name"])
+            unchanged = ~keys.isin(list(self._series)).to_numpy()
+            fallback = keys.map({str(k).strip().lower(): v for k, v in current.items()}).to_numpy(dtype="float64")
+            result[unchanged] = fallback[unchanged]
+        return pd.Series(result, index=records.index, name="Profit Per Acre")
+
+    def estimated_profits_as_of(self, records: pd.DataFrame, when=None, current: dict | None = None) -> pd.Series:
+        """Field Size (acres) * the Profit Per Acre in effect at `when`, per row of `records`."""
+        profits = self.profits_as_of(records, when, current)
+        return (records["Field Size (acres)"].astype("float64") * profits).rename("Estimated Profit")
+
+
+_history = None
+_history_lock = threading.Lock()
+
+def get_price_history() -> PriceHistory:
+    """The shared price history, rebuilt when crop_prices.csv has changed."""
+    global _history
+    ensure_data_files()
+    version = table_version("crop_prices")
+    history = _history
+    if history is not None and history.version == version:
+        return history
+    with _history_lock:
+        if _history is None or _history.version != version:
+            _history = PriceHistory(load_crop_prices(), version)
+        return _history
+
+def record_price_change(crop_name: str, old_price, new_price, when=None):
+    """Append a price change to the history. A crop's first change also records its old price as the baseline."""
+    rows = []
+    if crop_name not in get_price_history() and old_price is not None and not pd.isna(old_price):
+        rows.append({"Crop Name": crop_name, "Profit Per Acre": float(old_price), "Effective From": ""})
+    effective = pd.Timestamp(when or datetime.now()).isoformat(timespec="seconds")
+    rows.append({"Crop Name": crop_name, "Profit Per Acre": float(new_price), "Effective From": effective})
+    insert_rows("crop_prices", rows)
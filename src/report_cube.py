@@ -0,0 +1,186 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from storage import (
+    ensure_data_files,
+    load_crop_profit,
+    load_farmers,
+    summarize_crops,
+    table_version,
+)
+
+# ----------------- Report Cube -----------------
+# Farmer crop totals per (username, crop), summed by the parallel report engine,
+# joined with the farmer's location and the crop's season and summed once per
+# data version into every grouping of Season x Location x Crop Name (the full
+# cube plus each roll-up). Slices, drill-downs and top-N lists then pick rows
+# out of a precomputed table instead of re-grouping the records.
+
+DIMENSIONS = ("Season", "Location", "Crop Name")
+MEASURES = {"Estimated Profit": "Profit", "Field Size (acres)": "Acres"}
+CUBE_COLUMNS = ["Records", "Profit Sum", "Profit Mean", "Acres Sum", "Acres Mean"]
+
+# Shown for records whose farmer has no location or whose crop isn't in the catalog.
+UNKNOWN = "Unknown"
+
+
+def _lower_keys(values: pd.Series) -> pd.Categorical:
+    """Stripped, lower-cased values as a categorical, normalizing each distinct value once rather than each row."""
+    cat = values.astype("category")
+    lowered = cat.cat.categories.astype(str).str.strip().str.lower()
+    keys, inverse = np.unique(lowered, return_inverse=True)
+    codes = cat.cat.codes.to_numpy()
+    return pd.Categorical.from_codes(np.where(codes >= 0, inverse[codes], -1), categories=keys)
+
+
+def _shared(left: pd.Categorical, right: pd.Categorical) -> tuple:
+    """Both categoricals recoded onto the same categories, so a merge on them compares codes."""
+    categories = left.categories.union(right.categories)
+    return left.set_categories(categories), right.set_categories(categories)
+
+
+def _coalesce(first: pd.Categorical, second: pd.Categorical) -> pd.Categorical:
+    """`first`, with its missing values taken from `second`, computed on the codes."""
+    first, second = _shared(first, second)
+    codes = np.where(first.codes >= 0, first.codes, second.codes)
+    return pd.Categorical.from_codes(codes, categories=first.categories).remove_unused_categories()
+
+
+def _labels(values: pd.Series) -> pd.Categorical:
+    """Stripped values as a categorical with blanks as missing, stripping each distinct value once."""
+    cat = values.astype("category")
+    stripped = cat.cat.categories.astype(str).str.strip()
+    labels, inverse = np.unique(stripped, return_inverse=True)
+    codes = cat.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, inverse[codes], -1)
+    codes[np.isin(codes, np.flatnonzero(labels == ""))] = -1
+    return pd.Categorical.from_codes(codes, categories=labels)
+
+
+def join_records(crops: pd.DataFrame, farmers: pd.DataFrame, profit: pd.DataFrame) -> pd.DataFrame:
+    """`crops` (farmer crop records, or their totals with a Records column) with Season, Location and Crop Name."""
+    records = pd.DataFrame({"username": _labels(crops["username"]), "key": _lower_keys(crops["Crop Name"])})
+    for col in MEASURES:
+        records[col] = crops[col].astype("float64").to_numpy()
+    records["Records"] = crops["Records"].to_numpy() if "Records" in crops.columns else 1
+
+    # a username registered more than once keeps its latest farmer profile
+    farmers = farmers.drop_duplicates("username", keep="last")
+    locations = pd.DataFrame({"username": _labels(farmers["username"]), "Location": _labels(farmers["location"])})
+    records["username"], locations["username"] = _shared(records["username"].array, locations["username"].array)
+    records = records.merge(locations.dropna(subset=["username"]), on="username", how="left")
+
+    seasons = pd.DataFrame({"key": _lower_keys(profit["Crop Name"]), "Crop Name": _labels(profit["Crop Name"]),
+                            "Season": _labels(profit["Season"])}).drop_duplicates("key")
+    records["key"], seasons["key"] = _shared(records["key"].array, seasons["key"].array)
+    records = records.merge(seasons, on="key", how="left")
+
+    # crops outside the catalog are named after what the farmer entered
+    entered = records["key"].cat.rename_categories(lambda key: str(key).title()).array
+    records["Crop Name"] = _coalesce(records["Crop Name"].array, entered)
+    for dim in DIMENSIONS:
+        column = records[dim]
+        if UNKNOWN not in column.cat.categories:
+            column = column.cat.add_categories(UNKNOWN)
+        records[dim] = column.fillna(UNKNOWN).cat.remove_unused_categories()
+    return records[list(DIMENSIONS) + list(MEASURES) + ["Records"]]
+
+
+class ReportCube:
+    """Sum, count and mean of profit and acreage for every grouping of DIMENSIONS. Never modified."""
+
+    def __init__(self, records: pd.DataFrame, version=None):
+        self.version = version
+        sums = {f"{name} Sum": (col, "sum") for col, name in MEASURES.items()}
+        base = records.groupby(list(DIMENSIONS), observed=True, sort=True).agg(
+            Records=("Records", "sum"), **sums)
+        self.members = {dim: sorted(records[dim].unique().tolist(), key=str) for dim in DIMENSIONS}
+
+        # every subset of the dimensions, rolled up from the base cells (means from sums, not from means)
+        self._groupings, self._members = {}, {}
+        for mask in range(1 << len(DIMENSIONS)):
+            dims = tuple(d for i, d in enumerate(DIMENSIONS) if mask >> i & 1)
+            if not dims:
+                cells = base.sum().to_frame().T
+            elif len(dims) == len(DIMENSIONS):
+                cells = base.copy()
+            else:
+                cells = base.groupby(level=list(dims), observed=True, sort=True).sum()
+            self._groupings[dims] = self._with_means(cells)
+            # lower-cased members of each level, for case-insensitive slicing without string ops per query
+            self._members[dims] = {dim: cells.index.get_level_values(dim).astype(str).str.lower().to_numpy()
+                                   for dim in dims}
+
+    @staticmethod
+    def _with_means(cells: pd.DataFrame) -> pd.DataFrame:
+        cells["Records"] = cells["Records"].astype("int64")
+        for name in MEASURES.values():
+            cells[f"{name} Mean"] = cells[f"{name} Sum"] / cells["Records"]
+        return cells[CUBE_COLUMNS]
+
+    def _check(self, dims):
+        unknown = [d for d in dims if d not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown report dimension(s): {', '.join(unknown)}")
+
+    def slice(self, by=(), where: dict | None = None) -> pd.DataFrame:
+        """Totals grouped by the dimensions in `by`, over the records matching `where` ({dimension: value}).
+
+        Values in `where` match case-insensitively, e.g.
+        slice(["Crop Name"], {"Season": "Kharif", "Location": "Delhi"}).
+        """
+        where = {dim: value for dim, value in (where or {}).items() if value is not None}
+        by = [by] if isinstance(by, str) else list(by)
+        self._check(list(where) + by)
+        dims = tuple(d for d in DIMENSIONS if d in where or d in by)
+        cells = self._groupings[dims]
+        if where:
+            keep = np.ones(len(cells), dtype=bool)
+            for dim, value in where.items():
+                keep &= self._members[dims][dim] == str(value).strip().lower()
+            cells = cells[keep]
+        if by:
+            cells = cells.reset_index()[by + CUBE_COLUMNS]
+        return cells.reset_index(drop=True)
+
+    def total(self, where: dict | None = None) -> dict:
+        """The measures over every record matching `where`, as {column: value}."""
+        cells = self.slice((), where)
+        if cells.empty:
+            return {"Records": 0, "Profit Sum": 0.0, "Profit Mean": np.nan, "Acres Sum": 0.0, "Acres Mean": np.nan}
+        return {col: cells[col].iloc[0].item() for col in CUBE_COLUMNS}
+
+    def drill_down(self, path: dict, dimension: str) -> pd.DataFrame:
+        """Break the cell at `path` ({dimension: value}, e.g. {"Season": "Kharif"}) down by one more dimension."""
+        return self.slice([dimension], path)
+
+    def top(self, dimension: str, n: int = 5, measure: str = "Profit Sum", where: dict | None = None) -> pd.DataFrame:
+        """The `n` members of `dimension` with the largest `measure` among the records matching `where`."""
+        return self.slice([dimension], where).nlargest(n, measure).reset_index(drop=True)
+
+
+_cube = None
+_cube_lock = threading.Lock()
+
+def cube_version() -> tuple:
+    return tuple(table_version(table) for table in ("farmer_crops", "farmers", "crop_profit"))
+
+def get_report_cube() -> ReportCube:
+    """The shared report cube, rebuilt when farmer_crops, farmers or crop_profit has changed."""
+    global _cube
+    ensure_data_files()
+    version = cube_version()
+    cube = _cube
+    if cube is not None and cube.version == version:
+        return cube
+    with _cube_lock:
+        if _cube is None or _cube.version != version:
+            totals, = summarize_crops([("username", "Crop Name")])
+            records = join_records(
+                totals,
+                load_farmers(columns=["username", "location"]),
+                load_crop_profit(columns=["Crop Name", "Season"]))
+            _cube = ReportCube(records, version)
+        return _cube
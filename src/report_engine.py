@@ -0,0 +1,207 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for the parquet backend
+    pq = None
+
+# ----------------- Parallel Report Engine -----------------
+# Totals over farmer_crops computed in pieces. A task reads one byte range of a
+# CSV log (or a batch of small logs or parquet parts), drops its tombstoned rows
+# and sums the measures per group; tasks run on a process pool and their partial
+# sums are added together, giving the same result as one groupby over the whole
+# table. With one worker or a single task everything runs in this process.
+# storage.summarize_crops() plans the tasks; this module never touches storage.
+
+MEASURES = ["Estimated Profit", "Field Size (acres)"]
+TOTAL_COLUMNS = MEASURES + ["Records"]
+
+
+# ----------------- Task Planning -----------------
+# A piece is ("csv", path, start, end, first_row, dead), ("parquet", path) or
+# ("frame", df); a task is a list of pieces of roughly chunk_bytes in total.
+
+def _batch(pieces: list, sizes: list, chunk_bytes: int) -> list:
+    tasks, batch, batch_bytes = [], [], 0
+    for piece, size in zip(pieces, sizes):
+        if batch and batch_bytes + size > chunk_bytes:
+            tasks.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(piece)
+        batch_bytes += size
+    if batch:
+        tasks.append(batch)
+    return tasks
+
+
+def _csv_pieces(path: str, dead, chunk_bytes: int) -> list:
+    """Line-aligned byte ranges of one log. Row positions are only counted when there are tombstones to place."""
+    dead = np.sort(np.fromiter(dead, dtype=np.int64)) if dead else None
+    pieces = []
+    with open(path, "rb") as f:
+        f.readline()  # header
+        start, size, first_row = f.tell(), os.fstat(f.fileno()).st_size, 0
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = f.tell()
+            piece_first, piece_dead = first_row, ()
+            if dead is not None:
+                f.seek(start)
+                data = f.read(end - start)
+                rows = data.count(b"\n") + (0 if data.endswith(b"\n") else 1)
+                piece_dead = dead[(dead >= first_row) & (dead < first_row + rows)]
+                first_row += rows
+            pieces.append(("csv", path, start, end, piece_first, piece_dead))
+            start = end
+    return pieces
+
+
+def plan_csv(paths: list, dead: dict, chunk_bytes: int) -> list:
+    """Tasks covering the CSV logs at `paths`: big logs split at line boundaries, small ones batched together.
+
+    `dead` maps a path to its tombstoned row positions. Assumes no field spans lines.
+    """
+    pieces = [piece for path in paths for piece in _csv_pieces(path, dead.get(path), chunk_bytes)]
+    return _batch(pieces, [piece[3] - piece[2] for piece in pieces], chunk_bytes)
+
+
+def plan_parquet(parts: list, chunk_bytes: int) -> list:
+    """Tasks covering the parquet part files, batched by file size."""
+    return _batch([("parquet", part) for part in parts], [os.path.getsize(part) for part in parts], chunk_bytes)
+
+
+# ----------------- Partial Totals -----------------
+
+def _read_csv_range(path: str, start: int, end: int, columns: list, dtypes: dict) -> pd.DataFrame:
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(start)
+        data = header + f.read(end - start)
+    try:
+        return pd.read_csv(io.BytesIO(data), usecols=columns, dtype=dtypes)
+    except (ValueError, TypeError):
+        frame = pd.read_csv(io.BytesIO(data), usecols=columns, dtype=str)
+        for col in MEASURES:
+            if col in frame.columns:
+                frame[col] = pd.to_numeric(frame[col], errors="coerce")
+        return frame
+
+
+def _read_piece(piece: tuple, columns: list, dtypes: dict) -> pd.DataFrame:
+    kind = piece[0]
+    if kind == "frame":
+        return piece[1]
+    if kind == "parquet":
+        return pq.read_table(piece[1], columns=columns).to_pandas()
+    _, path, start, end, first_row, dead = piece
+    frame = _read_csv_range(path, start, end, columns, dtypes)
+    if len(dead):
+        frame.index = pd.RangeIndex(first_row, first_row + len(frame))
+        frame = frame.drop(index=dead, errors="ignore")
+    return frame
+
+
+def _key_values(values: pd.Index) -> pd.Index:
+    return values.astype(object).where(values.notna(), "").astype(str)
+
+
+def string_keys(part: pd.DataFrame, keys: tuple) -> pd.DataFrame:
+    """`part` with its group keys as strings (missing keys as ""), so partials from any reader line up."""
+    if isinstance(part.index, pd.MultiIndex):
+        part.index = pd.MultiIndex.from_arrays(
+            [_key_values(part.index.get_level_values(i)) for i in range(part.index.nlevels)], names=keys)
+    else:
+        part.index = pd.Index(_key_values(part.index), name=keys[0])
+    return part
+
+
+def partial_totals(frame: pd.DataFrame, groupings: list) -> list:
+    """For each grouping (a tuple of key columns), the TOTAL_COLUMNS sums of `frame` indexed by those keys."""
+    partials = []
+    for keys in groupings:
+        groups = frame.groupby(list(keys), observed=True, dropna=False, sort=False)
+        part = groups[MEASURES].sum()
+        part["Records"] = groups.size()
+        partials.append(string_keys(part, keys))
+    return partials
+
+
+def merge_totals(partials: list, keys: tuple) -> pd.DataFrame:
+    """Add up partial totals for one grouping; returns the key columns plus TOTAL_COLUMNS, sorted by key."""
+    frames = [part for part in partials if not part.empty]
+    if not frames:
+        return pd.DataFrame({**{k: pd.Series(dtype=object) for k in keys},
+                             **{c: pd.Series(dtype="float64") for c in MEASURES},
+                             "Records": pd.Series(dtype="int64")})
+    merged = pd.concat(frames).groupby(level=list(range(len(keys))), sort=True).sum()
+    merged["Records"] = merged["Records"].astype("int64")
+    return merged.reset_index()
+
+
+def _run_task(task: list, columns: list, dtypes: dict, groupings: list) -> list:
+    frames = [_read_piece(piece, columns, dtypes) for piece in task]
+    frame = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    return partial_totals(frame, groupings)
+
+
+# ----------------- Process Pool -----------------
+# One pool is kept for the life of the process, since starting workers costs
+# more than a typical report. Workers come from a fork server rather than a fork
+# of the app, which would copy in locks held by its other threads. Like "spawn"
+# (the fallback on Windows), each worker imports the main script once, so it must
+# keep its entry point under `if __name__ == "__main__"` as main.py and manage.py
+# do. frontend.py draws the page at import, so the Streamlit app keeps one worker.
+
+_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+def _executor(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(_START_METHOD))
+            _pool_workers = workers
+        return _pool
+
+def _discard_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def run(tasks: list, groupings: list, columns: list, dtypes: dict, workers: int = 1) -> list:
+    """Totals per grouping over every task, one frame per grouping (see merge_totals).
+
+    Tasks run on `workers` processes. With one worker or one task, or if a process
+    pool can't be started here, they run one after another in this process.
+    """
+    groupings = [tuple(keys) for keys in groupings]
+    results = None
+    if workers > 1 and len(tasks) > 1:
+        try:
+            pool = _executor(workers)
+            results = list(pool.map(_run_task, tasks, repeat(columns), repeat(dtypes), repeat(groupings)))
+        except FileNotFoundError:
+            raise
+        except (BrokenProcessPool, OSError):  # e.g. no process or semaphore support in a sandbox
+            _discard_pool()
+    if results is None:
+        results = [_run_task(task, columns, dtypes, groupings) for task in tasks]
+    return [merge_totals([result[i] for result in results], keys) for i, keys in enumerate(groupings)]
@@ -0,0 +1,118 @@
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+# ----------------- Full-Text Search -----------------
+# An inverted index with BM25 ranking over crop descriptions. One document per
+# crop (its name plus description); each document also remembers the terms of
+# its parsed sections so a hit can say where it matched.
+
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is",
+    "it", "its", "of", "on", "or", "that", "the", "to", "was", "were", "will", "with"
+})
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text) -> list:
+    return [t for t in _TOKEN.findall(str(text).lower()) if t not in STOPWORDS]
+
+
+class SearchIndex:
+    """BM25 over a fixed set of documents. Build with from_documents(); load with load_or_build()."""
+
+    def __init__(self, names: list, lengths: list, postings: dict, sections: list, fingerprint: str):
+        self.names = names              # doc id -> crop name
+        self.lengths = lengths          # doc id -> token count
+        self.postings = postings        # term -> [[doc id, term frequency], ...]
+        self.sections = sections        # doc id -> [[section title, [terms]], ...]
+        self.fingerprint = fingerprint
+        self._avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        self._section_terms = [[(title, set(terms)) for title, terms in doc] for doc in sections]
+
+    @staticmethod
+    def fingerprint_of(documents: list) -> str:
+        digest = hashlib.sha1()
+        for name, text, _ in documents:
+            digest.update(f"{name}\0{text}\0".encode())
+        return digest.hexdigest()
+
+    @classmethod
+    def from_documents(cls, documents, fingerprint: str | None = None) -> "SearchIndex":
+        """Index `documents`, an iterable of (name, text, {section title: section text}).
+
+        Without a `fingerprint` the documents must be a list, to fingerprint them by content.
+        """
+        if fingerprint is None:
+            fingerprint = cls.fingerprint_of(documents)
+        names, lengths, postings, sections = [], [], {}, []
+        for doc_id, (name, text, doc_sections) in enumerate(documents):
+            terms = tokenize(f"{name} {text}")
+            names.append(name)
+            lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                postings.setdefault(term, []).append([doc_id, tf])
+            sections.append([[title, sorted(set(tokenize(body)))] for title, body in doc_sections.items()])
+        return cls(names, lengths, postings, sections, fingerprint)
+
+    @classmethod
+    def load_or_build(cls, path: str, fingerprint: str, documents) -> "SearchIndex":
+        """Load the index saved at `path` if it has `fingerprint`, else build it from documents() and save it.
+
+        `documents` is only called on a rebuild, so a warm start reads no document text.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("fingerprint") == fingerprint:
+                return cls(saved["names"], saved["lengths"], saved["postings"], saved["sections"], fingerprint)
+        except (OSError, ValueError, KeyError):
+            pass
+        index = cls.from_documents(documents(), fingerprint)
+        try:
+            index.save(path)
+        except OSError:  # read-only data dir: still usable, just rebuilt next start
+            pass
+        return index
+
+    def save(self, path: str):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "names": self.names, "lengths": self.lengths,
+                       "postings": self.postings, "sections": self.sections}, f)
+        os.replace(tmp_path, path)
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.names) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Best matches for `query` as [{"Crop Name", "score", "section"}], highest score first.
+
+        "section" is the title of the section holding the most query terms, or None
+        if they only appear in the name or intro.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        scores = {}
+        for term in terms:
+            idf = self._idf(term)
+            for doc_id, tf in self.postings.get(term, ()):
+                norm = K1 * (1 - B + B * self.lengths[doc_id] / self._avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        results = []
+        for doc_id, score in heapq.nlargest(limit, scores.items(), key=lambda item: item[1]):
+            best, best_hits = None, 0
+            for title, section_terms in self._section_terms[doc_id]:
+                hits = sum(1 for term in terms if term in section_terms)
+                if hits > best_hits:
+                    best, best_hits = title, hits
+            results.append({"Crop Name": self.names[doc_id], "score": round(score, 4), "section": best})
+        return results
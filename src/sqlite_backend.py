@@ -0,0 +1,276 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+import pandas as pd
+
+# ----------------- SQLite Storage Engine -----------------
+# Used by storage.py when CROP_PORTAL_BACKEND=sqlite. Every value is stored
+# as TEXT so frames read back look exactly like the CSV loaders' output.
+
+INDEXED_COLUMNS = {
+    "users": ["username"],
+    "farmers": ["username"],
+    "farmer_crops": ["username", "record_id"],
+    "crop_profit": ["Crop Name"],
+    "crop_details": ["Crop Name"],
+}
+
+# Case-insensitive lookups (WHERE lower(col) = ?), e.g. repricing farmer crops by name.
+NOCASE_INDEXED_COLUMNS = {
+    "farmer_crops": ["Crop Name"],
+}
+
+# Every table has a change counter in table_versions, bumped by triggers for each
+# row inserted, updated or deleted however it is written, so a reader can tell
+# that one table changed without writes to the others (or a checkpoint) counting.
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _to_text(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return str(value)
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+@contextmanager
+def _transaction(db_path: str):
+    """Yield a connection that commits on success, rolls back on error and is always closed."""
+    conn = connect(db_path)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _version(conn: sqlite3.Connection, table: str) -> int | None:
+    try:
+        row = conn.execute("SELECT value FROM table_versions WHERE name = ?", (table,)).fetchone()
+    except sqlite3.OperationalError:  # no table_versions until ensure_schema has run
+        return None
+    return row[0] if row else None
+
+
+@contextmanager
+def _tracked(db_path: str, table: str, on_change):
+    """A write transaction yielding (connection, change) that reports the write to `on_change`.
+
+    The caller sets change["added"] (the rows as written, a frame) and change["removed"]
+    (a row count). Once committed, on_change(before, after, added, removed) gets the
+    table's version from just before and just after the write; the write lock is taken
+    up front so no other writer lands in between. Without `on_change` this is _transaction.
+    """
+    change = {"added": None, "removed": 0}
+    with _transaction(db_path) as conn:
+        if on_change is not None:
+            conn.execute("BEGIN IMMEDIATE")
+            before = _version(conn, table)
+        yield conn, change
+        if on_change is not None:
+            after = _version(conn, table)
+    if on_change is not None and after != before:
+        on_change(before, after, change["added"], change["removed"])
+
+
+def _rows_by_rowid(conn: sqlite3.Connection, table: str, rowids: list) -> pd.DataFrame:
+    frames = [pd.read_sql_query(f"SELECT * FROM {_quote(table)} WHERE rowid IN ({', '.join('?' * len(batch))})",
+                                conn, params=batch)
+              for batch in (rowids[i:i + 500] for i in range(0, len(rowids), 500))]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def ensure_schema(db_path: str, tables: dict):
+    """Create every table in `tables` ({name: columns}) plus its username/name indexes."""
+    with _transaction(db_path) as conn:
+        for table, columns in tables.items():
+            cols = ", ".join(f"{_quote(c)} TEXT" for c in columns)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(table)} ({cols})")
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({_quote(table)})")}
+            for col in columns:
+                if col not in existing:
+                    conn.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(col)} TEXT")
+            for col in (c for c in INDEXED_COLUMNS.get(table, []) if c in columns):
+                index_name = _quote(f"idx_{table}_{col.replace(' ', '_').lower()}")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {_quote(table)} ({_quote(col)})")
+            for col in (c for c in NOCASE_INDEXED_COLUMNS.get(table, []) if c in columns):
+                index_name = _quote(f"idx_{table}_{col.replace(' ', '_').lower()}_nocase")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {_quote(table)} (lower({_quote(col)}))")
+        conn.execute("CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        for table in tables:
+            if _version(conn, table) is None:  # only write when needed: callers may hold the write lock
+                conn.execute("INSERT INTO table_versions (name, value) VALUES (?, 0)", (table,))
+            name = "'" + table.replace("'", "''") + "'"
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                trigger = _quote(f"version_{table}_{event.lower()}")
+                conn.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON {_quote(table)} "
+                             f"BEGIN UPDATE table_versions SET value = value + 1 WHERE name = {name}; END")
+
+
+def read_table(db_path: str, table: str, columns: list, key_col: str | None = None, key_value=None) -> pd.DataFrame:
+    """Read a table (or the rows where key_col == key_value) with its rowids as the index."""
+    select = ", ".join(_quote(c) for c in columns)
+    where, params = "", ()
+    if key_col is not None:
+        where, params = f" WHERE {_quote(key_col)} = ?", (_to_text(key_value),)
+    with _transaction(db_path) as conn:
+        df = pd.read_sql_query(f"SELECT rowid, {select} FROM {_quote(table)}{where} ORDER BY rowid", conn,
+                               index_col="rowid", params=params)
+    df.index.name = None
+    return df
+
+
+def iter_table(db_path: str, table: str, columns: list, chunk_rows: int):
+    """Yield the table's rows in frames of up to chunk_rows, from one consistent read."""
+    select = ", ".join(_quote(c) for c in columns)
+    conn = connect(db_path)
+    try:
+        yield from pd.read_sql_query(f"SELECT {select} FROM {_quote(table)} ORDER BY rowid", conn, chunksize=chunk_rows)
+    finally:
+        conn.close()
+
+
+def replace_table(db_path: str, table: str, df: pd.DataFrame, columns: list):
+    """Overwrite the whole table with `df` in a single transaction."""
+    rows = [tuple(_to_text(v) for v in rec) for rec in df.reindex(columns=columns).itertuples(index=False)]
+    placeholders = ", ".join("?" for _ in columns)
+    with _transaction(db_path) as conn:
+        conn.execute(f"DELETE FROM {_quote(table)}")
+        conn.executemany(f"INSERT INTO {_quote(table)} VALUES ({placeholders})", rows)
+
+
+def insert_rows(db_path: str, table: str, rows: list, columns: list, on_change=None):
+    """Append `rows` (dicts). `on_change` is told about the write (see _tracked)."""
+    values = [tuple(_to_text(row.get(c)) for c in columns) for row in rows]
+    cols = ", ".join(_quote(c) for c in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    with _tracked(db_path, table, on_change) as (conn, change):
+        conn.executemany(f"INSERT INTO {_quote(table)} ({cols}) VALUES ({placeholders})", values)
+        change["added"] = pd.DataFrame(values, columns=columns)
+
+
+def update_rows(db_path: str, table: str, key_col: str, key_value, changes: dict, on_change=None) -> int:
+    """Set `changes` on every row where key_col == key_value. Returns the number of rows touched."""
+    if not changes:
+        return 0
+    assignments = ", ".join(f"{_quote(c)} = ?" for c in changes)
+    params = [_to_text(v) for v in changes.values()] + [_to_text(key_value)]
+    with _tracked(db_path, table, on_change) as (conn, change):
+        if on_change is not None:
+            rowids = [row[0] for row in conn.execute(f"SELECT rowid FROM {_quote(table)} WHERE {_quote(key_col)} = ?",
+                                                     (_to_text(key_value),))]
+        cur = conn.execute(f"UPDATE {_quote(table)} SET {assignments} WHERE {_quote(key_col)} = ?", params)
+        if on_change is not None:
+            change["added"], change["removed"] = _rows_by_rowid(conn, table, rowids), cur.rowcount
+        return cur.rowcount
+
+
+def set_rates(db_path: str, table: str, key_col: str, rate_col: str, quantity_col: str, total_col: str,
+              rates: dict, on_change=None) -> int:
+    """For every row whose key_col (any case) is in `rates`, set rate_col to its rate and total_col to quantity * rate.
+
+    `rates` is keyed by lower-case values. All keys are updated in one transaction.
+    Returns the number of rows touched.
+    """
+    sql = (f"UPDATE {_quote(table)} SET {_quote(rate_col)} = ?, "
+           f"{_quote(total_col)} = CAST({_quote(quantity_col)} AS REAL) * ? WHERE lower({_quote(key_col)}) = ?")
+    with _tracked(db_path, table, on_change) as (conn, change):
+        touched, changed = 0, []
+        for key, rate in rates.items():
+            rowcount = conn.execute(sql, (_to_text(rate), float(rate), _to_text(key))).rowcount
+            touched += rowcount
+            if on_change is not None and rowcount:
+                changed.append(pd.read_sql_query(f"SELECT * FROM {_quote(table)} WHERE lower({_quote(key_col)}) = ?",
+                                                 conn, params=(_to_text(key),)))
+        if changed:
+            change["added"], change["removed"] = pd.concat(changed, ignore_index=True), touched
+        return touched
+
+
+def delete_rows(db_path: str, table: str, key_col: str, key_value, on_change=None) -> int:
+    with _tracked(db_path, table, on_change) as (conn, change):
+        cur = conn.execute(f"DELETE FROM {_quote(table)} WHERE {_quote(key_col)} = ?", (_to_text(key_value),))
+        change["removed"] = cur.rowcount
+        return cur.rowcount
+
+
+def group_totals(db_path: str, table: str, key_col: str, sum_cols: list) -> dict:
+    """{key value: [SUM(col) for col in sum_cols] + [row count]}, computed by SQLite."""
+    sums = ", ".join(f"TOTAL(CAST({_quote(c)} AS REAL))" for c in sum_cols)
+    with _transaction(db_path) as conn:
+        cur = conn.execute(f"SELECT COALESCE({_quote(key_col)}, ''), {sums}, COUNT(*) FROM {_quote(table)} "
+                           f"GROUP BY 1")
+        return {row[0]: list(row[1:]) for row in cur}
+
+
+def table_version(db_path: str, table: str) -> int | None:
+    """The change counter of a table; None if ensure_schema hasn't set one up."""
+    with _transaction(db_path) as conn:
+        return _version(conn, table)
+
+
+def count_rows(db_path: str, table: str) -> int:
+    with _transaction(db_path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {_quote(table)}").fetchone()[0]
+
+
+def count_missing(db_path: str, table: str, col: str) -> int:
+    with _transaction(db_path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {_quote(table)} WHERE {_quote(col)} IS NULL").fetchone()[0]
+
+
+def missing_rowids(db_path: str, table: str, col: str) -> list:
+    with _transaction(db_path) as conn:
+        cur = conn.execute(f"SELECT rowid FROM {_quote(table)} WHERE {_quote(col)} IS NULL ORDER BY rowid")
+        return [row[0] for row in cur]
+
+
+def set_column_by_rowid(db_path: str, table: str, col: str, values: dict):
+    """Set `col` per row from a {rowid: value} mapping in one transaction."""
+    with _transaction(db_path) as conn:
+        conn.executemany(f"UPDATE {_quote(table)} SET {_quote(col)} = ? WHERE rowid = ?",
+                         [(_to_text(v), r) for r, v in values.items()])
+
+
+def allocate_ids(db_path: str, name: str, count: int, seed) -> int:
+    """Reserve `count` IDs from sequence `name` atomically. `seed()` gives the starting value for a new sequence."""
+    conn = connect(db_path)
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS sequences (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()
+        last = row[0] if row else seed()
+        conn.execute("INSERT OR REPLACE INTO sequences (name, value) VALUES (?, ?)", (name, last + count))
+        conn.commit()
+        return last + 1
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def set_sequences(db_path: str, values: dict):
+    with _transaction(db_path) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS sequences (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.executemany("INSERT OR REPLACE INTO sequences (name, value) VALUES (?, ?)", list(values.items()))
+
+
+def migrate_from_csv(db_path: str, tables: dict) -> dict:
+    """One-shot copy of every CSV table into the database. `tables` is {name: (csv_path, columns)}."""
+    ensure_schema(db_path, {name: cols for name, (_, cols) in tables.items()})
+    counts = {}
+    for table, (path, columns) in tables.items():
+        df = pd.read_csv(path, dtype=str) if os.path.exists(path) else pd.DataFrame(columns=columns)
+        replace_table(db_path, table, df, columns)
+        counts[table] = len(df)
+    return counts
+
@@ -1,6 +1,33 @@
+import hashlib
+import json
+import operator
 import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from urllib.parse import quote
+
+import numpy as np
 import pandas as pd
 
+import report_engine
+import sketches
+import sqlite_backend
+import streaming
+
+try:
+    import parquet_backend
+except ImportError:  # pyarrow is only needed for CROP_PORTAL_BACKEND=parquet
+    parquet_backend = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 # ----------------- File Paths -----------------
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
@@ -8,78 +35,1800 @@ USERS_CSV = os.path.join(DATA_DIR, "users.csv")
 FARMERS_CSV = os.path.join(DATA_DIR, "farmers.csv")
 CROP_PROFIT_CSV = os.path.join(DATA_DIR, "crop_profit_data.csv")
 CROP_DETAILS_CSV = os.path.join(DATA_DIR, "crop_details.csv")
+CROP_ALIASES_CSV = os.path.join(DATA_DIR, "crop_aliases.csv")
+CROP_PRICES_CSV = os.path.join(DATA_DIR, "crop_prices.csv")
+FARMER_CROPS_CSV = os.path.join(DATA_DIR, "farmer_crops.csv")
+FARMER_CROPS_DIR = os.path.join(DATA_DIR, "farmer_crops")
+SQLITE_DB = os.path.join(DATA_DIR, "portal.db")
+PARQUET_DIR = os.path.join(DATA_DIR, "parquet")
+SEQUENCES_JSON = os.path.join(DATA_DIR, "sequences.json")
+AGGREGATES_JSON = os.path.join(DATA_DIR, "farmer_crops_aggregates.json")
+AGGREGATE_DELTAS = os.path.join(DATA_DIR, "farmer_crops_aggregates.deltas")
+SKETCHES_JSON = os.path.join(DATA_DIR, "farmer_crops_sketches.json")
+SKETCH_DELTAS = os.path.join(DATA_DIR, "farmer_crops_sketches.deltas")
+
+# ----------------- Storage Backend -----------------
+# "csv" (default) keeps every table in its CSV file under data/.
+# "sqlite" keeps every table in SQLITE_DB; run `python src/manage.py migrate-sqlite` once to copy the CSVs over.
+# "parquet" keeps every table as columnar files under PARQUET_DIR (needs pyarrow); run
+# `python src/manage.py migrate-parquet` to convert and `export-csv` to write CSVs back out.
+
+STORAGE_BACKEND = os.environ.get("CROP_PORTAL_BACKEND", "csv").strip().lower()
+
+TABLES = {
+    "users": (USERS_CSV, ["user_id", "username", "role", "name", "password_hash", "salt"]),
+    "farmers": (FARMERS_CSV, ["farmer_id", "username", "name", "location", "contact"]),
+    "farmer_crops": (FARMER_CROPS_CSV,
+                     ["record_id", "username", "Crop Name", "Field Size (acres)", "Profit Per Acre", "Estimated Profit"]),
+    "crop_profit": (CROP_PROFIT_CSV, ["Crop Name", "Profit Per Acre", "Season"]),
+    "crop_details": (CROP_DETAILS_CSV, ["Crop Name", "Description"]),
+    "crop_aliases": (CROP_ALIASES_CSV, ["Alias", "Crop Name"]),
+    "crop_prices": (CROP_PRICES_CSV, ["Crop Name", "Profit Per Acre", "Effective From"]),
+}
+
+# ----------------- Table Schemas -----------------
+# Declared dtypes per table, applied once when a table is read. Columns not
+# listed here stay plain strings.
+
+SCHEMAS = {
+    "users": {"user_id": "Int64", "role": "category"},
+    "farmers": {"farmer_id": "Int64", "location": "category"},
+    "farmer_crops": {"record_id": "Int64", "Crop Name": "category", "Field Size (acres)": "float64",
+                     "Profit Per Acre": "float64", "Estimated Profit": "float64"},
+    "crop_profit": {"Crop Name": "category", "Profit Per Acre": "float64", "Season": "category"},
+    "crop_details": {"Crop Name": "category"},
+    "crop_aliases": {"Crop Name": "category"},
+    "crop_prices": {"Crop Name": "category", "Profit Per Acre": "float64"},
+}
+
+# Tables whose rows get a persistent ID from the sequence of the same name on insert.
+ROW_ID_COLUMNS = {"farmer_crops": "record_id"}
+
+# farmer_crops.csv is an append-only log: inserts add lines at the end, deletes
+# record the row position in a tombstone sidecar, and compaction folds them in.
+LOG_TABLES = {"farmer_crops"}
+COMPACT_MIN_TOMBSTONES = 500
+COMPACT_RATIO = 0.25
+
+# After `python src/manage.py partition-crops`, farmer_crops lives in one append
+# log per farmer under FARMER_CROPS_DIR; admin reads scan them on a thread pool.
+SCAN_WORKERS = int(os.environ.get("CROP_PORTAL_SCAN_WORKERS", "8"))
+
+# Reports over farmer_crops sum it in chunks of about REPORT_CHUNK_BYTES on up to
+# REPORT_WORKERS processes (see report_engine). The default of 1 keeps them in
+# this process; a pool only pays off on large tables, so it is opt-in.
+REPORT_WORKERS = int(os.environ.get("CROP_PORTAL_REPORT_WORKERS", "1"))
+REPORT_CHUNK_BYTES = int(os.environ.get("CROP_PORTAL_REPORT_CHUNK_MB", "16")) * 1024 * 1024
+
+# Reports stream farmer_crops in chunks of STREAM_CHUNK_ROWS rows instead of
+# loading it: "on", "off", or "auto" to stream once it outgrows CACHE_MAX_BYTES.
+STREAM_REPORTS = os.environ.get("CROP_PORTAL_STREAM_REPORTS", "auto").strip().lower()
+STREAM_CHUNK_ROWS = int(os.environ.get("CROP_PORTAL_STREAM_CHUNK_ROWS", "100000"))
+
+# Parsed CSVs are kept in memory until the file changes on disk.
+CACHE_MAX_BYTES = int(os.environ.get("CROP_PORTAL_CACHE_MB", "64")) * 1024 * 1024
+
+def use_sqlite() -> bool:
+    return STORAGE_BACKEND == "sqlite"
+
+def use_parquet() -> bool:
+    if STORAGE_BACKEND != "parquet":
+        return False
+    if parquet_backend is None:
+        raise RuntimeError("CROP_PORTAL_BACKEND=parquet needs pyarrow: pip install pyarrow")
+    return True
+
+# ----------------- File Locking -----------------
+
+def _acquire(lock_file):
+    if fcntl:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+    else:
+        lock_file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                continue
+
+def _release(lock_file):
+    if fcntl:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def file_lock(path: str):
+    """Hold an exclusive advisory lock on `path` (via path + '.lock') for the duration of the block.
+
+    A lock file may be deleted by its holder (see remove_lock_file); anyone who was
+    waiting on it wakes up holding a deleted file and starts over on a fresh one.
+    """
+    lock_path = path + ".lock"
+    while True:
+        with open(lock_path, "a+") as lock_file:
+            _acquire(lock_file)
+            try:
+                current = os.path.samestat(os.fstat(lock_file.fileno()), os.stat(lock_path))
+            except FileNotFoundError:
+                current = False
+            try:
+                if current:
+                    yield
+                    return
+            finally:
+                _release(lock_file)
+
+def remove_lock_file(path: str):
+    """Delete path's lock file. Only call while holding file_lock(path), once `path` itself is gone."""
+    try:
+        os.remove(path + ".lock")
+    except OSError:  # already gone, or still open elsewhere on Windows
+        pass
+
+# ----------------- Table Cache -----------------
+# path -> (signature, frame, nbytes), least recently used first.
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def file_signature(path: str) -> tuple:
+    """(mtime_ns, size, inode) of a file; changes whenever the file is rewritten or appended to."""
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _cached_frame(path: str, reader) -> pd.DataFrame:
+    """Return the shared cached frame for `path`, re-parsing only when its signature has changed.
+
+    The frame must not be modified; use _cached_read() to get a private copy.
+    """
+    return _cached_entry(path, reader)[1]
+
+def _cached_entry(path: str, reader) -> tuple:
+    """(signature, shared frame) for `path`; like _cached_frame() but also says which version was read."""
+    signature = file_signature(path)
+    with _cache_lock:
+        entry = _cache.get(path)
+        if entry is not None and entry[0] == signature:
+            _cache.move_to_end(path)
+            _cache_stats["hits"] += 1
+            return signature, entry[1]
+        _cache_stats["misses"] += 1
+
+    df = reader(path)
+    nbytes = int(df.memory_usage(deep=True).sum())
+    with _cache_lock:
+        _cache.pop(path, None)
+        if nbytes <= CACHE_MAX_BYTES:
+            _cache[path] = (signature, df, nbytes)
+            total = sum(e[2] for e in _cache.values())
+            while total > CACHE_MAX_BYTES:
+                _, (_, _, evicted) = _cache.popitem(last=False)
+                total -= evicted
+                _cache_stats["evictions"] += 1
+    return signature, df
+
+def _cached_read(path: str, reader) -> pd.DataFrame:
+    """Return a private copy of reader(path), parsing the file only when its signature has changed."""
+    return _cached_frame(path, reader).copy()
+
+def invalidate_cache(path: str | None = None):
+    """Forget the cached frame for `path` (or every path)."""
+    with _cache_lock:
+        if path is None:
+            _cache.clear()
+        else:
+            _cache.pop(path, None)
+
+def cache_info() -> dict:
+    with _cache_lock:
+        return dict(_cache_stats, entries=len(_cache), bytes=sum(e[2] for e in _cache.values()),
+                    max_bytes=CACHE_MAX_BYTES)
 
 # ----------------- Ensure Data Files -----------------
 
 def ensure_data_files():
     """Create data directory and CSV files with headers if they don't exist."""
     os.makedirs(DATA_DIR, exist_ok=True)
-    
-    files_headers = [
-        (USERS_CSV, "user_id,username,role,name,password_hash,salt\n"),
-        (FARMERS_CSV, "farmer_id,username,name,location,contact\n"),
-        (CROP_PROFIT_CSV, "Crop Name,Profit Per Acre,Season\n"),
-        (CROP_DETAILS_CSV, "Crop Name,Description\n"),
-        (os.path.join(DATA_DIR, "farmer_crops.csv"), 
-         "username,Crop Name,Field Size (acres),Profit Per Acre,Estimated Profit\n"),
-    ]
-    
-    for path, header in files_headers:
+
+    for path, columns in TABLES.values():
         if not os.path.exists(path):
             with open(path, "w", encoding="utf-8") as f:
-                f.write(header)
+                f.write(",".join(columns) + "\n")
+
+    if use_sqlite():
+        sqlite_backend.ensure_schema(SQLITE_DB, {name: cols for name, (_, cols) in TABLES.items()})
+    elif use_parquet():
+        parquet_backend.ensure_tables(PARQUET_DIR, TABLES)
+
+    global _record_ids_checked, _partition_names_checked
+    if not _record_ids_checked:
+        _record_ids_checked = True
+        if _needs_record_ids():
+            backfill_record_ids()
+    if not _partition_names_checked:
+        _partition_names_checked = True
+        if partitioned():
+            rename_legacy_partitions()
+
+
+# ----------------- Typed Parsing -----------------
 
+def _table_for_path(path: str) -> str | None:
+    if os.path.dirname(os.path.abspath(path)) == os.path.abspath(FARMER_CROPS_DIR):
+        return "farmer_crops"
+    for table, (table_path, _) in TABLES.items():
+        if os.path.abspath(table_path) == os.path.abspath(path):
+            return table
+    return None
+
+def apply_schema(df: pd.DataFrame, table: str) -> pd.DataFrame:
+    """Convert the declared columns of `df` in place; unparseable numbers become missing values."""
+    for col, dtype in SCHEMAS.get(table, {}).items():
+        if col not in df.columns:
+            continue
+        if dtype == "category":
+            df[col] = df[col].astype("category")
+        else:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+    return df
+
+def _read_typed(path: str) -> pd.DataFrame:
+    """Parse a CSV straight into its schema's dtypes, falling back to a coercing pass on bad values."""
+    table = _table_for_path(path)
+    if table is None:
+        return pd.read_csv(path, dtype=str)
+    dtypes = {col: str for col in TABLES[table][1]}
+    dtypes.update(SCHEMAS.get(table, {}))
+    try:
+        return pd.read_csv(path, dtype=dtypes)
+    except (ValueError, TypeError):
+        return apply_schema(pd.read_csv(path, dtype=str), table)
+
+def typed_value(table: str, col: str, value):
+    """Cast a single value to the schema type of table.col (used for key matching and updates)."""
+    dtype = SCHEMAS.get(table, {}).get(col)
+    if dtype in ("Int64", "float64"):
+        return pd.to_numeric(value, errors="coerce")
+    return None if value is None else str(value)
+
+def _match(df: pd.DataFrame, table: str, col: str, value) -> pd.Series:
+    mask = df[col] == typed_value(table, col, value)
+    return mask.fillna(False).astype(bool)
+
+def _assign(df: pd.DataFrame, mask: pd.Series, table: str, changes: dict):
+    for col, value in changes.items():
+        value = typed_value(table, col, value)
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and value not in df[col].cat.categories:
+            df[col] = df[col].cat.add_categories([value])
+        df.loc[mask, col] = value
 
 # ----------------- Load & Save Functions -----------------
 
 def load_csv(path: str) -> pd.DataFrame:
+    """Read a CSV, typed by SCHEMAS when it belongs to a known table."""
     ensure_data_files()
-    return pd.read_csv(path, dtype=str)
+    return _cached_read(path, _read_typed)
 
 def save_csv(df: pd.DataFrame, path: str):
-    df.to_csv(path, index=False)
+    """Write a CSV via a temp file and rename, so readers see the old file or the new one, never half of it."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    invalidate_cache(path)
+
+# ----------------- Projection & Filters -----------------
+# Filters use pyarrow's form: a list of (column, op, value) tuples that must all hold.
+
+FILTER_OPS = {"=": operator.eq, "==": operator.eq, "!=": operator.ne,
+              "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+def _filter_mask(df: pd.DataFrame, table: str, col: str, op: str, value) -> pd.Series:
+    if op in ("in", "not in"):
+        mask = df[col].isin([typed_value(table, col, v) for v in value])
+        return ~mask if op == "not in" else mask
+    mask = FILTER_OPS[op](df[col], typed_value(table, col, value))
+    return mask.fillna(False).astype(bool)
+
+def _select(df: pd.DataFrame, table: str, columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
+    """Apply `filters` and keep only `columns`, for backends that can't push them down."""
+    for col, op, value in filters or ():
+        df = df[_filter_mask(df, table, col, op, value)]
+    return df if columns is None else df.reindex(columns=list(columns))
+
+def _needed_columns(table: str, columns: list | None, filters: list | None) -> list:
+    """The requested columns plus any that the filters look at."""
+    if columns is None:
+        return TABLES[table][1]
+    return list(dict.fromkeys(list(columns) + [col for col, _, _ in filters or ()]))
+
+def _parquet_filters(table: str, filters: list | None) -> list | None:
+    """Cast filter values to the column types stored in parquet."""
+    if not filters:
+        return None
+    return [(col, op, [typed_value(table, col, v) for v in value] if op in ("in", "not in")
+             else typed_value(table, col, value)) for col, op, value in filters]
+
+# ----------------- Table Access -----------------
+
+def _load_csv_table(table: str) -> pd.DataFrame:
+    path, _ = TABLES[table]
+    if table == "farmer_crops" and _has_partitions():
+        return _scan_partitions()
+    ensure_data_files()
+    return _versioned_read(path)
+
+def _write_csv_table(table: str, df: pd.DataFrame):
+    """Replace a single-file CSV table with `df`. Hold the file's lock while calling."""
+    path, _ = TABLES[table]
+    save_csv(df, path)
+    if table in LOG_TABLES:
+        _clear_tombstones(path)
+    else:
+        _key_index_rewritten(table, df)
+
+def _save_csv_table(table: str, df: pd.DataFrame):
+    """Commit a whole-table save. If the file changed since `df` was read, `df`'s edits are merged in instead."""
+    path, _ = TABLES[table]
+    if table == "farmer_crops" and _has_partitions():
+        _save_partitions(df)
+        return
+    with file_lock(path):
+        version = df.attrs.get("version")
+        if version is not None and version != _log_signature(path):
+            df = _merge_rows(table, _base_frame(path, version), df, _live_frame(path))
+        _write_csv_table(table, df)
+
+def _parquet_lock(table: str):
+    os.makedirs(PARQUET_DIR, exist_ok=True)
+    return file_lock(parquet_backend.table_dir(PARQUET_DIR, table))
+
+def load_table(table: str, columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
+    """Load a table, optionally only `columns` and the rows matching `filters`.
+
+    Parquet reads just those columns and skips row groups the filters rule out; SQLite
+    selects just the columns (and the rows, for a leading text equality filter); CSV
+    parses everything and narrows the result. For farmer_crops the index holds row
+    positions in the log (or SQLite rowids).
+    """
+    all_columns = TABLES[table][1]
+    if use_sqlite():
+        ensure_data_files()
+        key_col = key_value = None
+        if filters and filters[0][1] in ("=", "==") and isinstance(filters[0][2], str):
+            key_col, _, key_value = filters[0]  # text equality is exact in SQL too, so let the query do it
+        df = sqlite_backend.read_table(SQLITE_DB, table, _needed_columns(table, columns, filters), key_col, key_value)
+        return _select(apply_schema(df, table), table, columns, filters)
+    if use_parquet():
+        ensure_data_files()
+        df = parquet_backend.read_table(PARQUET_DIR, table, list(columns or all_columns), SCHEMAS.get(table, {}),
+                                        _parquet_filters(table, filters))
+        return apply_schema(df, table)
+    return _select(_load_csv_table(table), table, columns, filters)
+
+def save_table(table: str, df: pd.DataFrame):
+    columns = TABLES[table][1]
+    if use_sqlite():
+        sqlite_backend.replace_table(SQLITE_DB, table, df, columns)
+    elif use_parquet():
+        with _parquet_lock(table):
+            parquet_backend.replace_table(PARQUET_DIR, table, df, columns, SCHEMAS.get(table, {}))
+    else:
+        _save_csv_table(table, df)
 
-def load_users() -> pd.DataFrame:
-    return load_csv(USERS_CSV)
+def count_rows(table: str) -> int:
+    """Number of rows in a table. Parquet answers from file footers and SQLite with COUNT(*)."""
+    if use_parquet():
+        ensure_data_files()
+        return parquet_backend.count_rows(PARQUET_DIR, table)
+    if use_sqlite():
+        ensure_data_files()
+        return sqlite_backend.count_rows(SQLITE_DB, table)
+    return len(load_table(table))
+
+# SQLite table versions as of a signature of the database files; the counters are
+# only read again once some write has touched them.
+_sqlite_versions = {}
+
+def table_version(table: str) -> tuple:
+    """A cheap token (stat calls only, mostly) that changes whenever the table's data changes on disk."""
+    if use_sqlite():
+        wal = SQLITE_DB + "-wal"
+        signature = (file_signature(SQLITE_DB), file_signature(wal) if os.path.exists(wal) else None)
+        cached = _sqlite_versions.get(table)
+        if cached is None or cached[0] != signature:
+            # taken after the signature, so a write in between just means another read next time
+            cached = _sqlite_versions[table] = (signature, sqlite_backend.table_version(SQLITE_DB, table))
+        # the table's own change counter; the inode tells a recreated database apart
+        return (signature[0][2], cached[1])
+    if use_parquet():
+        return parquet_backend.table_version(PARQUET_DIR, table)
+    if table == "farmer_crops" and _has_partitions():
+        return tuple(_log_signature(part) for part in partition_paths())
+    return _log_signature(TABLES[table][0])
+
+def load_users(columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
+    return load_table("users", columns, filters)
 
 def save_users(df: pd.DataFrame):
-    save_csv(df, USERS_CSV)
+    save_table("users", df)
 
-def load_crops() -> pd.DataFrame:
+def load_crops(columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
     """Load farmer_crops.csv data"""
-    farmer_crops_path = os.path.join(DATA_DIR, "farmer_crops.csv")
-    if os.path.exists(farmer_crops_path):
-        return pd.read_csv(farmer_crops_path, dtype=str)
-    return pd.DataFrame()
+    return load_table("farmer_crops", columns, filters)
 
 def save_crops(df: pd.DataFrame):
     """Save farmer_crops.csv data"""
-    farmer_crops_path = os.path.join(DATA_DIR, "farmer_crops.csv")
-    save_csv(df, farmer_crops_path)
+    save_table("farmer_crops", df)
+
+def load_farmer_crops(username: str) -> pd.DataFrame:
+    """Load one farmer's crop records. When partitioned only that farmer's file is read."""
+    path, columns = TABLES["farmer_crops"]
+    if use_sqlite():
+        ensure_data_files()
+        df = sqlite_backend.read_table(SQLITE_DB, "farmer_crops", columns, "username", username)
+        return apply_schema(df, "farmer_crops")
+    if use_parquet():
+        return load_table("farmer_crops", filters=[("username", "==", username)])
+    if partitioned():
+        part = partition_path(username)
+        return _load_log(part) if os.path.exists(part) else _empty_table("farmer_crops")
+    df = _load_log(path)
+    return df[_match(df, "farmer_crops", "username", username)]
 
 
-def load_farmers() -> pd.DataFrame:
-    return load_csv(FARMERS_CSV)
+def load_farmers(columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
+    return load_table("farmers", columns, filters)
 
 def save_farmers(df: pd.DataFrame):
-    save_csv(df, FARMERS_CSV)
+    save_table("farmers", df)
 
-def load_crop_profit() -> pd.DataFrame:
-    return load_csv(CROP_PROFIT_CSV)
+def load_crop_profit(columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
+    return load_table("crop_profit", columns, filters)
 
 def save_crop_profit(df: pd.DataFrame):
-    save_csv(df, CROP_PROFIT_CSV)
+    save_table("crop_profit", df)
 
-def load_crop_details() -> pd.DataFrame:
-    return load_csv(CROP_DETAILS_CSV)
+def load_crop_details(columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
+    return load_table("crop_details", columns, filters)
 
 def save_crop_details(df: pd.DataFrame):
-    save_csv(df, CROP_DETAILS_CSV)
+    save_table("crop_details", df)
+
+def load_crop_aliases(columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
+    """Local/regional crop names (Alias) and the catalog crop each one means"""
+    return load_table("crop_aliases", columns, filters)
+
+def save_crop_aliases(df: pd.DataFrame):
+    save_table("crop_aliases", df)
+
+def load_crop_prices(columns: list | None = None, filters: list | None = None) -> pd.DataFrame:
+    """Every Profit Per Acre a crop has had, from the date in Effective From (append-only)"""
+    return load_table("crop_prices", columns, filters)
+
+# ----------------- Append Log & Tombstones -----------------
+
+def _tombstone_path(path: str) -> str:
+    return path + ".tombstones"
+
+def _read_tombstones(path: str) -> set:
+    tpath = _tombstone_path(path)
+    if not os.path.exists(tpath):
+        return set()
+    with open(tpath, "r", encoding="utf-8") as f:
+        return {int(line) for line in f if line.strip()}
+
+def _append_tombstones(path: str, positions):
+    with open(_tombstone_path(path), "a", encoding="utf-8") as f:
+        f.writelines(f"{int(p)}\n" for p in positions)
+
+def _clear_tombstones(path: str):
+    if os.path.exists(_tombstone_path(path)):
+        os.remove(_tombstone_path(path))
+
+def _load_log(path: str) -> pd.DataFrame:
+    """Read an append log, hiding tombstoned rows. The index keeps each row's position in the file."""
+    df = load_csv(path)
+    dead = _read_tombstones(path)
+    if dead:
+        df = df.drop(index=list(dead), errors="ignore")
+    return df
+
+def _write_lines(path: str, frame: pd.DataFrame):
+    """Append `frame` to the end of the CSV without reading it. Hold the file's lock while calling."""
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+    frame.to_csv(path, mode="a", header=False, index=False)
+
+def _append_csv(path: str, columns: list, rows: list):
+    """Write `rows` to the end of the CSV under its lock, without reading the existing data."""
+    ensure_data_files()
+    frame = pd.DataFrame(rows, columns=columns)
+    table = _table_for_path(path)
+    with file_lock(path):
+        if not os.path.exists(path):  # first record in a new partition
+            save_csv(frame, path)
+            if table == "farmer_crops":
+                _aggregate_change(path, None, added=frame)
+            return
+        index = _record_indexes.get(path)
+        fresh = index is not None and index["signature"] == _log_signature(path)
+        old_signature = file_signature(path)
+        before = _aggregate_signature(path) if table == "farmer_crops" else None
+        _write_lines(path, frame)
+        if fresh:
+            first = index["rows"]
+            index["positions"].update(zip(frame["record_id"].tolist(), range(first, first + len(frame))))
+            index["rows"] = first + len(frame)
+            index["signature"] = _log_signature(path)
+        _key_index_appended(table, old_signature, frame)
+        if table == "farmer_crops":
+            _aggregate_change(path, before, added=frame)
+
+def _compact_log(path: str) -> int:
+    """Fold one log's tombstones into the file. Returns the number of rows dropped."""
+    with file_lock(path):
+        dead = _read_tombstones(path)
+        if not dead or not os.path.exists(path):
+            return 0
+        before = _aggregate_signature(path)
+        df = load_csv(path)
+        live = df.drop(index=list(dead), errors="ignore")
+        save_csv(live, path)
+        _clear_tombstones(path)
+        _aggregate_change(path, before)
+    return len(df) - len(live)
+
+def compact_crops() -> int:
+    """Fold farmer_crops tombstones into the CSV (or every partition). Returns the number of rows dropped."""
+    return sum(_compact_log(path) for path in _crop_logs())
+
+def compact_crops_in_background(path: str | None = None) -> threading.Thread:
+    """Compact one log (or all of farmer_crops) on a worker thread. It is not a daemon, so the process waits for it on exit."""
+    target = compact_crops if path is None else (lambda: _compact_log(path))
+    worker = threading.Thread(target=target, name="farmer-crops-compaction")
+    worker.start()
+    return worker
+
+# ----------------- farmer_crops Partitions -----------------
+
+# Bumped when partition_path() names files differently; rename_legacy_partitions() upgrades older directories.
+PARTITION_LAYOUT = 2
+PARTITION_LAYOUT_FILE = "LAYOUT"
+
+def _has_partitions() -> bool:
+    return os.path.isdir(FARMER_CROPS_DIR)
+
+def partitioned() -> bool:
+    """True once farmer_crops has been split into one file per farmer (CSV backend only)."""
+    return not use_sqlite() and not use_parquet() and _has_partitions()
+
+def partition_path(username) -> str:
+    """The farmer's log: the escaped, lower-cased username plus a hash of the exact one, so
+    usernames differing only in case get their own files on case-insensitive filesystems too."""
+    name = str(username)
+    digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(FARMER_CROPS_DIR, f"{quote(name.lower(), safe='')[:64]}-{digest}.csv")
+
+def partition_paths() -> list:
+    return sorted(os.path.join(FARMER_CROPS_DIR, name) for name in os.listdir(FARMER_CROPS_DIR)
+                  if name.endswith(".csv"))
+
+def _crop_logs() -> list:
+    """Every append log that holds farmer_crops rows."""
+    return partition_paths() if partitioned() else [FARMER_CROPS_CSV]
+
+def _empty_table(table: str) -> pd.DataFrame:
+    return apply_schema(pd.DataFrame(columns=TABLES[table][1]), table)
+
+def _load_partition(path: str) -> pd.DataFrame | None:
+    try:
+        return _load_log(path)
+    except FileNotFoundError:  # the farmer's records were deleted mid-scan
+        return None
+
+def _scan_partitions() -> pd.DataFrame:
+    """Read every partition on a thread pool and stack them, for admin views and reports."""
+    paths = partition_paths()
+    if not paths:
+        return _empty_table("farmer_crops")
+    with ThreadPoolExecutor(max_workers=max(1, min(SCAN_WORKERS, len(paths)))) as pool:
+        frames = [df for df in pool.map(_load_partition, paths) if df is not None]
+    if not frames:
+        return _empty_table("farmer_crops")
+    # Partitions carry different Crop Name categories, so re-apply the schema after stacking.
+    return apply_schema(pd.concat(frames, ignore_index=True), "farmer_crops")
+
+def _drop_partition(path: str) -> int:
+    """Remove a farmer's partition outright. Returns the number of live rows it held."""
+    with file_lock(path):
+        if not os.path.exists(path):
+            return 0
+        before = _aggregate_signature(path)
+        live = _load_log(path)
+        os.remove(path)
+        _clear_tombstones(path)
+        invalidate_cache(path)
+        _record_indexes.pop(path, None)
+        _aggregate_change(path, before, removed=live)
+        remove_lock_file(path)
+    return len(live)
+
+def _save_partitions(df: pd.DataFrame):
+    """Rewrite farmer_crops from `df`, one partition per username; farmers with no rows left are removed."""
+    groups = {partition_path(username): frame for username, frame in df.groupby("username", sort=False, dropna=False)}
+    for path in partition_paths():
+        if path not in groups:
+            _drop_partition(path)
+    for path, frame in groups.items():
+        with file_lock(path):
+            save_csv(frame, path)
+            _clear_tombstones(path)
+
+def _mark_partition_layout(directory: str):
+    with open(os.path.join(directory, PARTITION_LAYOUT_FILE), "w", encoding="utf-8") as f:
+        f.write(f"{PARTITION_LAYOUT}\n")
+
+def _partition_layout() -> int:
+    try:
+        with open(os.path.join(FARMER_CROPS_DIR, PARTITION_LAYOUT_FILE), "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 1)
+    except (OSError, ValueError):
+        return 1
+
+def rename_legacy_partitions() -> int:
+    """Move partitions named by the old scheme (the escaped username alone, which let "Ram" and "ram"
+    share a file on case-insensitive filesystems) to partition_path(). Returns the number of rows moved."""
+    if not _has_partitions() or _partition_layout() >= PARTITION_LAYOUT:
+        return 0
+    columns, moved = TABLES["farmer_crops"][1], 0
+    for path in partition_paths():
+        with file_lock(path):
+            live = _load_partition(path)
+        if live is None:
+            continue
+        groups = {partition_path(username): frame
+                  for username, frame in live.groupby("username", sort=False, dropna=False)}
+        if list(groups) == [path]:
+            continue
+        for part, frame in groups.items():
+            _append_csv(part, columns, frame.to_dict("records"))
+            moved += len(frame)
+        _drop_partition(path)
+    _mark_partition_layout(FARMER_CROPS_DIR)
+    return moved
+
+def partition_crops() -> int:
+    """Move the rows in farmer_crops.csv into per-farmer files under FARMER_CROPS_DIR.
+
+    The first run builds the directory aside and renames it into place, so readers
+    switch layouts in one step. Returns the number of rows moved.
+    """
+    if use_sqlite():
+        raise RuntimeError("farmer_crops partitions are only used by the CSV backend")
+    path, columns = TABLES["farmer_crops"]
+    ensure_data_files()
+    with file_lock(path):
+        df = _load_log(path)
+        groups = df.groupby("username", sort=False, dropna=False)
+        if os.path.isdir(FARMER_CROPS_DIR):
+            for username, frame in groups:
+                _append_csv(partition_path(username), columns, frame.to_dict("records"))
+        else:
+            staging = FARMER_CROPS_DIR + ".tmp"
+            shutil.rmtree(staging, ignore_errors=True)
+            os.makedirs(staging)
+            for username, frame in groups:
+                frame.to_csv(os.path.join(staging, os.path.basename(partition_path(username))), index=False)
+            _mark_partition_layout(staging)
+            os.rename(staging, FARMER_CROPS_DIR)
+        save_csv(df.iloc[0:0], path)
+        _clear_tombstones(path)
+        _record_indexes.pop(path, None)
+    return len(df)
+
+# ----------------- farmer_crops Record Index -----------------
+# Per log file: record_id -> row position. Rebuilt only when the log or its
+# tombstones change on disk; this process's own appends/deletes patch it in place.
+
+_record_indexes = {}
+_record_ids_checked = False
+_partition_names_checked = False
+
+def _log_signature(path: str) -> tuple:
+    tpath = _tombstone_path(path)
+    return (file_signature(path), file_signature(tpath) if os.path.exists(tpath) else None)
+
+def _record_positions(path: str) -> dict:
+    """record_id -> position of the live row. Hold the log's lock while calling."""
+    signature = _log_signature(path)
+    index = _record_indexes.get(path)
+    if index is None or index["signature"] != signature:
+        raw = _cached_frame(path, _read_typed)
+        live = raw.drop(index=list(_read_tombstones(path)), errors="ignore")
+        live = live[live["record_id"].notna()]
+        index = _record_indexes[path] = {"signature": signature, "rows": len(raw),
+                                         "positions": dict(zip(live["record_id"].tolist(), live.index.tolist()))}
+    return index["positions"]
+
+def _needs_record_ids() -> bool:
+    if use_sqlite():
+        return sqlite_backend.count_missing(SQLITE_DB, "farmer_crops", "record_id") > 0
+    if use_parquet():
+        return bool(load_table("farmer_crops", columns=["record_id"])["record_id"].isna().any())
+    with open(FARMER_CROPS_CSV, "r", encoding="utf-8") as f:
+        header = f.readline().strip().split(",")
+    return "record_id" not in header
+
+def backfill_record_ids() -> int:
+    """Give every farmer_crops row without a record_id a fresh one. Returns the number of rows filled."""
+    global _record_ids_checked
+    _record_ids_checked = True
+    if use_sqlite():
+        rowids = sqlite_backend.missing_rowids(SQLITE_DB, "farmer_crops", "record_id")
+        if not rowids:
+            return 0
+        first = allocate_ids("record_id", len(rowids))
+        sqlite_backend.set_column_by_rowid(SQLITE_DB, "farmer_crops", "record_id",
+                                           dict(zip(rowids, range(first, first + len(rowids)))))
+        return len(rowids)
+
+    path, columns = TABLES["farmer_crops"]
+    if use_parquet():
+        with _parquet_lock("farmer_crops"):
+            df = load_table("farmer_crops")
+            missing = df["record_id"].isna()
+            count = int(missing.sum())
+            if count:
+                first = allocate_ids("record_id", count)
+                df.loc[missing, "record_id"] = range(first, first + count)
+                parquet_backend.replace_table(PARQUET_DIR, "farmer_crops", df, columns, SCHEMAS["farmer_crops"])
+        return count
+
+    with file_lock(path):
+        df = pd.read_csv(path, dtype=str)
+        if "record_id" not in df.columns:
+            df.insert(0, "record_id", pd.NA)
+        missing = df["record_id"].isna()
+        count = int(missing.sum())
+        if count:
+            first = allocate_ids("record_id", count)
+            df.loc[missing, "record_id"] = [str(i) for i in range(first, first + count)]
+        save_csv(df.reindex(columns=columns), path)
+    return count
+
+def _maybe_compact(path: str, live_rows: int | None = None):
+    """Start a background compaction once enough rows are dead (and, if known, a large enough share)."""
+    dead = len(_read_tombstones(path))
+    if dead < COMPACT_MIN_TOMBSTONES:
+        return
+    if live_rows is None or dead > COMPACT_RATIO * (dead + live_rows):
+        compact_crops_in_background(path)
+
+# ----------------- Key Indexes -----------------
+# Per CSV table: key value -> that row as a dict, for point lookups such as login.
+# Rebuilt only when the file changes on disk; this process's own appends and
+# rewrites refresh it in place, so a lookup never re-parses the file. SQLite
+# answers the same lookups from its username index.
+
+KEY_INDEXES = {"users": "username"}
+
+_key_indexes = {}
+_key_index_lock = threading.Lock()
+
+def _index_rows(table: str, df: pd.DataFrame, rows: dict | None = None) -> dict:
+    """Add the rows of `df` to a key -> row mapping. The first row with a given key wins, like a scan would."""
+    rows = {} if rows is None else rows
+    key_col = KEY_INDEXES[table]
+    for row in df.to_dict("records"):
+        rows.setdefault(row[key_col], row)
+    return rows
+
+def _key_rows(table: str) -> dict:
+    path, _ = TABLES[table]
+    signature = file_signature(path)
+    with _key_index_lock:
+        index = _key_indexes.get(table)
+        if index is not None and index["signature"] == signature:
+            return index["rows"]
+    rows = _index_rows(table, _cached_frame(path, _read_typed))
+    with _key_index_lock:
+        _key_indexes[table] = {"signature": signature, "rows": rows}
+    return rows
+
+def _key_index_appended(table: str | None, old_signature: tuple, frame: pd.DataFrame):
+    """Add rows this process just appended, if the index was current before the append."""
+    if table not in KEY_INDEXES:
+        return
+    with _key_index_lock:
+        index = _key_indexes.get(table)
+        if index is None or index["signature"] != old_signature:
+            return
+        _index_rows(table, apply_schema(frame.copy(), table), index["rows"])
+        index["signature"] = file_signature(TABLES[table][0])
+
+def _key_index_rewritten(table: str, df: pd.DataFrame):
+    """Rebuild the index from the frame this process just wrote out, instead of re-reading it."""
+    if table not in KEY_INDEXES:
+        return
+    rows = _index_rows(table, df)
+    with _key_index_lock:
+        _key_indexes[table] = {"signature": file_signature(TABLES[table][0]), "rows": rows}
+
+def lookup_row(table: str, key_value) -> dict | None:
+    """The first row whose KEY_INDEXES column equals key_value, as a dict, or None."""
+    key_col = KEY_INDEXES[table]
+    if use_sqlite():
+        ensure_data_files()
+        df = sqlite_backend.read_table(SQLITE_DB, table, TABLES[table][1], key_col, key_value)
+        df = apply_schema(df, table)
+        return df.iloc[0].to_dict() if not df.empty else None
+    if use_parquet():
+        df = load_table(table, filters=[(key_col, "==", key_value)])
+        return df.iloc[0].to_dict() if not df.empty else None
+    ensure_data_files()
+    row = _key_rows(table).get(typed_value(table, key_col, key_value))
+    return dict(row) if row is not None else None
+
+def find_user(username: str) -> dict | None:
+    """The users row for `username` as a dict, or None if there is no such user."""
+    return lookup_row("users", username)
+
+def user_exists(username: str) -> bool:
+    return find_user(username) is not None
+
+# ----------------- Versioned Commits -----------------
+# Frames read from a single-file CSV table carry the version they were read at in
+# df.attrs["version"]. Saving one takes the file's lock and, if another writer
+# committed in between, replays this frame's row-level edits onto the current file
+# instead of overwriting it. Recently read versions are kept to diff against.
+
+ROW_KEYS = {"users": "user_id", "farmers": "farmer_id", "farmer_crops": "record_id",
+            "crop_profit": "Crop Name", "crop_details": "Crop Name", "crop_aliases": "Alias"}
+VERSION_HISTORY = 32
+
+# (path, version) -> (shared frame as parsed, tombstoned positions), oldest first.
+_versions = OrderedDict()
+_versions_lock = threading.Lock()
+
+class WriteConflictError(RuntimeError):
+    """A table changed on disk and the version a save was based on is too old to merge against."""
+
+def _versioned_read(path: str) -> pd.DataFrame:
+    """Read a CSV table (minus tombstoned rows) into a private copy tagged with its version."""
+    tpath = _tombstone_path(path)
+    tomb_signature = file_signature(tpath) if os.path.exists(tpath) else None
+    signature, raw = _cached_entry(path, _read_typed)
+    dead = frozenset(_read_tombstones(path))
+    version = (signature, tomb_signature)
+    with _versions_lock:
+        _versions[(path, version)] = (raw, dead)
+        _versions.move_to_end((path, version))
+        while len(_versions) > VERSION_HISTORY:
+            _versions.popitem(last=False)
+    df = raw.drop(index=list(dead), errors="ignore") if dead else raw.copy()
+    df.attrs["version"] = version
+    return df
+
+def _base_frame(path: str, version: tuple) -> pd.DataFrame:
+    with _versions_lock:
+        entry = _versions.get((path, version))
+    if entry is None:
+        raise WriteConflictError(f"{os.path.basename(path)} changed since it was read; reload it and try again")
+    raw, dead = entry
+    return raw.drop(index=list(dead), errors="ignore")
+
+def _live_frame(path: str) -> pd.DataFrame:
+    """The table as it is on disk now. Hold the file's lock while calling."""
+    return _cached_frame(path, _read_typed).drop(index=list(_read_tombstones(path)), errors="ignore")
+
+def _keyed(df: pd.DataFrame, key: str) -> pd.DataFrame:
+    df = df[df[key].notna()]
+    df = df[~df[key].duplicated()]
+    return df.set_axis(df[key].astype(object).tolist())
+
+def _changed_cells(mine: pd.DataFrame, base: pd.DataFrame) -> pd.DataFrame:
+    """Which cells differ between two typed frames of the same shape. Missing equals missing (NaN or <NA>)."""
+    mine, base = mine.astype(object), base.astype(object)
+    mine_na, base_na = mine.isna(), base.isna()
+    same = mine.where(~mine_na, 0).eq(base.where(~base_na, 0)) & ~mine_na & ~base_na
+    return ~(same | (mine_na & base_na))
+
+def _merge_rows(table: str, base: pd.DataFrame, mine: pd.DataFrame, theirs: pd.DataFrame) -> pd.DataFrame:
+    """Replay the edits that turned `base` into `mine` onto `theirs`, matching rows by ROW_KEYS[table].
+
+    Rows deleted from `mine` are removed, cells changed in `mine` are copied over and
+    new rows are appended. Everything else keeps the other writer's values.
+    """
+    key, columns = ROW_KEYS[table], TABLES[table][1]
+    base = _keyed(base, key)
+    mine = _keyed(apply_schema(mine.copy(), table), key)
+    merged = theirs.reset_index(drop=True).astype(object)
+    positions = {}
+    for pos, value in enumerate(merged[key].tolist()):
+        if not pd.isna(value):
+            positions.setdefault(value, pos)
+
+    cols = [c for c in columns if c in mine.columns and c in base.columns]
+    common = [k for k in mine.index.intersection(base.index) if k in positions]
+    changed = _changed_cells(mine.loc[common, cols], apply_schema(base.loc[common, cols].copy(), table))
+    for col in cols:
+        keys = changed.index[changed[col].to_numpy()]
+        if len(keys):
+            merged.loc[[positions[k] for k in keys], col] = mine.loc[keys, col].to_numpy(dtype=object)
+
+    added = mine.index.difference(base.index, sort=False)
+    present = [k for k in added if k in positions]
+    if present:  # added here and by the other writer too: this version wins
+        merged.loc[[positions[k] for k in present], cols] = mine.loc[present, cols].to_numpy(dtype=object)
+    new_rows = [mine.loc[k] for k in added if k not in positions]
+    dropped = [positions[k] for k in base.index.difference(mine.index, sort=False) if k in positions]
+    merged = merged.drop(index=dropped)
+    if new_rows:
+        merged = pd.concat([merged, pd.DataFrame(new_rows).astype(object)], ignore_index=True)
+    return apply_schema(merged.reindex(columns=columns), table)
+
+# ----------------- Row-Level Writes -----------------
+# With the sqlite backend these touch only the affected rows. With CSV, inserts
+# are appended to the end of the file and farmer_crops deletes are tombstoned;
+# other CSV updates/deletes still rewrite the file. Partitioned farmer_crops
+# writes keyed by username touch only that farmer's file.
+
+def insert_row(table: str, row: dict):
+    insert_rows(table, [row])
+
+def insert_rows(table: str, rows: list):
+    """Insert one batch of rows. O(len(rows)) for both backends."""
+    path, columns = TABLES[table]
+    id_col = ROW_ID_COLUMNS.get(table)
+    if id_col:
+        missing = sum(1 for row in rows if row.get(id_col) is None)
+        next_row_id = allocate_ids(id_col, missing) if missing else None
+        stamped = []
+        for row in rows:
+            if row.get(id_col) is None:
+                row = dict(row, **{id_col: next_row_id})
+                next_row_id += 1
+            stamped.append(row)
+        rows = stamped
+    if use_sqlite():
+        ensure_data_files()
+        sqlite_backend.insert_rows(SQLITE_DB, table, rows, columns, on_change=_sqlite_hook(table))
+        return
+    if use_parquet():
+        ensure_data_files()
+        with _parquet_lock(table):
+            before = _aggregate_signature(None) if table == "farmer_crops" else None
+            parquet_backend.append_rows(PARQUET_DIR, table, rows, columns, SCHEMAS.get(table, {}))
+            if table == "farmer_crops":
+                _aggregate_change(None, before, added=pd.DataFrame(rows, columns=columns))
+        return
+    if table == "farmer_crops" and partitioned():
+        by_farmer = {}
+        for row in rows:
+            by_farmer.setdefault(partition_path(row.get("username")), []).append(row)
+        for part, part_rows in by_farmer.items():
+            _append_csv(part, columns, part_rows)
+        return
+    _append_csv(path, columns, rows)
+
+def update_rows(table: str, key_col: str, key_value, changes: dict) -> int:
+    """Apply `changes` to every row whose key_col equals key_value. Returns the number of rows updated."""
+    if use_sqlite():
+        ensure_data_files()
+        return sqlite_backend.update_rows(SQLITE_DB, table, key_col, key_value, changes,
+                                          on_change=_sqlite_hook(table))
+    if use_parquet():
+        with _parquet_lock(table):
+            df = load_table(table)
+            mask = _match(df, table, key_col, key_value)
+            if changes and mask.any():
+                before, old = _aggregate_signature(None), df[mask].copy()
+                _assign(df, mask, table, changes)
+                parquet_backend.replace_table(PARQUET_DIR, table, df, TABLES[table][1], SCHEMAS.get(table, {}))
+                if table == "farmer_crops":
+                    _aggregate_change(None, before, added=df[mask], removed=old)
+        return int(mask.sum())
+    if table == "farmer_crops" and partitioned() and key_col == "username" and "username" not in changes:
+        part = partition_path(key_value)
+        if not changes or not os.path.exists(part):
+            return 0
+        with file_lock(part):
+            before = _aggregate_signature(part)
+            df = _load_log(part)
+            old = df.copy()
+            _assign(df, pd.Series(True, index=df.index), table, changes)
+            save_csv(df, part)
+            _clear_tombstones(part)
+            _aggregate_change(part, before, added=df, removed=old)
+        return len(df)
+    df = load_table(table)
+    mask = _match(df, table, key_col, key_value)
+    if changes and mask.any():
+        _assign(df, mask, table, changes)
+        save_table(table, df)
+    return int(mask.sum())
+
+def delete_rows(table: str, key_col: str, key_value) -> int:
+    """Delete every row whose key_col equals key_value. Returns the number of rows removed."""
+    path, _ = TABLES[table]
+    if use_sqlite():
+        ensure_data_files()
+        return sqlite_backend.delete_rows(SQLITE_DB, table, key_col, key_value, on_change=_sqlite_hook(table))
+    if use_parquet():
+        with _parquet_lock(table):
+            df = load_table(table)
+            mask = _match(df, table, key_col, key_value)
+            if mask.any():
+                before = _aggregate_signature(None)
+                parquet_backend.replace_table(PARQUET_DIR, table, df[~mask], TABLES[table][1], SCHEMAS.get(table, {}))
+                if table == "farmer_crops":
+                    _aggregate_change(None, before, removed=df[mask])
+        return int(mask.sum())
+    if table == "farmer_crops" and partitioned():
+        if key_col == "username":
+            return _drop_partition(partition_path(key_value))
+        return sum(_tombstone_matches(part, table, key_col, key_value) for part in partition_paths())
+    if table in LOG_TABLES:
+        return _tombstone_matches(path, table, key_col, key_value)
+    df = load_table(table)
+    mask = _match(df, table, key_col, key_value)
+    if mask.any():
+        save_table(table, df[~mask])
+    return int(mask.sum())
+
+def _tombstone_matches(path: str, table: str, key_col: str, key_value) -> int:
+    """Tombstone every live row of one log whose key_col equals key_value."""
+    with file_lock(path):
+        if not os.path.exists(path):
+            return 0
+        before = _aggregate_signature(path)
+        df = _load_log(path)
+        mask = _match(df, table, key_col, key_value)
+        _append_tombstones(path, df.index[mask])
+        if table == "farmer_crops":
+            _aggregate_change(path, before, removed=df[mask])
+    _maybe_compact(path, len(df) - int(mask.sum()))
+    return int(mask.sum())
+
+def _record_logs(username) -> list:
+    """The logs that can hold a record: the owner's partition when known, otherwise all of them."""
+    if username is not None and partitioned():
+        return [partition_path(username)]
+    return _crop_logs()
+
+def delete_crop_record(record_id, username: str | None = None) -> bool:
+    """Delete one farmer_crops record by its record_id. Returns False if it doesn't exist.
+
+    Passing the owner's username lets a partitioned table look in that farmer's file only.
+    """
+    record_id = int(record_id)
+    if use_sqlite():
+        ensure_data_files()
+        return sqlite_backend.delete_rows(SQLITE_DB, "farmer_crops", "record_id", record_id,
+                                          on_change=_sqlite_hook("farmer_crops")) > 0
+    if use_parquet():
+        return delete_rows("farmer_crops", "record_id", record_id) > 0
+    ensure_data_files()
+    for path in _record_logs(username):
+        with file_lock(path):
+            if not os.path.exists(path):
+                continue
+            positions = _record_positions(path)
+            if record_id not in positions:
+                continue
+            before = _aggregate_signature(path)
+            position = positions.pop(record_id)
+            old = _cached_frame(path, _read_typed).loc[[position]]
+            _append_tombstones(path, [position])
+            _record_indexes[path]["signature"] = _log_signature(path)
+            _aggregate_change(path, before, removed=old)
+        _maybe_compact(path, len(positions))
+        return True
+    return False
+
+def update_crop_record(record_id, changes: dict, username: str | None = None) -> bool:
+    """Update one farmer_crops record by its record_id. Returns False if it doesn't exist.
+
+    With CSV the new version of the row is appended and the old one tombstoned. If a
+    partitioned record changes owner, the new version goes to the new owner's file.
+    """
+    record_id = int(record_id)
+    if use_sqlite():
+        ensure_data_files()
+        return sqlite_backend.update_rows(SQLITE_DB, "farmer_crops", "record_id", record_id, changes,
+                                          on_change=_sqlite_hook("farmer_crops")) > 0
+    if use_parquet():
+        return update_rows("farmer_crops", "record_id", record_id, changes) > 0
+    columns = TABLES["farmer_crops"][1]
+    ensure_data_files()
+    for path in _record_logs(username):
+        with file_lock(path):
+            if not os.path.exists(path):
+                continue
+            positions = _record_positions(path)
+            if record_id not in positions:
+                continue
+            index = _record_indexes[path]
+            old_position = positions[record_id]
+            old = _cached_frame(path, _read_typed).loc[[old_position]]
+            row = old.iloc[0].to_dict()
+            row.update(changes)
+            moved = partitioned() and partition_path(row["username"]) != path
+            before = _aggregate_signature(path)
+            if not moved:
+                _write_lines(path, pd.DataFrame([row], columns=columns))
+            _append_tombstones(path, [old_position])
+            if moved:
+                positions.pop(record_id)
+            else:
+                positions[record_id] = index["rows"]
+                index["rows"] += 1
+            index["signature"] = _log_signature(path)
+            _aggregate_change(path, before, added=None if moved else pd.DataFrame([row], columns=columns),
+                              removed=old)
+        if moved:
+            _append_csv(partition_path(row["username"]), columns, [row])
+        _maybe_compact(path, len(positions))
+        return True
+    return False
+
+# ----------------- Streaming Reads -----------------
+# iter_crops() yields farmer_crops a chunk at a time for reports over histories
+# too big to load. Each CSV log is read as it stood when the scan reached it:
+# rows appended later are left out, and a compaction swapping the file in the
+# meantime doesn't disturb the open handle.
+
+class _Prefix:
+    """Read-only view of the first `size` bytes of an open file."""
+
+    def __init__(self, f, size: int):
+        self._f, self._left = f, size
+
+    def read(self, n: int = -1) -> bytes:
+        n = self._left if n is None or n < 0 else min(n, self._left)
+        data = self._f.read(n)
+        self._left -= len(data)
+        return data
+
+def _iter_log(path: str, columns: list, chunk_rows: int):
+    with ExitStack() as stack:
+        with file_lock(path):  # the file and its tombstones as one snapshot
+            try:
+                f = stack.enter_context(open(path, "rb"))
+            except FileNotFoundError:  # the farmer's records were deleted
+                return
+            dead = np.sort(np.fromiter(_read_tombstones(path), dtype=np.int64))
+            size = os.fstat(f.fileno()).st_size
+        lenient = {col: str for col in columns}
+        typed = dict(lenient, **{col: dtype for col, dtype in SCHEMAS["farmer_crops"].items() if col in columns})
+        done = 0  # rows of the file already yielded
+        # parse straight into the schema's dtypes; if a value doesn't parse, re-read the rest as text and coerce
+        for dtypes in (typed, lenient):
+            f.seek(0)
+            try:
+                offset = done
+                reader = pd.read_csv(_Prefix(f, size), usecols=columns, dtype=dtypes, chunksize=chunk_rows,
+                                     skiprows=range(1, offset + 1))
+                for chunk in reader:
+                    if not len(chunk):
+                        continue
+                    chunk.index += offset
+                    first, last = chunk.index[0], chunk.index[-1]
+                    done = last + 1
+                    if len(dead):
+                        chunk = chunk.drop(index=dead[np.searchsorted(dead, first):np.searchsorted(dead, last, side="right")])
+                    yield apply_schema(chunk, "farmer_crops")
+                return
+            except pd.errors.EmptyDataError:
+                return
+            except (ValueError, TypeError):
+                continue
+
+def iter_crops(columns: list | None = None, chunk_rows: int | None = None):
+    """Yield farmer_crops (or just `columns`) as typed frames of up to chunk_rows (default STREAM_CHUNK_ROWS) rows."""
+    ensure_data_files()
+    columns = columns or TABLES["farmer_crops"][1]
+    chunk_rows = chunk_rows or STREAM_CHUNK_ROWS
+    if use_sqlite():
+        for chunk in sqlite_backend.iter_table(SQLITE_DB, "farmer_crops", columns, chunk_rows):
+            yield apply_schema(chunk, "farmer_crops")
+    elif use_parquet():
+        yield from parquet_backend.iter_table(PARQUET_DIR, "farmer_crops", columns, chunk_rows)
+    else:
+        for path in _crop_logs():
+            yield from _iter_log(path, columns, chunk_rows)
+
+def _crops_bytes() -> int:
+    if use_sqlite():
+        return os.path.getsize(SQLITE_DB) if os.path.exists(SQLITE_DB) else 0
+    if use_parquet():
+        return sum(os.path.getsize(p) for p in parquet_backend.part_paths(PARQUET_DIR, "farmer_crops"))
+    return sum(os.path.getsize(p) for p in _crop_logs() if os.path.exists(p))
+
+def stream_reports() -> bool:
+    """Whether reports should stream farmer_crops rather than load it whole (see STREAM_REPORTS)."""
+    if STREAM_REPORTS in ("on", "off"):
+        return STREAM_REPORTS == "on"
+    return _crops_bytes() > CACHE_MAX_BYTES
+
+# ----------------- Parallel Reports -----------------
+
+def summarize_crops(groupings: list, workers: int | None = None) -> list:
+    """Estimated Profit, Field Size (acres) and Records totals of farmer_crops for each grouping.
+
+    A grouping is a tuple of key columns, e.g. ("username",) or ("username", "Crop Name");
+    one frame of key columns plus totals comes back per grouping. CSV logs (or partitions)
+    and parquet parts are read and summed in chunks on `workers` processes (default
+    REPORT_WORKERS). With one worker, or the sqlite backend, the table is loaded and
+    summed here, using the in-memory cache.
+    """
+    ensure_data_files()
+    workers = REPORT_WORKERS if workers is None else workers
+    columns = sorted({key for keys in groupings for key in keys}) + report_engine.MEASURES
+    dtypes = {col: SCHEMAS["farmer_crops"].get(col, str) for col in columns}
+    if workers > 1 and not use_sqlite():
+        for _ in range(3):
+            if use_parquet():
+                parts = parquet_backend.part_paths(PARQUET_DIR, "farmer_crops")
+                version = table_version("farmer_crops")
+                tasks = report_engine.plan_parquet(parts, REPORT_CHUNK_BYTES)
+            else:
+                logs = [path for path in _crop_logs() if os.path.exists(path)]
+                version = [_log_signature(path) for path in logs]
+                tasks = report_engine.plan_csv(logs, {path: _read_tombstones(path) for path in logs},
+                                               REPORT_CHUNK_BYTES)
+            try:
+                totals = report_engine.run(tasks, groupings, columns, dtypes, workers)
+            except FileNotFoundError:  # a partition was dropped or a part replaced mid-scan
+                continue
+            current = table_version("farmer_crops") if use_parquet() else [_log_signature(p) for p in logs]
+            if current == version:
+                return totals
+    if stream_reports():
+        return _stream_totals(groupings, columns)
+    frame = load_crops(columns=columns)
+    return report_engine.run([[("frame", frame)]], groupings, columns, dtypes, workers=1)
+
+def _stream_totals(groupings: list, columns: list) -> list:
+    """summarize_crops() in this process, holding one chunk of farmer_crops at a time."""
+    folds = [{"Estimated Profit": streaming.Sum("Estimated Profit", keys),
+              "Field Size (acres)": streaming.Sum("Field Size (acres)", keys),
+              "Records": streaming.Count(None, keys)} for keys in groupings]
+    streaming.fold(iter_crops(columns), {(i, name): aggregator for i, aggregators in enumerate(folds)
+                                         for name, aggregator in aggregators.items()})
+    totals = []
+    for keys, aggregators in zip(groupings, folds):
+        part = pd.DataFrame({name: aggregator.result() for name, aggregator in aggregators.items()})
+        totals.append(report_engine.merge_totals([report_engine.string_keys(part, keys)], keys))
+    return totals
+
+# ----------------- farmer_crops Aggregates -----------------
+# Estimated Profit, acreage and record counts per farmer, per crop and for the
+# whole portal, kept in AGGREGATES_JSON so the summary dashboards never scan
+# farmer_crops. The hot write paths (insert, delete, update, reprice, compaction)
+# append their per-key change to the AGGREGATE_DELTAS log while holding the
+# log's lock, a few hundred bytes however big the totals are; reads replay the
+# log over the snapshot, and it is folded into the snapshot once it outgrows
+# it. Both record the signature of every log they reflect; when any differs (a
+# whole-table save, partitioning, an edit by hand) the next read rebuilds the
+# totals with one scan.
+# SQLite answers the same summaries with a GROUP BY instead.
+
+AGGREGATE_COLUMNS = ["Estimated Profit", "Field Size (acres)", "Records"]
+
+# The delta log is folded into AGGREGATES_JSON once it is bigger than both this and the snapshot.
+AGGREGATE_FOLD_MIN_BYTES = 1024 * 1024
+
+def _jsonable(value):
+    return json.loads(json.dumps(value))
+
+def _aggregate_source(path: str | None) -> str:
+    return "parquet" if path is None else os.path.relpath(path, DATA_DIR)
+
+def _aggregate_signature(path: str | None):
+    """Signature of one farmer_crops source: a CSV log, or (None) the parquet table. None if it doesn't exist."""
+    if path is None:
+        return _jsonable(parquet_backend.table_version(PARQUET_DIR, "farmer_crops"))
+    return _jsonable(_log_signature(path)) if os.path.exists(path) else None
+
+def _aggregate_sources() -> dict:
+    if use_parquet():
+        return {_aggregate_source(None): _aggregate_signature(None)}
+    return {_aggregate_source(p): _aggregate_signature(p) for p in _crop_logs() if os.path.exists(p)}
+
+def _group_totals(rows: pd.DataFrame, key: str) -> dict:
+    """{key value: [profit, acres, records]} over `rows`."""
+    if rows.empty:
+        return {}
+    keys = rows[key].to_numpy(dtype=object)
+    names, inverse = np.unique(np.where(pd.isna(keys), "", keys).astype(str), return_inverse=True)
+    # plain numpy rather than a groupby: most writes touch a row or two, where pandas' overhead dominates
+    sums = [np.bincount(inverse, weights=np.nan_to_num(pd.to_numeric(rows[col], errors="coerce")
+                                                         .to_numpy(dtype="float64")), minlength=len(names))
+            for col in ("Estimated Profit", "Field Size (acres)")]
+    counts = np.bincount(inverse, minlength=len(names))
+    return {k: [float(p), float(a), int(n)] for k, p, a, n in zip(names.tolist(), *sums, counts)}
+
+def _rows_delta(added: pd.DataFrame | None, removed: pd.DataFrame | None) -> dict:
+    """The change one write makes to the totals: {"farmers": {...}, "crops": {...}, "portal": [...]}."""
+    delta = {"farmers": {}, "crops": {}, "portal": [0.0, 0.0, 0]}
+    for rows, sign in ((removed, -1), (added, 1)):
+        if rows is None or rows.empty:
+            continue
+        for scope, key in (("farmers", "username"), ("crops", "Crop Name")):
+            bucket = delta[scope]
+            for k, totals in _group_totals(rows, key).items():
+                old = bucket.get(k, [0.0, 0.0, 0])
+                bucket[k] = [old[i] + sign * totals[i] for i in range(3)]
+        profit = pd.to_numeric(rows["Estimated Profit"], errors="coerce").sum()
+        acres = pd.to_numeric(rows["Field Size (acres)"], errors="coerce").sum()
+        portal = delta["portal"]
+        delta["portal"] = [portal[0] + sign * float(profit), portal[1] + sign * float(acres),
+                           portal[2] + sign * len(rows)]
+    return delta
+
+def _apply_delta(data: dict, delta: dict):
+    for scope in ("farmers", "crops"):
+        bucket = data[scope]
+        for k, change in delta[scope].items():
+            old = bucket.get(k, [0.0, 0.0, 0])
+            new = [old[i] + change[i] for i in range(3)]
+            if new[2] > 0:
+                bucket[k] = new
+            else:
+                bucket.pop(k, None)
+    data["portal"] = [data["portal"][i] + delta["portal"][i] for i in range(3)]
+
+def _read_aggregates() -> dict | None:
+    try:
+        with open(AGGREGATES_JSON, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_aggregates(data: dict):
+    tmp_path = f"{AGGREGATES_JSON}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, AGGREGATES_JSON)
+
+def _read_deltas(log_path: str) -> list:
+    """A delta log's entries, oldest first. A torn last line (a crash mid-append) is skipped."""
+    entries = []
+    try:
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+def _replay(data: dict, entries: list, apply=_apply_delta) -> dict:
+    """Apply each delta whose `before` matches the source as `data` has it. Replaying an entry twice is a no-op."""
+    for entry in entries:
+        source = entry["source"]
+        if data["sources"].get(source) != entry["before"]:
+            continue
+        apply(data, entry)
+        if entry["after"] is None:
+            data["sources"].pop(source, None)
+        else:
+            data["sources"][source] = entry["after"]
+    return data
+
+def _fold_deltas(data: dict | None = None):
+    """Replay the delta log into the saved totals (or into `data`, saved instead) and empty it. Hold the lock."""
+    data = data if data is not None else _read_aggregates()
+    if data is not None:
+        _write_aggregates(_replay(data, _read_deltas(AGGREGATE_DELTAS)))
+    if os.path.exists(AGGREGATE_DELTAS):
+        os.remove(AGGREGATE_DELTAS)
+
+def _deltas_due(log_path: str, snapshot_path: str, min_bytes: int) -> bool:
+    """Whether a delta log has outgrown both its snapshot and `min_bytes` and should be folded."""
+    try:
+        size = os.path.getsize(log_path)
+    except OSError:
+        return False
+    try:
+        base = os.path.getsize(snapshot_path)
+    except OSError:
+        base = 0
+    return size > max(min_bytes, base)
+
+def _aggregate_change(path: str | None, before, added: pd.DataFrame | None = None,
+                      removed: pd.DataFrame | None = None):
+    """Log one write's change to the aggregates and the sketches. Hold the written log's lock
+    (or the parquet lock).
+
+    `before` is the source's _aggregate_signature() from just before the write. The
+    delta only applies on top of totals that reflect that version (see _replay).
+    """
+    source, after = _aggregate_source(path), _aggregate_signature(path)
+    _sketch_change(source, before, after, added, 0 if removed is None else len(removed))
+    if not os.path.exists(AGGREGATES_JSON):
+        return  # nothing to keep up to date; the first read builds the totals
+    line = json.dumps({"source": source, "before": before, "after": after, **_rows_delta(added, removed)}) + "\n"
+    with file_lock(AGGREGATES_JSON):
+        with open(AGGREGATE_DELTAS, "a", encoding="utf-8") as f:
+            f.write(line)
+        if _deltas_due(AGGREGATE_DELTAS, AGGREGATES_JSON, AGGREGATE_FOLD_MIN_BYTES):
+            _fold_deltas()
+
+def _totals_dict(frame: pd.DataFrame) -> dict:
+    return {key: [float(profit), float(acres), int(records)]
+            for key, profit, acres, records in frame[[frame.columns[0]] + AGGREGATE_COLUMNS].itertuples(index=False)}
+
+def rebuild_aggregates() -> dict:
+    """Recompute the farmer_crops aggregates with one scan and save them. Returns the raw totals."""
+    ensure_data_files()
+    for _ in range(3):
+        sources = _aggregate_sources()
+        farmers, crops = summarize_crops([("username",), ("Crop Name",)])
+        if _aggregate_sources() == sources:
+            break
+    else:
+        sources = None  # writes kept landing mid-scan; use the result but don't save it
+    data = {"sources": sources or {}, "farmers": _totals_dict(farmers), "crops": _totals_dict(crops),
+            "portal": [float(farmers["Estimated Profit"].sum()), float(farmers["Field Size (acres)"].sum()),
+                       int(farmers["Records"].sum())]}
+    if sources is not None and not use_sqlite():
+        with file_lock(AGGREGATES_JSON):
+            _fold_deltas(_jsonable(data))  # writes that landed after the scan still apply
+    return data
+
+def stored_aggregates() -> dict | None:
+    """The saved totals plus the delta log if they match farmer_crops as it is now, else None."""
+    if _deltas_due(AGGREGATE_DELTAS, AGGREGATES_JSON, AGGREGATE_FOLD_MIN_BYTES):
+        with file_lock(AGGREGATES_JSON):
+            if _deltas_due(AGGREGATE_DELTAS, AGGREGATES_JSON, AGGREGATE_FOLD_MIN_BYTES):
+                _fold_deltas()
+    data = _read_aggregates()
+    if data is None:
+        return None
+    data = _replay(data, _read_deltas(AGGREGATE_DELTAS))  # no lock needed: replay skips entries the snapshot already has
+    return data if data["sources"] == _aggregate_sources() else None
+
+def _totals_frame(totals: dict, key: str) -> pd.DataFrame:
+    df = pd.DataFrame.from_dict(totals, orient="index", columns=AGGREGATE_COLUMNS)
+    df["Records"] = df["Records"].astype("int64")
+    df.index.name = key
+    return df.sort_index().reset_index()
+
+def farmer_crop_totals() -> dict:
+    """Estimated Profit, Field Size (acres) and Records totals without scanning farmer_crops.
+
+    Returns {"farmers": frame by username, "crops": frame by Crop Name, "portal": {column: total}}.
+    """
+    if use_sqlite():
+        ensure_data_files()
+        farmers = sqlite_backend.group_totals(SQLITE_DB, "farmer_crops", "username",
+                                              ["Estimated Profit", "Field Size (acres)"])
+        crops = sqlite_backend.group_totals(SQLITE_DB, "farmer_crops", "Crop Name",
+                                            ["Estimated Profit", "Field Size (acres)"])
+        data = {"farmers": farmers, "crops": crops}
+        data["portal"] = [sum(v[0] for v in farmers.values()), sum(v[1] for v in farmers.values()),
+                          sum(v[2] for v in farmers.values())]
+    else:
+        ensure_data_files()
+        data = stored_aggregates() or rebuild_aggregates()
+    return {"farmers": _totals_frame(data["farmers"], "username"),
+            "crops": _totals_frame(data["crops"], "Crop Name"),
+            "portal": dict(zip(AGGREGATE_COLUMNS, data["portal"]))}
+
+# ----------------- farmer_crops Sketches -----------------
+# Approximate distinct farmers per crop, Estimated Profit quantiles and acreage
+# per crop (see sketches.py), kept in SKETCHES_JSON and kept up to date the way
+# the aggregates are: every write appends the rows it added (or, for a bulk
+# write, a sketch of them) and the number it removed to the SKETCH_DELTAS log,
+# and reads replay the log over the snapshot until it is folded in. Sketches
+# can't take rows back out, so removed rows only count as stale; once more than
+# SKETCH_MAX_STALE of the rows folded in are gone, or the sources changed some
+# other way, the next read rebuilds the sketches with one streamed scan. With
+# SQLite the source is the farmer_crops change counter, and sqlite_backend
+# reports each write made through this module (see _sqlite_hook).
+
+SKETCH_MAX_STALE = 0.02
+
+# Writes adding more rows than this log a sketch of them instead of the rows.
+SKETCH_DELTA_ROWS = 100
+
+# Replaying logged rows costs more than replaying totals, so this log is folded
+# into SKETCHES_JSON sooner: once it is bigger than both this and the snapshot.
+SKETCH_FOLD_MIN_BYTES = 256 * 1024
+
+def _sketch_sources() -> dict:
+    if use_sqlite():
+        return {"sqlite": sqlite_backend.table_version(SQLITE_DB, "farmer_crops")}
+    return _aggregate_sources()
+
+def _read_sketches() -> dict | None:
+    try:
+        with open(SKETCHES_JSON, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_sketches(data: dict):
+    tmp_path = f"{SKETCHES_JSON}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, SKETCHES_JSON)
+
+def _sketch_rows(rows: pd.DataFrame) -> list:
+    """The sketched columns of a few rows as JSON-ready lists (plain lists: pandas' overhead dominates here)."""
+    columns = [[None if pd.isna(value) else value for value in rows[col].tolist()] if col in rows
+               else [None] * len(rows) for col in sketches.CropSketches.COLUMNS]
+    return [list(row) for row in zip(*columns)]
+
+def _sketch_change(source: str, before, after, added: pd.DataFrame | None, removed: int):
+    """Log one write for the sketches. Called by _aggregate_change, and for SQLite through _sqlite_hook."""
+    if not os.path.exists(SKETCHES_JSON):
+        return  # nothing to keep up to date; the first read builds the sketches
+    entry = {"source": source, "before": before, "after": after, "removed": removed}
+    if added is not None and len(added) > SKETCH_DELTA_ROWS:
+        entry["sketch"] = sketches.CropSketches().update(added).to_dict()
+    elif added is not None and len(added):
+        entry["rows"] = _sketch_rows(added)
+    line = json.dumps(entry) + "\n"
+    with file_lock(SKETCHES_JSON):
+        with open(SKETCH_DELTAS, "a", encoding="utf-8") as f:
+            f.write(line)
+        if _deltas_due(SKETCH_DELTAS, SKETCHES_JSON, SKETCH_FOLD_MIN_BYTES):
+            _fold_sketch_deltas()
+
+def _sqlite_hook(table: str):
+    """The on_change callback for a sqlite_backend write to `table`, or None if nothing tracks it."""
+    if table != "farmer_crops":
+        return None
+    return lambda before, after, added, removed: _sketch_change("sqlite", before, after, added, removed)
+
+def _replay_sketches(data: dict, entries: list) -> sketches.CropSketches:
+    """The snapshot's sketches with the matching log entries applied; data["sources"] is moved along."""
+    current = sketches.CropSketches.from_dict(data["sketches"])
+    rows = []
+
+    def apply(_, entry):
+        current.forget(entry["removed"])
+        if "sketch" in entry:
+            current.merge(sketches.CropSketches.from_dict(entry["sketch"]))
+        rows.extend(entry.get("rows", ()))
+
+    _replay(data, entries, apply)
+    if rows:  # one update for every logged row: most entries carry one or two
+        current.update(pd.DataFrame(rows, columns=sketches.CropSketches.COLUMNS))
+    return current
+
+def _fold_sketch_deltas(data: dict | None = None) -> sketches.CropSketches | None:
+    """Replay the sketch log into the saved sketches (or into `data`, saved instead) and empty it. Hold the lock."""
+    data = data if data is not None else _read_sketches()
+    current = None
+    if data is not None:
+        current = _replay_sketches(data, _read_deltas(SKETCH_DELTAS))
+        data["sketches"] = current.to_dict()
+        _write_sketches(data)
+    if os.path.exists(SKETCH_DELTAS):
+        os.remove(SKETCH_DELTAS)
+    return current
+
+def rebuild_sketches() -> sketches.CropSketches:
+    """Rebuild the farmer_crops sketches with one streamed scan and save them."""
+    ensure_data_files()
+    for _ in range(3):
+        sources = _sketch_sources()
+        built = sketches.CropSketches()
+        for chunk in iter_crops(columns=sketches.CropSketches.COLUMNS):
+            built.update(chunk)
+        if _sketch_sources() == sources:
+            break
+    else:
+        sources = None  # writes kept landing mid-scan; use the result but don't save it
+    if sources is not None:
+        with file_lock(SKETCHES_JSON):
+            # writes that landed after the scan still apply
+            built = _fold_sketch_deltas({"sources": sources, "sketches": built.to_dict()})
+    return built
+
+def crop_sketches() -> sketches.CropSketches:
+    """The farmer_crops sketches, read from SKETCHES_JSON and its log unless they are out of date or too stale."""
+    ensure_data_files()
+    if _deltas_due(SKETCH_DELTAS, SKETCHES_JSON, SKETCH_FOLD_MIN_BYTES):
+        with file_lock(SKETCHES_JSON):
+            if _deltas_due(SKETCH_DELTAS, SKETCHES_JSON, SKETCH_FOLD_MIN_BYTES):
+                _fold_sketch_deltas()
+    data = _read_sketches()
+    if data is not None:
+        stored = _replay_sketches(data, _read_deltas(SKETCH_DELTAS))  # no lock needed, as for the aggregates
+        if data["sources"] == _sketch_sources() and stored.stale <= SKETCH_MAX_STALE * stored.rows:
+            return stored
+    return rebuild_sketches()
+
+# ----------------- Price Recompute -----------------
+# When a crop's Profit Per Acre changes, the farmer_crops rows for that crop (in
+# any case; older rows were stored as typed) get the new price and Estimated
+# Profit = Field Size (acres) * price. Each CSV log keeps a lower-cased crop ->
+# live row positions index (rebuilt only when the log changes on
+# disk), so only the affected rows are read; their new versions are appended and
+# the old ones tombstoned, like any other farmer_crops update.
+
+_crop_indexes = {}
+
+def _crop_positions(path: str) -> dict:
+    """Lower-cased Crop Name -> positions of its live rows in one log. Hold the log's lock while calling."""
+    signature = _log_signature(path)
+    index = _crop_indexes.get(path)
+    if index is None or index["signature"] != signature:
+        live = _load_log(path)
+        groups = live.groupby(_crop_keys(live["Crop Name"]), sort=False).indices
+        index = _crop_indexes[path] = {"signature": signature,
+                                       "positions": {crop: live.index[rows] for crop, rows in groups.items()}}
+    return index["positions"]
+
+def _crop_keys(names: pd.Series) -> pd.Series:
+    return names.astype(object).where(names.notna(), "").astype(str).str.strip().str.lower()
+
+def _reprice_log(path: str, prices: dict) -> int:
+    """Reprice one log's rows for the crops in `prices`. Returns the number of rows rewritten."""
+    columns = TABLES["farmer_crops"][1]
+    with file_lock(path):
+        if not os.path.exists(path):
+            return 0
+        by_crop = _crop_positions(path)
+        targets = [(crop, by_crop[crop]) for crop in prices if crop in by_crop]
+        if not targets:
+            return 0
+        old_positions = np.concatenate([positions for _, positions in targets])
+        old = _cached_frame(path, _read_typed).loc[old_positions, columns]
+        rows = old.copy()
+        price = _crop_keys(rows["Crop Name"]).map(prices).astype("float64")
+        rows["Profit Per Acre"] = price
+        rows["Estimated Profit"] = rows["Field Size (acres)"] * price
+
+        record_positions = _record_positions(path)
+        first = _record_indexes[path]["rows"]
+        before = _aggregate_signature(path)
+        _write_lines(path, rows)
+        _append_tombstones(path, old_positions)
+
+        offset = first
+        for crop, positions in targets:
+            by_crop[crop] = pd.RangeIndex(offset, offset + len(positions))
+            offset += len(positions)
+        record_positions.update(zip(rows["record_id"].tolist(), range(first, first + len(rows))))
+        _record_indexes[path]["rows"] = first + len(rows)
+        _record_indexes[path]["signature"] = _crop_indexes[path]["signature"] = _log_signature(path)
+        _aggregate_change(path, before, added=rows, removed=old)
+    _maybe_compact(path, len(record_positions))
+    return len(rows)
+
+def reprice_crops(prices: dict) -> int:
+    """Apply new per-acre prices ({crop name: Profit Per Acre}) to the stored farmer_crops rows in one pass.
+
+    Crop names match in any case. Returns the number of rows updated.
+    """
+    prices = {str(crop).strip().lower(): float(price) for crop, price in prices.items()}
+    if not prices:
+        return 0
+    if use_sqlite():
+        ensure_data_files()
+        return sqlite_backend.set_rates(SQLITE_DB, "farmer_crops", "Crop Name", "Profit Per Acre",
+                                        "Field Size (acres)", "Estimated Profit", prices,
+                                        on_change=_sqlite_hook("farmer_crops"))
+    if use_parquet():
+        with _parquet_lock("farmer_crops"):
+            df = load_table("farmer_crops")
+            keys = _crop_keys(df["Crop Name"])
+            mask = keys.isin(list(prices))
+            if mask.any():
+                before, old = _aggregate_signature(None), df[mask].copy()
+                price = keys[mask].map(prices).astype("float64")
+                df.loc[mask, "Profit Per Acre"] = price
+                df.loc[mask, "Estimated Profit"] = df.loc[mask, "Field Size (acres)"] * price
+                parquet_backend.replace_table(PARQUET_DIR, "farmer_crops", df, TABLES["farmer_crops"][1],
+                                              SCHEMAS["farmer_crops"])
+                _aggregate_change(None, before, added=df[mask], removed=old)
+        return int(mask.sum())
+    ensure_data_files()
+    return sum(_reprice_log(path, prices) for path in _crop_logs())
+
+def reprice_crops_in_background(prices: dict) -> threading.Thread:
+    """Run reprice_crops() on a worker thread. It is not a daemon, so the process waits for it on exit."""
+    worker = threading.Thread(target=reprice_crops, args=(dict(prices),), name="farmer-crops-reprice")
+    worker.start()
+    return worker
+
+# ----------------- Migration -----------------
+
+def migrate_csv_to_sqlite() -> dict:
+    """Copy every CSV table into SQLITE_DB, replacing whatever is there. Returns row counts per table."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    compact_crops()
+    counts = sqlite_backend.migrate_from_csv(SQLITE_DB, TABLES)
+    if _has_partitions():
+        crops = _scan_partitions()
+        sqlite_backend.replace_table(SQLITE_DB, "farmer_crops", crops, TABLES["farmer_crops"][1])
+        counts["farmer_crops"] = len(crops)
+    if os.path.exists(SEQUENCES_JSON):
+        with open(SEQUENCES_JSON, "r", encoding="utf-8") as f:
+            sqlite_backend.set_sequences(SQLITE_DB, json.load(f))
+    return counts
+
+def migrate_csv_to_parquet() -> dict:
+    """Convert every CSV table into PARQUET_DIR, replacing whatever is there. Returns row counts per table."""
+    if parquet_backend is None:
+        raise RuntimeError("the parquet backend needs pyarrow: pip install pyarrow")
+    counts = {}
+    for table, (_, columns) in TABLES.items():
+        df = _load_csv_table(table)
+        with _parquet_lock(table):
+            parquet_backend.replace_table(PARQUET_DIR, table, df, columns, SCHEMAS.get(table, {}))
+        counts[table] = len(df)
+    return counts
+
+def export_parquet_to_csv() -> dict:
+    """Write every parquet table back out to its CSV so the data can be inspected. Returns row counts per table."""
+    if parquet_backend is None:
+        raise RuntimeError("the parquet backend needs pyarrow: pip install pyarrow")
+    os.makedirs(DATA_DIR, exist_ok=True)
+    counts = {}
+    for table, (_, columns) in TABLES.items():
+        df = parquet_backend.read_table(PARQUET_DIR, table, columns, SCHEMAS.get(table, {}))
+        _save_csv_table(table, df)
+        counts[table] = len(df)
+    return counts
+
+# ----------------- ID Sequences -----------------
+# Each sequence remembers the last ID handed out, so allocating never loads the table.
+# A sequence is seeded once from the current max of its column the first time it is used.
+
+SEQUENCES = {"user_id": "users", "farmer_id": "farmers", "record_id": "farmer_crops"}
+
+def _seed_sequence(name: str) -> int:
+    df = load_table(SEQUENCES[name], columns=[name])
+    ids = pd.to_numeric(df[name], errors="coerce") if name in df.columns else pd.Series(dtype=float)
+    return int(ids.max()) if ids.notna().any() else 0
+
+def allocate_ids(name: str, count: int = 1) -> int:
+    """Reserve `count` consecutive IDs from sequence `name` and return the first one."""
+    if count < 1:
+        raise ValueError("count must be at least 1")
+    if use_sqlite():
+        ensure_data_files()
+        return sqlite_backend.allocate_ids(SQLITE_DB, name, count, lambda: _seed_sequence(name))
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with file_lock(SEQUENCES_JSON):
+        sequences = {}
+        if os.path.exists(SEQUENCES_JSON):
+            with open(SEQUENCES_JSON, "r", encoding="utf-8") as f:
+                sequences = json.load(f)
+        last = sequences[name] if name in sequences else _seed_sequence(name)
+        sequences[name] = last + count
+        tmp_path = SEQUENCES_JSON + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sequences, f, indent=2)
+        os.replace(tmp_path, SEQUENCES_JSON)
+    return last + 1
+
+def allocate_id(name: str) -> int:
+    return allocate_ids(name, 1)
 
 # ----------------- Utility -----------------
 
 def next_id(df: pd.DataFrame, col_name: str) -> int:
-    """Get the next integer ID for a column. Returns 1 if empty."""
+    """Get the next integer ID for a column. Returns 1 if empty.
+
+    Scans the whole column and can reuse IDs after deletes; new code should use allocate_id().
+    """
     if df.empty:
         return 1
     try:
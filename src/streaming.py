@@ -0,0 +1,198 @@
+import os
+import sys
+import threading
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # only needed for .xlsx exports
+    Workbook = None
+
+# ----------------- Streaming Aggregation -----------------
+# Reports that fold a stream of DataFrame chunks (see storage.iter_crops) into
+# running results, so memory depends on the chunk size and the number of groups,
+# never on the number of rows. Every aggregator takes a chunk with update() and
+# another aggregator of the same kind with merge(), so partial results computed
+# over different chunks (or processes) combine into the same answer.
+
+# Excel's sheet limit, less the header row.
+XLSX_MAX_ROWS = 1_048_575
+
+
+class Aggregator:
+    """Running `how` ("sum", "min", "max") of `column`, overall or per group of the `by` columns."""
+
+    how = "sum"
+
+    def __init__(self, column: str | None = None, by=None):
+        self.column = column
+        self.by = [by] if isinstance(by, str) else list(by or [])
+        self.state = None
+
+    def _partial(self, chunk: pd.DataFrame):
+        if self.by:
+            return chunk.groupby(self.by, observed=True, dropna=False)[self.column].agg(self.how)
+        return chunk[self.column].agg(self.how)
+
+    def _combine(self, part):
+        if part is None:
+            return
+        if self.state is None:
+            self.state = part
+        elif self.by:
+            both = pd.concat([self.state, part])
+            self.state = both.groupby(level=list(range(len(self.by))), dropna=False).agg(self.how)
+        else:
+            self.state = pd.Series([self.state, part]).agg(self.how)
+
+    def update(self, chunk: pd.DataFrame) -> "Aggregator":
+        if len(chunk):
+            self._combine(self._partial(chunk))
+        return self
+
+    def merge(self, other: "Aggregator") -> "Aggregator":
+        self._combine(other.state)
+        return self
+
+    def result(self):
+        """A scalar, or a Series indexed by the group keys (empty if no rows were seen)."""
+        if self.state is None:
+            return pd.Series(dtype="float64") if self.by else (0 if self.how == "sum" else float("nan"))
+        return self.state
+
+
+class Sum(Aggregator):
+    how = "sum"
+
+
+class Min(Aggregator):
+    how = "min"
+
+
+class Max(Aggregator):
+    how = "max"
+
+
+class Count(Aggregator):
+    """Rows seen (or non-missing values of `column`), overall or per group."""
+
+    how = "sum"
+
+    def _partial(self, chunk: pd.DataFrame):
+        if self.by:
+            groups = chunk.groupby(self.by, observed=True, dropna=False)
+            return groups.size() if self.column is None else groups[self.column].count()
+        return len(chunk) if self.column is None else int(chunk[self.column].count())
+
+
+class Mean(Aggregator):
+    """Running mean of `column`, kept as a sum and a count so partial means combine exactly."""
+
+    def __init__(self, column: str, by=None):
+        super().__init__(column, by)
+        self.sum, self.count = Sum(column, by), Count(column, by)
+
+    def update(self, chunk: pd.DataFrame) -> "Mean":
+        self.sum.update(chunk)
+        self.count.update(chunk)
+        return self
+
+    def merge(self, other: "Mean") -> "Mean":
+        self.sum.merge(other.sum)
+        self.count.merge(other.count)
+        return self
+
+    def result(self):
+        total, count = self.sum.result(), self.count.result()
+        if self.by:
+            return total / count
+        return total / count if count else float("nan")
+
+
+class TopK(Aggregator):
+    """The `k` rows with the largest `column`, keeping only `columns` of them."""
+
+    def __init__(self, k: int, column: str, columns: list | None = None):
+        super().__init__(column)
+        self.k, self.columns = k, columns
+
+    def _partial(self, chunk: pd.DataFrame):
+        top = chunk.nlargest(self.k, self.column)
+        return top if self.columns is None else top[self.columns]
+
+    def _combine(self, part):
+        if part is None:
+            return
+        both = part if self.state is None else pd.concat([self.state, part], ignore_index=True)
+        self.state = both.nlargest(self.k, self.column).reset_index(drop=True)
+
+    def result(self) -> pd.DataFrame:
+        return pd.DataFrame(columns=self.columns) if self.state is None else self.state
+
+
+def fold(chunks, aggregators: dict) -> dict:
+    """Feed every chunk to every aggregator ({name: Aggregator}); returns {name: result}."""
+    for chunk in chunks:
+        for aggregator in aggregators.values():
+            aggregator.update(chunk)
+    return {name: aggregator.result() for name, aggregator in aggregators.items()}
+
+
+# ----------------- Streaming Export -----------------
+
+def _write_xlsx(chunks, path: str) -> int:
+    if Workbook is None:
+        raise RuntimeError("Excel export needs openpyxl (pip install openpyxl); export as .csv instead.")
+    book = Workbook(write_only=True)
+    sheet = book.create_sheet()
+    rows, started = 0, False
+    for chunk in chunks:
+        if not started:
+            sheet.append(list(chunk.columns))
+            started = True
+        rows += len(chunk)
+        if rows > XLSX_MAX_ROWS:
+            raise RuntimeError(f"More than {XLSX_MAX_ROWS:,} rows don't fit in an Excel sheet; export as .csv instead.")
+        for row in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False):
+            sheet.append(list(row))
+    book.save(path)
+    return rows
+
+
+def write_chunks(chunks, path: str) -> int:
+    """Write a stream of chunks to a .csv or .xlsx file, one chunk in memory at a time. Returns the row count.
+
+    The file is written aside and renamed into place, so a failed export leaves no partial file.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if path.lower().endswith(".xlsx"):
+            rows = _write_xlsx(chunks, tmp_path)
+        else:
+            rows, started = 0, False
+            for chunk in chunks:
+                chunk.to_csv(tmp_path, mode="a" if started else "w", header=not started, index=False)
+                rows, started = rows + len(chunk), True
+            if not started:
+                open(tmp_path, "w").close()
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows
+
+
+# ----------------- Memory Reporting -----------------
+
+def peak_rss_mb() -> float | None:
+    """This process's peak resident memory so far in MB, or None where the platform doesn't report it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KB on Linux
@@ -0,0 +1,173 @@
+"""Storage tests. Each one runs on a copy of src/ and data/ in a temp directory, so the repo's data is untouched."""
+
+import importlib
+import os
+import shutil
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_MODULES = [name[:-3] for name in os.listdir(os.path.join(ROOT, "src")) if name.endswith(".py")]
+
+
+def _crop_row(username, crop="Rice", acres=2.0, price=10.0):
+    return {"username": username, "Crop Name": crop, "Field Size (acres)": acres,
+            "Profit Per Acre": price, "Estimated Profit": acres * price}
+
+
+def _open_storage(tmp_path, monkeypatch, backend):
+    """Import storage from a copy of the tree, so DATA_DIR points at a copy of the data."""
+    if backend == "parquet":
+        pytest.importorskip("pyarrow")
+    shutil.copytree(os.path.join(ROOT, "src"), tmp_path / "src", ignore=shutil.ignore_patterns("__pycache__"))
+    shutil.copytree(os.path.join(ROOT, "data"), tmp_path / "data")
+    monkeypatch.setenv("CROP_PORTAL_BACKEND", backend)
+    monkeypatch.syspath_prepend(str(tmp_path / "src"))
+    for name in SRC_MODULES:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    storage = importlib.import_module("storage")
+    if backend == "sqlite":
+        storage.migrate_csv_to_sqlite()
+    elif backend == "parquet":
+        storage.migrate_csv_to_parquet()
+    return storage
+
+
+@pytest.fixture(params=["csv", "sqlite", "parquet"])
+def storage(request, tmp_path, monkeypatch):
+    yield _open_storage(tmp_path, monkeypatch, request.param)
+    for name in SRC_MODULES:
+        sys.modules.pop(name, None)
+
+
+@pytest.fixture
+def csv_storage(tmp_path, monkeypatch):
+    yield _open_storage(tmp_path, monkeypatch, "csv")
+    for name in SRC_MODULES:
+        sys.modules.pop(name, None)
+
+
+# ----------------- Row Ids -----------------
+
+def test_concurrent_inserts_get_unique_record_ids(storage):
+    before = set(storage.load_crops()["record_id"].tolist())
+    errors = []
+
+    def insert(worker):
+        try:
+            for i in range(10):
+                storage.insert_rows("farmer_crops", [_crop_row(f"t{worker}_{i}"), _crop_row(f"t{worker}_{i}", "Wheat")])
+        except Exception as e:  # surfaced below; an exception in a thread would otherwise be lost
+            errors.append(e)
+
+    threads = [threading.Thread(target=insert, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    ids = storage.load_crops()["record_id"]
+    assert ids.is_unique
+    assert len(set(ids.tolist()) - before) == 4 * 10 * 2
+
+
+# ----------------- Tombstones -----------------
+
+def test_compact_keeps_surviving_rows(csv_storage):
+    storage = csv_storage
+    storage.insert_rows("farmer_crops", [_crop_row(f"c{i}", acres=1.0 + i) for i in range(6)])
+    crops = storage.load_crops()
+    doomed = crops["record_id"].iloc[[0, -1, -3]].tolist()
+    for record_id in doomed:
+        assert storage.delete_crop_record(record_id)
+    expected = crops[~crops["record_id"].isin(doomed)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(storage.load_crops().reset_index(drop=True), expected, check_categorical=False)
+
+    assert storage.compact_crops() == len(doomed)
+    pd.testing.assert_frame_equal(storage.load_crops().reset_index(drop=True), expected, check_categorical=False)
+    assert storage.compact_crops() == 0
+
+
+# ----------------- Concurrent Edits -----------------
+
+def test_merge_keeps_concurrent_edits_to_different_cells(csv_storage):
+    storage = csv_storage
+    mine, theirs = storage.load_crop_profit(), storage.load_crop_profit()
+    first, second, third = mine["Crop Name"].iloc[:3].tolist()
+
+    theirs.loc[theirs["Crop Name"] == second, "Profit Per Acre"] = 999.0
+    storage.save_crop_profit(theirs)
+
+    version = mine.attrs["version"]
+    mine["Profit Per Acre"] = mine["Profit Per Acre"].astype(object)
+    mine.loc[mine["Crop Name"] == first, "Profit Per Acre"] = 123  # an int where the file holds floats
+    mine = mine[mine["Crop Name"] != third]
+    mine = pd.concat([mine, pd.DataFrame([{"Crop Name": "Zzz", "Profit Per Acre": None, "Season": "Rabi"}])],
+                     ignore_index=True)
+    mine.attrs["version"] = version
+    storage.save_crop_profit(mine)
+
+    saved = storage.load_crop_profit().set_index("Crop Name")
+    assert saved.loc[first, "Profit Per Acre"] == 123.0
+    assert saved.loc[second, "Profit Per Acre"] == 999.0
+    assert third not in saved.index
+    assert pd.isna(saved.loc["Zzz", "Profit Per Acre"])
+    assert len(saved) == len(theirs)
+
+
+def test_save_raises_write_conflict_once_the_base_is_forgotten(csv_storage):
+    storage = csv_storage
+    mine = storage.load_crop_profit()
+    for price in range(storage.VERSION_HISTORY + 1):
+        theirs = storage.load_crop_profit()
+        theirs.loc[0, "Profit Per Acre"] = float(price)
+        storage.save_crop_profit(theirs)
+    mine.loc[1, "Profit Per Acre"] = 2.0
+    with pytest.raises(storage.WriteConflictError):
+        storage.save_crop_profit(mine)
+
+
+# ----------------- Aggregates and Sketches -----------------
+
+def _change_crops(storage):
+    storage.insert_rows("farmer_crops", [_crop_row("aa"), _crop_row("bb", "Wheat"), _crop_row("aa", "Maize", 3.0)])
+    storage.insert_rows("farmer_crops", [_crop_row(f"bulk{i}", acres=1.0 + i) for i in range(50)])
+    crops = storage.load_crops()
+    storage.update_crop_record(crops["record_id"].iloc[-1], {"Field Size (acres)": 7.0, "Estimated Profit": 70.0})
+    storage.delete_crop_record(crops["record_id"].iloc[0])
+    storage.reprice_crops({"Rice": 55.0})
+    storage.delete_rows("farmer_crops", "username", "bb")
+    storage.update_rows("farmer_crops", "username", "aa", {"Profit Per Acre": 1.0})
+
+
+def test_crop_totals_match_rebuild(storage):
+    storage.farmer_crop_totals()
+    _change_crops(storage)
+    stored = storage.farmer_crop_totals()
+    storage.rebuild_aggregates()
+    fresh = storage.farmer_crop_totals()
+    for part in ("farmers", "crops"):
+        pd.testing.assert_frame_equal(stored[part], fresh[part])
+    assert stored["portal"] == pytest.approx(fresh["portal"])
+
+
+def test_crop_sketches_match_rebuild(storage, monkeypatch):
+    monkeypatch.setattr(storage, "SKETCH_MAX_STALE", 1.0)  # keep stale sketches so they can be compared
+    storage.crop_sketches()
+    storage.insert_rows("farmer_crops", [_crop_row(f"s{i}", "Maize", 1.0 + i) for i in range(40)])
+    stored, fresh = storage.crop_sketches(), storage.rebuild_sketches()
+    assert (stored.rows, stored.stale) == (fresh.rows, 0)
+    np.testing.assert_array_equal(stored.farmers.registers, fresh.farmers.registers)
+    assert stored.farmers_by_crop.keys() == fresh.farmers_by_crop.keys()
+    for name, sketch in fresh.farmers_by_crop.items():
+        np.testing.assert_array_equal(stored.farmers_by_crop[name].registers, sketch.registers)
+    assert stored.profit.n == fresh.profit.n
+
+    _change_crops(storage)
+    stored, fresh = storage.crop_sketches(), storage.rebuild_sketches()
+    assert stored.rows - stored.stale == fresh.rows  # removed rows are counted as stale, not taken out
+    assert (stored.farmers.registers >= fresh.farmers.registers).all()